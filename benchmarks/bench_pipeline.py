@@ -0,0 +1,249 @@
+# Run from the repository root:
+#   python -m benchmarks.bench_pipeline --sizes 10k 1m --update-baseline
+#   python -m benchmarks.bench_pipeline --sizes 10k 1m  # exits 1 on a regression
+import argparse
+import gc
+import json
+import logging
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(".")
+from utils.utils import SQLiteDB
+from src.raw_processed_db import columns_we_trust, preprocess_data, feature_engineering
+from src.knn_data_v1 import categorize_and_append_all, dropper, target
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), "baseline.json")
+SIZES = {"10k": 10_000, "1m": 1_000_000, "10m": 10_000_000}
+BAR_SECONDS = 900
+# A step is a regression when it is this much slower (or hungrier) than the baseline
+TOLERANCE = 0.25
+TABLE_NAME = "BTC_data"
+
+# Half widths of the Bollinger bands, as a fraction of the basis
+BAND_WIDTHS = {"b1": 0.004, "b2": 0.008, "b3": 0.012}
+
+
+def make_synthetic_bars(n_rows, seed=0, start="2020-01-01"):
+    """
+    Generates a raw export of 15m BTC bars with every column of columns_we_trust.
+
+    Prices follow a seeded random walk and the indicators are cheap stand-ins with
+    realistic ranges, so the same n_rows and seed always give the same frame.
+
+    Parameters:
+        n_rows (int): Number of bars.
+        seed (int): Random seed.
+        start (str): Time of the first bar.
+
+    Returns:
+        pd.DataFrame: Raw bars with 'time' in epoch seconds, like the TradingView export.
+    """
+    rng = np.random.default_rng(seed)
+    first = int(pd.Timestamp(start).timestamp())
+    close = 20000 * np.exp(np.cumsum(rng.normal(0, 0.002, n_rows)))
+    open_ = np.r_[close[0], close[:-1]]
+    spread = np.abs(rng.normal(0, 0.0015, n_rows)) * close
+    high = np.maximum(open_, close) + spread
+    low = np.minimum(open_, close) - spread
+    volume = rng.gamma(2.0, 700.0, n_rows)
+    basis = pd.Series(close).rolling(20, min_periods=1).mean().to_numpy()
+
+    data = {
+        "time": first + BAR_SECONDS * np.arange(n_rows, dtype=np.int64),
+        "open": open_,
+        "high": high,
+        "low": low,
+        "close": close,
+        "vwap": (high + low + close) / 3,
+        "basis": basis,
+        "upper": basis * 1.01,
+        "lower": basis * 0.99,
+        "parabolicsar": np.where(rng.random(n_rows) < 0.5, low, high) * 0.995,
+        "twap": (open_ + close) / 2,
+        "volume": volume,
+        "volume_ma": pd.Series(volume).rolling(20, min_periods=1).mean().to_numpy(),
+        "adx": rng.uniform(10, 50, n_rows),
+        "efi": rng.normal(0, 20000, n_rows),
+        "atr": spread * 2,
+        "obv": np.cumsum(np.sign(close - open_) * volume),
+        "roc": rng.normal(0, 0.5, n_rows),
+        "cci": rng.normal(0, 100, n_rows),
+    }
+    for band, width in BAND_WIDTHS.items():
+        data[f"upper_{band}"] = basis * (1 + width)
+        data[f"lower_{band}"] = basis * (1 - width)
+    return pd.DataFrame(
+        {col: data[col] for col in columns_we_trust if col in data}, copy=False
+    )
+
+
+def _write_sqlite(df, db_path):
+    with SQLiteDB(db_path) as db:
+        db.create_table(df, TABLE_NAME)
+    return df
+
+
+def _read_sqlite(db_path):
+    with SQLiteDB(db_path) as db:
+        return db.select(TABLE_NAME)
+
+
+def _measure(func, arg, repeats, track_memory):
+    """Best wall time of func(copy of arg) over the repeats, and its peak memory."""
+    best = float("inf")
+    for _ in range(repeats):
+        data = arg.copy() if isinstance(arg, pd.DataFrame) else arg
+        gc.collect()
+        start = time.perf_counter()
+        result = func(data)
+        best = min(best, time.perf_counter() - start)
+    peak_mb = None
+    if track_memory:
+        data = arg.copy() if isinstance(arg, pd.DataFrame) else arg
+        gc.collect()
+        tracemalloc.start()
+        func(data)
+        peak_mb = tracemalloc.get_traced_memory()[1] / 2**20
+        tracemalloc.stop()
+    return result, best, peak_mb
+
+
+def run_benchmarks(sizes=("10k",), repeats=3, track_memory=True, seed=0):
+    """
+    Times every pipeline step on synthetic data of each size.
+
+    The steps are chained like in the real pipeline: the raw bars are preprocessed,
+    stored in and read back from SQLite, then turned into the KNN features.
+
+    Parameters:
+        sizes (tuple): Keys of SIZES.
+        repeats (int): Runs per step, the best time is kept.
+        track_memory (bool): Also measure each step's peak allocation with tracemalloc.
+        seed (int): Random seed of the synthetic data.
+
+    Returns:
+        dict: '<size>:<step>' -> {'seconds': float, 'peak_mb': float or None, 'rows': int}
+    """
+    results = {}
+    for size in sizes:
+        n_rows = SIZES[size]
+        logging.info(f"Generating {n_rows} synthetic bars.")
+        df = make_synthetic_bars(n_rows, seed=seed)
+        with tempfile.TemporaryDirectory() as tmp:
+            db_path = os.path.join(tmp, "bench.db")
+            steps = [
+                (
+                    "preprocess_data",
+                    lambda d: preprocess_data(d, columns_to_keep=columns_we_trust),
+                ),
+                ("feature_engineering", feature_engineering),
+                ("sqlite_write", lambda d: _write_sqlite(d, db_path)),
+                ("sqlite_read", lambda _: _read_sqlite(db_path)),
+                ("categorize_and_append_all", categorize_and_append_all),
+                ("dropper", dropper),
+                ("target", target),
+            ]
+            for name, func in steps:
+                df, seconds, peak_mb = _measure(func, df, repeats, track_memory)
+                results[f"{size}:{name}"] = {
+                    "seconds": seconds,
+                    "peak_mb": peak_mb,
+                    "rows": len(df),
+                }
+                logging.info(f"{size} {name}: {seconds:.4f}s, peak {peak_mb} MB")
+    return results
+
+
+def compare_to_baseline(results, baseline, tolerance=TOLERANCE):
+    """
+    Lists the steps that got slower or use more memory than the baseline allows.
+
+    Parameters:
+        results (dict): Output of run_benchmarks.
+        baseline (dict): A stored baseline, see save_baseline.
+        tolerance (float): Allowed relative increase.
+
+    Returns:
+        list: (key, metric, baseline value, new value) of every regression.
+    """
+    regressions = []
+    for key, result in results.items():
+        reference = baseline.get("results", {}).get(key)
+        if reference is None:
+            continue
+        for metric in ("seconds", "peak_mb"):
+            old, new = reference.get(metric), result.get(metric)
+            if old and new is not None and new > old * (1 + tolerance):
+                regressions.append((key, metric, old, new))
+    return regressions
+
+
+def load_baseline(path=BASELINE_PATH):
+    try:
+        with open(path) as baseline_file:
+            return json.load(baseline_file)
+    except FileNotFoundError:
+        return None
+
+
+def save_baseline(results, path=BASELINE_PATH):
+    """Stores results, merged into the existing baseline, with the environment."""
+    baseline = load_baseline(path) or {"results": {}}
+    baseline["results"].update(results)
+    baseline["environment"] = {
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "numpy": np.__version__,
+        "machine": platform.machine(),
+        "system": platform.system(),
+    }
+    with open(path, "w") as baseline_file:
+        json.dump(baseline, baseline_file, indent=2, sort_keys=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the data pipeline.")
+    parser.add_argument("--sizes", nargs="+", choices=list(SIZES), default=["10k"])
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--no-memory", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE)
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument(
+        "--update-baseline",
+        action="store_true",
+        help="Store these results as the new baseline instead of comparing.",
+    )
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(args.sizes, args.repeats, not args.no_memory)
+    print(f"{'benchmark':<36}{'seconds':>10}{'peak MB':>10}")
+    for key, result in results.items():
+        peak = "-" if result["peak_mb"] is None else f"{result['peak_mb']:.1f}"
+        print(f"{key:<36}{result['seconds']:>10.4f}{peak:>10}")
+
+    if args.update_baseline:
+        save_baseline(results, args.baseline)
+        print(f"Baseline saved to {args.baseline}")
+        return 0
+
+    baseline = load_baseline(args.baseline)
+    if baseline is None:
+        print("No baseline stored yet, run with --update-baseline to create one.")
+        return 0
+    regressions = compare_to_baseline(results, baseline, args.tolerance)
+    for key, metric, old, new in regressions:
+        print(f"REGRESSION {key} {metric}: {old:.4f} -> {new:.4f}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(main())
@@ -1,37 +1,356 @@
 import sys
 import logging
-import threading
-import time
+import argparse
+import os
+import importlib
+import functools
 
 # Append 'src' and 'utils' directories to PYTHONPATH
 sys.path.append("./src")
 sys.path.append("./utils")
 
-from src.raw_processed_db import run_raw_processing
-from src.knn_data_v1 import main_logic
-from src.scraper_liq import run_scraper_liq
+# Same as src.partitions.UNIVERSE_FILE, kept here so checking for it imports nothing
+UNIVERSE_FILE = "universe.json"
 
-# Initialize logging
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s - %(levelname)s - %(message)s",
-    filename="project.log",
-)  # Log to a file
+# Command -> (module, function). Modules are only imported when their command runs,
+# so e.g. ingesting bars never loads Selenium.
+COMMANDS = {
+    "ingest": ("src.raw_processed_db", "run_raw_processing"),
+    "features": ("src.knn_data_v1", "main_logic"),
+    "universe": ("src.partitions", "run_universe"),
+    "scrape": ("src.scraper_liq", "run_scraper_liq"),
+    "labels": ("src.targets", "update_labels"),
+    "train": ("src.knn_model", "train_model"),
+    "backtest": ("src.knn_model", "backtest"),
+    "export": ("src.matrix_export", "export_matrices"),
+    "retention": ("src.retention", "run_retention"),
+}
+
+# Streamlit apps `serve` can start
+APPS = {
+    "liquidations": "src/stream.py",
+    "coinglass": "src/stream3.py",
+}
+
+
+def load_command(name):
+    """
+    Imports the function behind a command.
+
+    Parameters:
+        name (str): A key of COMMANDS.
+
+    Returns:
+        callable: The command's function.
+    """
+    module_name, function_name = COMMANDS[name]
+    return getattr(importlib.import_module(module_name), function_name)
+
+
+def print_import_report(names):
+    """Prints how long importing each command's module takes on a cold start."""
+    from utils.instrumentation import import_report
+
+    for name in names:
+        module_name = COMMANDS[name][0]
+        packages = import_report(module_name, top=8)
+        print(f"{name} ({module_name}): {packages[0][1]:.3f}s")
+        for package, seconds in packages[1:]:
+            print(f"    {package:<24}{seconds:.3f}s")
 
 
 def main():
     logging.info("Main function started.")
-    logging.info("Starting preprocessing")
-    run_raw_processing()
-    logging.info("Preprocessing COMPLETED")
-    logging.info("Starting KNN data preparacion")
-    main_logic()
-    logging.info("KNN data is ready for training")
+    if os.path.exists(UNIVERSE_FILE):
+        logging.info("Refreshing every partition of the universe")
+        load_command("universe")()
+        logging.info("Universe refresh COMPLETED")
+    else:
+        logging.info("Starting preprocessing")
+        load_command("ingest")()
+        logging.info("Preprocessing COMPLETED")
+        logging.info("Starting KNN data preparacion")
+        load_command("features")()
+        logging.info("KNN data is ready for training")
     logging.info("Getting ready to scrape")
-    run_scraper_liq()
+    load_command("scrape")()
     logging.info("Scraping completed, getting ready to deploy")
-    
 
 
-if __name__ == "__main__":
+def partition_keys(args):
+    """
+    Partitions selected on the command line, or None for a single-database run.
+
+    --symbol/--exchange/--timeframe select partitions (each may be repeated), and
+    --universe selects every partition of a universe file.
+    """
+    if not (args.symbol or args.universe):
+        return None
+    from src.partitions import PartitionKey, load_universe
+
+    if args.universe:
+        return load_universe(args.universe)
+    return [
+        PartitionKey(symbol.upper(), exchange.upper(), timeframe)
+        for symbol in args.symbol
+        for exchange in args.exchange
+        for timeframe in args.timeframe
+    ]
+
+
+def run_partitioned(args, task_name, **options):
+    """Runs a partition task over the selected partitions in a process pool."""
+    partitions = importlib.import_module("src.partitions")
+    task = functools.partial(getattr(partitions, task_name), **options)
+    results = partitions.run_universe(partition_keys(args), args.workers, task)
+    for key, rows in results.items():
+        print(f"{key.name}: {rows if rows is not None else 'FAILED'}")
+    return 0 if all(rows is not None for rows in results.values()) else 1
+
+
+def cmd_ingest(args):
+    if partition_keys(args) is not None:
+        return run_partitioned(args, "ingest_partition", gap_policy=args.gap_policy)
+    bars = load_command("ingest")(args.input, args.db, args.table, args.gap_policy)
+    return 0 if bars is not None else 1
+
+
+def cmd_features(args):
+    if partition_keys(args) is not None:
+        return run_partitioned(args, "features_partition")
+    features = load_command("features")(
+        args.db, args.source_table, args.table, args.workers
+    )
+    return 0 if features is not None else 1
+
+
+def cmd_labels(args):
+    rows = load_command("labels")(args.db, args.table, args.horizons, args.threshold)
+    print(f"{rows} labels written")
+    return 0
+
+
+def cmd_scrape(args):
+    load_command("scrape")(args.db, args.csv)
+    return 0
+
+
+def cmd_export(args):
+    out_dir = load_command("export")(
+        args.db, args.table, args.out, args.horizons, args.force
+    )
+    print(f"Matrices in {out_dir}")
+    return 0
+
+
+def cmd_retention(args):
+    removed = load_command("retention")(
+        args.db, args.tables, force_maintenance=args.vacuum
+    )
+    for table_name, rows in removed.items():
+        print(f"{table_name:<40}{rows}")
+    return 0
+
+
+def cmd_train(args):
+    load_command("train")(
+        args.db, args.table, args.model, args.neighbors, args.matrices
+    )
+    return 0
+
+
+def cmd_backtest(args):
+    results = load_command("backtest")(
+        args.db, args.table, args.splits, args.neighbors, args.fee, args.matrices
+    )
+    for name, value in results.items():
+        print(
+            f"{name:<20}{value:.4f}"
+            if isinstance(value, float)
+            else f"{name:<20}{value}"
+        )
+    return 0
+
+
+def cmd_serve(args):
+    import subprocess
+
+    command = [sys.executable, "-m", "streamlit", "run", APPS[args.app]]
+    command += ["--server.port", str(args.port)]
+    return subprocess.call(command)
+
+
+def cmd_run(args):
     main()
+    return 0
+
+
+def cmd_import_report(args):
+    unknown = set(args.commands) - set(COMMANDS)
+    if unknown:
+        print(f"Unknown commands: {', '.join(sorted(unknown))}")
+        return 2
+    print_import_report(args.commands or list(COMMANDS))
+    return 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        description="BTC data pipeline. Without a command every stage runs, as before."
+    )
+    parser.add_argument(
+        "--profile",
+        nargs="?",
+        const="profiles",
+        metavar="DIR",
+        help="Print stage timings at the end and dump a cProfile of every stage "
+        "to DIR (default: profiles).",
+    )
+    parser.add_argument("--metrics", help="JSON lines file for the stage metrics.")
+    parser.add_argument("--log-file", default="project.log")
+    subparsers = parser.add_subparsers(dest="command")
+
+    # Options shared by the stages that can run over several partitions
+    partitioned = argparse.ArgumentParser(add_help=False)
+    partitioned.add_argument("--symbol", action="append", help="e.g. BTC")
+    partitioned.add_argument("--exchange", action="append", default=None)
+    partitioned.add_argument("--timeframe", action="append", default=None)
+    partitioned.add_argument("--universe", help="JSON file listing the partitions.")
+    partitioned.add_argument(
+        "--workers", type=int, help="Worker processes. Default is the number of cores."
+    )
+
+    ingest = subparsers.add_parser(
+        "ingest", parents=[partitioned], help="Raw export -> bars table."
+    )
+    ingest.add_argument("--input", default="raw_data/BYBIT_BTC_DATA.csv")
+    ingest.add_argument("--db", default="BTC_data.db")
+    ingest.add_argument("--table", default="BTC_data")
+    ingest.add_argument("--gap-policy", choices=["drop", "fill"], default="drop")
+    ingest.set_defaults(func=cmd_ingest)
+
+    features = subparsers.add_parser(
+        "features", parents=[partitioned], help="Bars -> KNN features table."
+    )
+    features.add_argument("--db", default="BTC_data.db")
+    features.add_argument("--source-table", default="BTC_data")
+    features.add_argument("--table", default="KNN_data")
+    features.set_defaults(func=cmd_features)
+
+    labels = subparsers.add_parser(
+        "labels", help="Bars -> forward return, class and excursion labels."
+    )
+    labels.add_argument("--db", default="BTC_data.db")
+    labels.add_argument("--table", default="BTC_data")
+    labels.add_argument(
+        "--horizons", type=int, nargs="+", default=[1, 5, 15, 60], metavar="BARS"
+    )
+    labels.add_argument("--threshold", type=float, default=2.0, help="Percent.")
+    labels.set_defaults(func=cmd_labels)
+
+    scrape = subparsers.add_parser("scrape", help="Scrape the 24h liquidations.")
+    scrape.add_argument("--db", default="BTC_data.db")
+    scrape.add_argument("--csv", default="processed_data/liquidations24h.csv")
+    scrape.set_defaults(func=cmd_scrape)
+
+    export = subparsers.add_parser(
+        "export", help="Features and labels -> memory-mapped .npy matrices."
+    )
+    export.add_argument("--db", default="BTC_data.db")
+    export.add_argument("--table", default="KNN_data")
+    export.add_argument("--out", help="Directory. Default is matrices/<table>.")
+    export.add_argument("--horizons", type=int, nargs="+", metavar="BARS")
+    export.add_argument(
+        "--force", action="store_true", help="Export even if nothing changed."
+    )
+    export.set_defaults(func=cmd_export)
+
+    retention = subparsers.add_parser(
+        "retention", help="Archive cold rows, then ANALYZE/VACUUM when due."
+    )
+    retention.add_argument("--db", default="BTC_data.db")
+    retention.add_argument(
+        "--tables", nargs="+", help="Default is every table with a policy."
+    )
+    retention.add_argument(
+        "--vacuum", action="store_true", help="ANALYZE and VACUUM even if not due."
+    )
+    retention.set_defaults(func=cmd_retention)
+
+    for name, func, help_text in (
+        ("train", cmd_train, "Fit the KNN classifier."),
+        ("backtest", cmd_backtest, "Walk-forward backtest of the KNN classifier."),
+    ):
+        model = subparsers.add_parser(name, help=help_text)
+        model.add_argument("--db", default="BTC_data.db")
+        model.add_argument("--table", default="KNN_data")
+        model.add_argument("--neighbors", type=int, default=15)
+        model.add_argument(
+            "--matrices", help="Read the features from this `export` directory."
+        )
+        model.set_defaults(func=func)
+    subparsers.choices["train"].add_argument("--model", default="knn_model/model.pkl")
+    subparsers.choices["backtest"].add_argument("--splits", type=int, default=5)
+    subparsers.choices["backtest"].add_argument("--fee", type=float, default=0.0)
+
+    serve = subparsers.add_parser("serve", help="Start a Streamlit dashboard.")
+    serve.add_argument("--app", choices=list(APPS), default="liquidations")
+    serve.add_argument("--port", type=int, default=8501)
+    serve.set_defaults(func=cmd_serve)
+
+    run = subparsers.add_parser("run", help="Every stage, like main.py without args.")
+    run.set_defaults(func=cmd_run)
+
+    report = subparsers.add_parser(
+        "import-report", help="Cold import time of each command."
+    )
+    report.add_argument("commands", nargs="*", metavar="command")
+    report.set_defaults(func=cmd_import_report)
+    return parser
+
+
+def dispatch(argv):
+    """
+    Runs the command named in argv, or the whole pipeline without one.
+
+    Usage:
+        python main.py                                   # full pipeline, as before
+        python main.py ingest --input raw.csv --db BTC_data.db
+        python main.py ingest --symbol BTC --symbol ETH --exchange BYBIT \\
+            --timeframe 15m --workers 4
+        python main.py --profile features --universe universe.json
+        python main.py export --table KNN_data && python main.py train \\
+            --matrices matrices/KNN_data
+        python main.py train|backtest|scrape|serve|import-report
+    """
+    args = build_parser().parse_args(argv)
+    if getattr(args, "symbol", None) or getattr(args, "exchange", None):
+        args.symbol = args.symbol or ["BTC"]
+        args.exchange = args.exchange or ["BYBIT"]
+        args.timeframe = args.timeframe or ["15m"]
+
+    # Initialize logging
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s - %(levelname)s - %(message)s",
+        filename=args.log_file,
+    )  # Log to a file
+
+    if args.profile or args.metrics:
+        from utils.instrumentation import configure_metrics
+
+        configure_metrics(jsonl_path=args.metrics, profile_dir=args.profile)
+
+    status = (args.func if args.command else cmd_run)(args)
+
+    if args.profile:
+        from utils.instrumentation import summarize_metrics
+
+        summary = summarize_metrics()
+        if not summary.empty:
+            print(summary.to_string())
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(dispatch(sys.argv[1:]))
@@ -0,0 +1,314 @@
+import json
+import logging
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import closing
+
+import pandas as pd
+import requests
+
+from utils.utils import bump_write_version, get_writer
+
+BASE_URL = "https://open-api.coinglass.com/public/v2/indicator"
+CONFIG_PATH = "src/config.json"
+CHECKPOINT_TABLE = "_backfill_checkpoints"
+PAGE_SIZE = 500
+REQUESTS_PER_SECOND = 2.0
+
+# Coinglass history endpoints: where each row keeps its time, the unit of that time
+# (also used for the paging parameters) and the value columns to store
+ENDPOINTS = {
+    "open_interest_ohlc": {
+        "time_key": "t",
+        "unit": "ms",
+        "columns": ["o", "h", "l", "c"],
+    },
+    "price_ohlc": {"time_key": 0, "unit": "s", "columns": ["o", "h", "l", "c", "v"]},
+    "top_long_short_account_ratio": {
+        "time_key": "createTime",
+        "unit": "ms",
+        "columns": ["longRatio", "shortRatio"],
+    },
+}
+
+
+class RateLimiter:
+    """Spaces out calls from every thread so that at most `rate` happen per second."""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate
+        self.lock = threading.Lock()
+        self.next_slot = time.monotonic()
+
+    def acquire(self):
+        with self.lock:
+            now = time.monotonic()
+            slot = max(self.next_slot, now)
+            self.next_slot = slot + self.interval
+        time.sleep(max(slot - now, 0))
+
+
+def load_api_key(config_path=CONFIG_PATH):
+    with open(config_path) as config_file:
+        return json.load(config_file)["coinglassSecret"]
+
+
+def history_table_name(endpoint):
+    return f"coinglass_{endpoint}"
+
+
+def create_history_tables(conn):
+    """
+    Creates the history tables, deduplicated on (exchange, pair, interval, t), and
+    the checkpoint table.
+
+    Parameters:
+        conn (sqlite3.Connection): Open connection to the database.
+    """
+    for endpoint, spec in ENDPOINTS.items():
+        value_columns = ", ".join(f"{col} REAL" for col in spec["columns"])
+        conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {history_table_name(endpoint)} ("
+            f"exchange TEXT, pair TEXT, interval TEXT, t INTEGER, {value_columns}, "
+            "PRIMARY KEY (exchange, pair, interval, t))"
+        )
+    conn.execute(
+        f"CREATE TABLE IF NOT EXISTS {CHECKPOINT_TABLE} ("
+        "endpoint TEXT, exchange TEXT, pair TEXT, interval TEXT, "
+        "oldest INTEGER, newest INTEGER, done INTEGER DEFAULT 0, "
+        "PRIMARY KEY (endpoint, exchange, pair, interval))"
+    )
+    conn.commit()
+
+
+def parse_rows(endpoint, data):
+    """
+    Normalizes one page of an endpoint's response.
+
+    Parameters:
+        endpoint (str): A key of ENDPOINTS.
+        data (list): The response's 'data' list.
+
+    Returns:
+        list: (t, *values) tuples with t in epoch seconds.
+    """
+    spec = ENDPOINTS[endpoint]
+    divisor = 1000 if spec["unit"] == "ms" else 1
+    rows = []
+    for item in data:
+        if isinstance(item, dict):
+            values = [item.get(col) for col in spec["columns"]]
+        else:
+            values = list(item[1 : 1 + len(spec["columns"])])
+        t = int(float(item[spec["time_key"]])) // divisor
+        rows.append((t, *[None if v is None else float(v) for v in values]))
+    return rows
+
+
+def fetch_page(session, endpoint, exchange, pair, interval, end, base_url, api_key):
+    """
+    Requests one page of history ending at `end` (epoch seconds, None for now).
+
+    Returns:
+        list: The parsed rows of the page.
+    """
+    params = {"ex": exchange, "pair": pair, "interval": interval, "limit": PAGE_SIZE}
+    if end is not None:
+        multiplier = 1000 if ENDPOINTS[endpoint]["unit"] == "ms" else 1
+        params["endTime"] = end * multiplier
+    headers = {"accept": "application/json", "coinglassSecret": api_key}
+    response = session.get(
+        f"{base_url}/{endpoint}", params=params, headers=headers, timeout=30
+    )
+    response.raise_for_status()
+    return parse_rows(endpoint, response.json().get("data") or [])
+
+
+def _read_checkpoint(conn, key):
+    row = conn.execute(
+        f"SELECT oldest, newest, done FROM {CHECKPOINT_TABLE} "
+        "WHERE endpoint = ? AND exchange = ? AND pair = ? AND interval = ?",
+        key,
+    ).fetchone()
+    return row if row is not None else (None, None, 0)
+
+
+def _store_page(db_path, endpoint, key, rows, oldest, newest, done):
+    table_name = history_table_name(endpoint)
+    placeholders = ", ".join("?" * (len(ENDPOINTS[endpoint]["columns"]) + 4))
+    exchange, pair, interval = key[1:]
+
+    def write_page(conn):
+        conn.executemany(
+            f"INSERT OR IGNORE INTO {table_name} VALUES ({placeholders})",
+            [(exchange, pair, interval, *row) for row in rows],
+        )
+        conn.execute(
+            f"INSERT OR REPLACE INTO {CHECKPOINT_TABLE} VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (*key, oldest, newest, int(done)),
+        )
+        if rows:
+            bump_write_version(conn, table_name)
+
+    # The pages of every series thread are committed together by the writer
+    get_writer(db_path).write(write_page)
+
+
+def backfill_series(
+    db_path,
+    endpoint,
+    exchange,
+    pair,
+    interval="24h",
+    limiter=None,
+    base_url=BASE_URL,
+    api_key=None,
+    max_pages=None,
+):
+    """
+    Pages backwards through the full history of one series into SQLite.
+
+    Progress is checkpointed after every page, so an interrupted run resumes from the
+    oldest stored row. Once the history is complete, later runs only fetch the pages
+    newer than the last stored row.
+
+    Parameters:
+        db_path (str): SQLite database for the history tables.
+        endpoint (str): A key of ENDPOINTS.
+        exchange (str): Exchange name, e.g. 'Binance'.
+        pair (str): Instrument id, e.g. 'BTCUSDT'.
+        interval (str): Candle interval. Default is '24h'.
+        limiter (RateLimiter): Shared rate limiter. Default is a private one.
+        base_url (str): API base URL, point it at a local stub server for tests.
+        api_key (str): Coinglass secret. Default is the one in src/config.json.
+        max_pages (int): Optional cap on the pages fetched in this run.
+
+    Returns:
+        int: Number of rows received (before deduplication).
+    """
+    limiter = limiter or RateLimiter(REQUESTS_PER_SECOND)
+    api_key = api_key if api_key is not None else load_api_key()
+    key = (endpoint, exchange, pair, interval)
+    with closing(sqlite3.connect(db_path, timeout=30)) as conn:
+        oldest, newest, done = _read_checkpoint(conn, key)
+
+    # Resume the backfill where it stopped, or start from now to catch up
+    catching_up = bool(done)
+    cursor = None if catching_up else oldest
+    # While catching up, the stored newest only moves once the gap is closed
+    seen_newest = newest
+    received = pages = 0
+    with requests.Session() as session:
+        while max_pages is None or pages < max_pages:
+            limiter.acquire()
+            end = None if cursor is None else cursor - 1
+            rows = fetch_page(
+                session, endpoint, exchange, pair, interval, end, base_url, api_key
+            )
+            pages += 1
+            if cursor is not None:
+                rows = [row for row in rows if row[0] < cursor]
+            if not rows:
+                done = True
+                _store_page(db_path, endpoint, key, [], oldest, newest, done)
+                break
+
+            page_oldest = min(row[0] for row in rows)
+            page_newest = max(row[0] for row in rows)
+            seen_newest = max(seen_newest or page_newest, page_newest)
+            oldest = page_oldest if oldest is None else min(oldest, page_oldest)
+            if not catching_up or newest is None or page_oldest <= newest:
+                newest = seen_newest
+            reached_known = catching_up and newest == seen_newest
+            received += len(rows)
+            _store_page(db_path, endpoint, key, rows, oldest, newest, done)
+            if reached_known:
+                break
+            cursor = page_oldest
+
+    logging.info(f"Backfill {endpoint} {exchange} {pair} {interval}: {received} rows.")
+    return received
+
+
+def run_backfill(
+    db_path,
+    pairs,
+    endpoints=None,
+    interval="24h",
+    workers=4,
+    requests_per_second=REQUESTS_PER_SECOND,
+    base_url=BASE_URL,
+    api_key=None,
+):
+    """
+    Backfills every endpoint of every pair with concurrent workers under one global
+    rate limit.
+
+    Parameters:
+        db_path (str): SQLite database for the history tables.
+        pairs (list): (exchange, pair) tuples.
+        endpoints (list): Keys of ENDPOINTS. Default is all of them.
+        interval (str): Candle interval. Default is '24h'.
+        workers (int): Number of concurrent workers.
+        requests_per_second (float): Global request budget across all workers.
+        base_url (str): API base URL.
+        api_key (str): Coinglass secret. Default is the one in src/config.json.
+
+    Returns:
+        dict: (endpoint, exchange, pair) -> rows received, or None if it failed.
+    """
+    endpoints = endpoints or list(ENDPOINTS)
+    api_key = api_key if api_key is not None else load_api_key()
+    with closing(sqlite3.connect(db_path)) as conn:
+        create_history_tables(conn)
+
+    limiter = RateLimiter(requests_per_second)
+    results = {}
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            executor.submit(
+                backfill_series,
+                db_path,
+                endpoint,
+                exchange,
+                pair,
+                interval,
+                limiter,
+                base_url,
+                api_key,
+            ): (endpoint, exchange, pair)
+            for exchange, pair in pairs
+            for endpoint in endpoints
+        }
+        for future in as_completed(futures):
+            try:
+                results[futures[future]] = future.result()
+            except Exception as e:
+                logging.error(f"Backfill of {futures[future]} failed: {e}")
+                results[futures[future]] = None
+    return results
+
+
+def load_history(db_path, endpoint, exchange, pair, interval="24h"):
+    """
+    Reads a backfilled series from SQLite.
+
+    Returns:
+        pd.DataFrame: Rows sorted by time, with 't' as a datetime column.
+    """
+    with closing(sqlite3.connect(db_path)) as conn:
+        df = pd.read_sql_query(
+            f"SELECT * FROM {history_table_name(endpoint)} "
+            "WHERE exchange = ? AND pair = ? AND interval = ? ORDER BY t",
+            conn,
+            params=(exchange, pair, interval),
+        )
+    df["t"] = pd.to_datetime(df["t"], unit="s")
+    return df
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    run_backfill("BTC_data.db", [("Binance", "BTCUSDT")])
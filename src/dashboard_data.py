@@ -0,0 +1,76 @@
+import functools
+import sqlite3
+from contextlib import closing
+
+import streamlit as st
+
+from utils.utils import SQLiteDB, read_write_version
+
+
+def data_version(db_path, tables=None):
+    """
+    Reads the write version of the tables a dashboard depends on.
+
+    This is a single-row lookup, cheap enough to run on every rerun.
+
+    Parameters:
+        db_path (str): Path to the SQLite database.
+        tables (list): Tables to watch. Default is every table.
+
+    Returns:
+        int: The combined write version.
+    """
+    with closing(sqlite3.connect(db_path)) as conn:
+        return read_write_version(conn, tables)
+
+
+def versioned(tables=None, max_entries=32):
+    """
+    Caches a loader's results until one of its tables is written to.
+
+    The decorated function must take the database path as its first argument. Its
+    results stay in memory across reruns and are recomputed only after a SQLiteDB
+    writer bumps the version of one of the watched tables.
+
+    Parameters:
+        tables (list): Tables the loader reads. Default is every table.
+        max_entries (int): Maximum number of cached results.
+
+    Returns:
+        Callable: The decorator.
+    """
+
+    def decorator(func):
+        # st.cache_data keys a function by its module, name and source, which are the
+        # same for every `cached` made here, so the loader is part of the key too
+        loader = f"{func.__module__}.{func.__qualname__}"
+
+        @st.cache_data(show_spinner=False, max_entries=max_entries)
+        def cached(loader, version, db_path, *args, **kwargs):
+            return func(db_path, *args, **kwargs)
+
+        @functools.wraps(func)
+        def wrapper(db_path, *args, **kwargs):
+            version = data_version(db_path, tables)
+            return cached(loader, version, db_path, *args, **kwargs)
+
+        wrapper.clear = cached.clear
+        return wrapper
+
+    return decorator
+
+
+@versioned()
+def cached_query(db_path, query):
+    """
+    Runs a query through SQLiteDB, served from memory until the database changes.
+
+    Parameters:
+        db_path (str): Path to the SQLite database.
+        query (str): The SQL query string to execute.
+
+    Returns:
+        pd.DataFrame or None: The query result.
+    """
+    with SQLiteDB(db_path) as db:
+        return db.query(query)
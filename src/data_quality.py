@@ -0,0 +1,281 @@
+import logging
+
+import numpy as np
+import pandas as pd
+
+from utils.utils import SQLiteDB, bump_write_version
+
+QUALITY_TABLE = "bar_quality"
+CHECKPOINT_TABLE = "_quality_checkpoints"
+GAP_POLICIES = ("drop", "fill")
+
+# A bar is an outlier when its log return is this many median absolute deviations
+# away from the median return
+OUTLIER_MADS = 12.0
+ISSUE_COLUMNS = ["kind", "time", "next_time", "missing", "value"]
+
+
+def infer_bar_seconds(times):
+    """
+    The bar spacing of a series: the most common positive step between timestamps.
+
+    Parameters:
+        times (np.ndarray): int64 epoch seconds.
+
+    Returns:
+        int or None: The spacing in seconds, None with fewer than two distinct times.
+    """
+    steps = np.diff(np.asarray(times, dtype=np.int64))
+    steps = steps[steps > 0]
+    if not len(steps):
+        return None
+    values, counts = np.unique(steps, return_counts=True)
+    return int(values[np.argmax(counts)])
+
+
+def detect_issues(times, close=None, bar_seconds=None, since=None):
+    """
+    Finds gaps, duplicate and out-of-order timestamps and return outliers in one pass.
+
+    Parameters:
+        times (array-like): int64 epoch seconds of the bars, in file order.
+        close (array-like): Close prices, to flag outlier returns. Optional.
+        bar_seconds (int): Expected spacing. Default is inferred from the times.
+        since (int): Only report issues after this time, already checked before.
+
+    Returns:
+        pd.DataFrame: One row per issue with 'kind' ('gap', 'misaligned', 'duplicate',
+            'out_of_order' or 'outlier'), 'time' and 'next_time' of the pair of bars,
+            'missing' bars for gaps and 'value' (the log return for outliers).
+    """
+    times = np.asarray(times, dtype=np.int64)
+    bar_seconds = bar_seconds or infer_bar_seconds(times)
+    if bar_seconds is None:
+        return pd.DataFrame(columns=ISSUE_COLUMNS)
+    first = 0
+    if since is not None:
+        # Keep the last checked bar so the step into the new data is checked too
+        first = max(int(np.searchsorted(times, since, side="right")) - 1, 0)
+    t = times[first:]
+    steps = np.diff(t)
+
+    kinds = np.full(len(steps), "", dtype=object)
+    kinds[steps > bar_seconds] = "gap"
+    kinds[(steps > bar_seconds) & (steps % bar_seconds != 0)] = "misaligned"
+    kinds[steps == 0] = "duplicate"
+    kinds[steps < 0] = "out_of_order"
+    missing = np.where(steps > bar_seconds, -(-steps // bar_seconds) - 1, 0)
+    values = np.full(len(steps), np.nan)
+
+    if close is not None:
+        returns = np.diff(np.log(np.asarray(close, dtype=np.float64)[first:]))
+        median = np.nanmedian(returns) if len(returns) else 0.0
+        mad = np.nanmedian(np.abs(returns - median)) if len(returns) else 0.0
+        if mad > 0:
+            outliers = (np.abs(returns - median) > OUTLIER_MADS * mad) & (kinds == "")
+            kinds[outliers] = "outlier"
+            values[outliers] = returns[outliers]
+
+    found = kinds != ""
+    return pd.DataFrame(
+        {
+            "kind": kinds[found].astype(str),
+            "time": t[:-1][found],
+            "next_time": t[1:][found],
+            "missing": missing[found],
+            "value": values[found],
+        }
+    )
+
+
+def clean_bars(df, policy="drop", bar_seconds=None, time_column="time"):
+    """
+    Sorts the bars, drops duplicate timestamps and applies a gap policy.
+
+    With 'drop' the gaps stay, and next_bar_close leaves the target of the bar before
+    each gap empty so that bar is dropped later. With 'fill' the missing bars are
+    inserted as flat candles at the previous close with no volume.
+
+    Parameters:
+        df (pd.DataFrame): Bars with int64 epoch seconds in time_column.
+        policy (str): One of GAP_POLICIES.
+        bar_seconds (int): Expected spacing. Default is inferred from the times.
+        time_column (str): Name of the time column.
+
+    Returns:
+        pd.DataFrame: The cleaned bars with a fresh RangeIndex.
+    """
+    if policy not in GAP_POLICIES:
+        raise ValueError(f"Unknown gap policy {policy!r}, use one of {GAP_POLICIES}")
+    times = df[time_column].to_numpy(dtype=np.int64)
+    steps = np.diff(times)
+    if (steps <= 0).any():
+        # Later rows of a duplicated timestamp are the corrected ones
+        df = df.sort_values(time_column, kind="stable")
+        df = df.drop_duplicates(time_column, keep="last")
+        times = df[time_column].to_numpy(dtype=np.int64)
+    df = df.reset_index(drop=True)
+    if policy == "drop":
+        return df
+
+    bar_seconds = bar_seconds or infer_bar_seconds(times)
+    if bar_seconds is None or not (np.diff(times) > bar_seconds).any():
+        return df
+    grid = np.arange(times[0], times[-1] + 1, bar_seconds, dtype=np.int64)
+    index = np.union1d(grid, times)
+    inserted = ~np.isin(index, times)
+    filled = df.set_index(time_column).reindex(index)
+    # Only the inserted bars are forward-filled, so gaps inside real bars (e.g. blank
+    # indicator cells) stay as they are
+    filled.loc[inserted] = filled.ffill().loc[inserted]
+    if "close" in filled:
+        for col in ("open", "high", "low"):
+            if col in filled:
+                filled.loc[inserted, col] = filled.loc[inserted, "close"]
+    if "volume" in filled:
+        filled.loc[inserted, "volume"] = 0
+    logging.info(f"Filled {int(inserted.sum())} bars.")
+    return filled.rename_axis(time_column).reset_index()
+
+
+def next_bar_close(times, close, bar_seconds=None):
+    """
+    Close of the next bar, left empty when the next bar is not exactly one bar later.
+
+    Parameters:
+        times (array-like): int64 epoch seconds, sorted.
+        close (pd.Series): Close prices.
+        bar_seconds (int): Expected spacing. Default is inferred from the times.
+
+    Returns:
+        pd.Series: The next close aligned with close.
+    """
+    times = np.asarray(times, dtype=np.int64)
+    bar_seconds = bar_seconds or infer_bar_seconds(times)
+    next_close = close.shift(-1)
+    if bar_seconds is not None:
+        contiguous = np.r_[np.diff(times) == bar_seconds, False]
+        next_close = next_close.where(contiguous)
+    return next_close
+
+
+def create_quality_tables(conn):
+    conn.execute(
+        f"CREATE TABLE IF NOT EXISTS {QUALITY_TABLE} ("
+        "table_name TEXT, kind TEXT, time INTEGER, next_time INTEGER, "
+        "missing INTEGER, value REAL, PRIMARY KEY (table_name, kind, time))"
+    )
+    conn.execute(
+        f"CREATE TABLE IF NOT EXISTS {CHECKPOINT_TABLE} "
+        "(table_name TEXT PRIMARY KEY, checked_until INTEGER)"
+    )
+
+
+def last_checked_time(conn, table_name):
+    """Epoch seconds up to which the bars of a table were validated, or None."""
+    create_quality_tables(conn)
+    row = conn.execute(
+        f"SELECT checked_until FROM {CHECKPOINT_TABLE} WHERE table_name = ?",
+        (table_name,),
+    ).fetchone()
+    return None if row is None else row[0]
+
+
+def move_checkpoint(conn, table_name, checked_until):
+    """
+    Marks the bars of a table up to checked_until as validated, without committing.
+
+    Parameters:
+        conn (sqlite3.Connection): Open connection to the bars database.
+        table_name (str): The bars table.
+        checked_until (int): Epoch seconds of the last validated bar.
+    """
+    create_quality_tables(conn)
+    conn.execute(
+        f"INSERT OR REPLACE INTO {CHECKPOINT_TABLE} VALUES (?, ?)",
+        (table_name, int(checked_until)),
+    )
+
+
+def update_quality_index(conn, table_name, issues, checked_until=None):
+    """
+    Appends new issues to the quality index and moves the table's checkpoint.
+
+    Parameters:
+        conn (sqlite3.Connection): Open connection to the bars database.
+        table_name (str): The bars table the issues belong to.
+        issues (pd.DataFrame): Output of detect_issues.
+        checked_until (int): Epoch seconds of the last validated bar. The checkpoint
+            is left where it is if None.
+    """
+    create_quality_tables(conn)
+    conn.executemany(
+        f"INSERT OR REPLACE INTO {QUALITY_TABLE} VALUES (?, ?, ?, ?, ?, ?)",
+        [
+            (table_name, kind, int(time), int(next_time), int(missing), value)
+            for kind, time, next_time, missing, value in issues[
+                ISSUE_COLUMNS
+            ].itertuples(index=False)
+        ],
+    )
+    if checked_until is not None:
+        move_checkpoint(conn, table_name, checked_until)
+    conn.commit()
+    bump_write_version(conn, QUALITY_TABLE)
+
+
+def validate_new_bars(db_path, table_name, df, time_column="time", checkpoint=True):
+    """
+    Validates the bars newer than the table's checkpoint and records their issues.
+
+    Recording the same issues twice is harmless, so a caller that still has to store
+    the bars can leave the checkpoint and move it with move_checkpoint once they are
+    saved; a failed run then validates the same bars again.
+
+    Parameters:
+        db_path (str): SQLite database holding the bars.
+        table_name (str): The bars table.
+        df (pd.DataFrame): Bars with int64 epoch seconds in time_column, in file order.
+        time_column (str): Name of the time column.
+        checkpoint (bool): Move the checkpoint past the validated bars.
+
+    Returns:
+        pd.DataFrame: The issues found in the new bars.
+    """
+    times = df[time_column].to_numpy(dtype=np.int64)
+    close = df["close"].to_numpy() if "close" in df else None
+    with SQLiteDB(db_path) as db:
+        since = last_checked_time(db.conn, table_name)
+        issues = detect_issues(times, close, since=since)
+        if len(times):
+            checked_until = times.max() if checkpoint else None
+            update_quality_index(db.conn, table_name, issues, checked_until)
+    if len(issues):
+        counts = issues["kind"].value_counts().to_dict()
+        logging.warning(f"Quality issues in the new bars of {table_name}: {counts}")
+    return issues
+
+
+def load_quality_index(db_path, table_name=None):
+    """
+    Reads the recorded issues.
+
+    Parameters:
+        db_path (str): SQLite database holding the bars.
+        table_name (str): Only the issues of this table. Default is every table.
+
+    Returns:
+        pd.DataFrame: The issues with 'time' and 'next_time' as datetimes.
+    """
+    with SQLiteDB(db_path) as db:
+        create_quality_tables(db.conn)
+        df = pd.read_sql_query(
+            f"SELECT * FROM {QUALITY_TABLE}"
+            + (" WHERE table_name = ?" if table_name else "")
+            + " ORDER BY time",
+            db.conn,
+            params=(table_name,) if table_name else None,
+        )
+    for col in ("time", "next_time"):
+        df[col] = pd.to_datetime(df[col], unit="s")
+    return df
@@ -0,0 +1,207 @@
+import numpy as np
+import pandas as pd
+
+from src.resample import TIMEFRAMES, load_bars
+
+# Upper bound on the points a single chart trace sends to the browser
+MAX_CHART_POINTS = 2000
+
+# Stored bar columns -> the short names the chart functions use
+CHART_COLUMNS = {
+    "time": "t",
+    "open": "o",
+    "high": "h",
+    "low": "l",
+    "close": "c",
+    "volume": "v",
+}
+
+
+def _numeric_x(x):
+    x = np.asarray(x)
+    if np.issubdtype(x.dtype, np.number):
+        return x.astype(np.float64)
+    return pd.to_datetime(x).values.astype("datetime64[ns]").astype(np.float64)
+
+
+def lttb_indices(x, y, n_out):
+    """
+    Selects points with the Largest-Triangle-Three-Buckets algorithm.
+
+    Parameters:
+        x (array-like): Sorted x values (numbers, datetimes or dates).
+        y (array-like): y values.
+        n_out (int): Number of points to keep, at least 3.
+
+    Returns:
+        np.ndarray: Indices of the selected points, in increasing order.
+    """
+    n = len(y)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    x = _numeric_x(x)
+    y = np.asarray(y, dtype=np.float64)
+
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    selected = np.empty(n_out, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        start, end = edges[i], edges[i + 1]
+        next_start = end
+        next_end = edges[i + 2] if i + 2 < len(edges) else n
+        avg_x = x[next_start:next_end].mean()
+        avg_y = y[next_start:next_end].mean()
+        area = np.abs(
+            (x[a] - avg_x) * (y[start:end] - y[a])
+            - (x[a] - x[start:end]) * (avg_y - y[a])
+        )
+        a = start + int(np.argmax(area))
+        selected[i + 1] = a
+    return selected
+
+
+def minmax_indices(y, n_out):
+    """
+    Keeps the minimum and maximum of each bucket, preserving spikes exactly.
+
+    Parameters:
+        y (array-like): y values.
+        n_out (int): Approximate number of points to keep (two per bucket).
+
+    Returns:
+        np.ndarray: Indices of the selected points, in increasing order.
+    """
+    y = np.asarray(y, dtype=np.float64)
+    n = len(y)
+    buckets = max(n_out // 2, 1)
+    if 2 * buckets >= n:
+        return np.arange(n)
+    size = -(-n // buckets)
+    # Windows past the end of y would be only padding
+    buckets = -(-n // size)
+    padded = np.full(buckets * size, np.nan)
+    padded[:n] = y
+    windows = padded.reshape(buckets, size)
+    offsets = np.arange(buckets) * size
+    # NaNs (the padding included) never win unless a window holds nothing else, and
+    # unlike nanargmin an all-NaN window does not raise
+    lows = offsets + np.argmin(np.where(np.isnan(windows), np.inf, windows), axis=1)
+    highs = offsets + np.argmax(np.where(np.isnan(windows), -np.inf, windows), axis=1)
+    return np.unique(np.concatenate([lows, highs]))
+
+
+def downsample_line(df, x, y, max_points=MAX_CHART_POINTS, method="lttb"):
+    """
+    Reduces a line chart's data to at most max_points rows.
+
+    Parameters:
+        df (pd.DataFrame): The chart data, sorted by x.
+        x (str): Name of the x column.
+        y (str or list): Name of the y column. With several columns the first one
+            drives the point selection.
+        max_points (int): Maximum number of rows to return.
+        method (str): 'lttb' or 'minmax'.
+
+    Returns:
+        pd.DataFrame: The selected rows.
+    """
+    if len(df) <= max_points:
+        return df
+    y = y[0] if isinstance(y, (list, tuple)) else y
+    if method == "minmax":
+        indices = minmax_indices(df[y].to_numpy(), max_points)
+    else:
+        indices = lttb_indices(df[x].to_numpy(), df[y].to_numpy(), max_points)
+    return df.iloc[indices]
+
+
+def downsample_ohlc(df, max_points=MAX_CHART_POINTS, columns=("t", "o", "h", "l", "c")):
+    """
+    Merges consecutive candles so that at most max_points remain.
+
+    Each merged candle keeps the first open, highest high, lowest low and last close
+    of the candles it covers, so no price extreme is lost.
+
+    Parameters:
+        df (pd.DataFrame): Candles sorted by time.
+        max_points (int): Maximum number of candles to return.
+        columns (tuple): Names of the time, open, high, low and close columns.
+
+    Returns:
+        pd.DataFrame: The merged candles, plus the summed 'v' column if present.
+    """
+    n = len(df)
+    if n <= max_points:
+        return df
+    t, o, h, l, c = columns
+    size = -(-n // max_points)
+    starts = np.arange(0, n, size)
+    ends = np.r_[starts[1:], n] - 1
+    merged = {
+        t: df[t].to_numpy()[starts],
+        o: df[o].to_numpy()[starts],
+        h: np.maximum.reduceat(df[h].to_numpy(dtype=np.float64), starts),
+        l: np.minimum.reduceat(df[l].to_numpy(dtype=np.float64), starts),
+        c: df[c].to_numpy()[ends],
+    }
+    if "v" in df.columns:
+        merged["v"] = np.add.reduceat(df["v"].to_numpy(dtype=np.float64), starts)
+    return pd.DataFrame(merged)
+
+
+def choose_timeframe(start, end, max_points=MAX_CHART_POINTS):
+    """
+    Picks the finest stored timeframe that fits the visible range in max_points bars.
+
+    Parameters:
+        start (pd.Timestamp): Start of the visible range.
+        end (pd.Timestamp): End of the visible range.
+        max_points (int): Maximum number of bars to draw.
+
+    Returns:
+        str or None: A key of TIMEFRAMES, or None if the base bars already fit.
+    """
+    span = (pd.Timestamp(end) - pd.Timestamp(start)).total_seconds()
+    candidates = sorted(TIMEFRAMES.items(), key=lambda item: item[1])
+    if span / candidates[0][1] <= max_points:
+        return None
+    for timeframe, seconds in candidates:
+        if span / seconds <= max_points:
+            return timeframe
+    return candidates[-1][0]
+
+
+def load_chart_bars(
+    db_path, start, end, max_points=MAX_CHART_POINTS, base_table="BTC_data"
+):
+    """
+    Loads the bars of a visible range at a resolution bounded by max_points.
+
+    Zooming in narrows the range, which selects a finer rollup, so detail is fetched
+    only for what is on screen.
+
+    Parameters:
+        db_path (str): SQLite database holding the bars and rollups.
+        start (pd.Timestamp): Start of the visible range.
+        end (pd.Timestamp): End of the visible range.
+        max_points (int): Maximum number of bars to return.
+        base_table (str): Name of the base bars table.
+
+    Returns:
+        pd.DataFrame or None: Bars with 't', 'o', 'h', 'l', 'c', 'v' columns.
+    """
+    timeframe = choose_timeframe(start, end, max_points)
+    fmt = "%Y-%m-%d %H:%M:%S"
+    bounds = {
+        "start": pd.Timestamp(start).strftime(fmt),
+        "end": pd.Timestamp(end).strftime(fmt),
+    }
+    df = load_bars(db_path, timeframe, base_table, **bounds)
+    if df is None and timeframe is not None:
+        # Rollups finer than the base bars are never materialized
+        df = load_bars(db_path, None, base_table, **bounds)
+    if df is None:
+        return None
+    df = df.rename(columns=CHART_COLUMNS)
+    return downsample_ohlc(df, max_points)
@@ -0,0 +1,236 @@
+import logging
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+
+from utils.utils import SQLiteDB
+from src.time_features import to_epoch_seconds
+from src.pubsub import publish_appends
+
+FEATURE_STORE_TABLE = "feature_store"
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+# Series joined onto the bar timeline. "lag" is how long after its timestamp a value
+# becomes known (a 24h candle stamped at its open is only final a day later), and
+# "tolerance" is how stale a value may be before the feature is left empty.
+# Text timestamps are UTC, as written by the scraper.
+SOURCES = {
+    "liq_total": {
+        "table": "Liquidations24h",
+        "time": "Timestamp",
+        "time_type": "text",
+        "value": "Total_liquidations/1000",
+        "filters": {"Grupo": "TODO"},
+        "lag": 0,
+        "tolerance": 2 * 86400,
+    },
+    "liq_long_short_ratio": {
+        "table": "Liquidations24h",
+        "time": "Timestamp",
+        "time_type": "text",
+        "value": "Long/Short Ratio",
+        "filters": {"Grupo": "TODO"},
+        "lag": 0,
+        "tolerance": 2 * 86400,
+    },
+    "oi_close": {
+        "table": "coinglass_open_interest_ohlc",
+        "time": "t",
+        "time_type": "epoch",
+        "value": "c",
+        "filters": {"exchange": "Binance", "pair": "BTCUSDT", "interval": "24h"},
+        "lag": 86400,
+        "tolerance": 3 * 86400,
+    },
+    "top_long_ratio": {
+        "table": "coinglass_top_long_short_account_ratio",
+        "time": "t",
+        "time_type": "epoch",
+        "value": "longRatio",
+        "filters": {"exchange": "Binance", "pair": "BTCUSDT", "interval": "24h"},
+        "lag": 86400,
+        "tolerance": 3 * 86400,
+    },
+}
+
+
+def _to_number(values):
+    """Parses values stored as display strings such as '1,234' or '12.5%'."""
+    # TEXT columns read back as object or, under pandas 3, as the str dtype
+    if not pd.api.types.is_numeric_dtype(values):
+        values = values.astype(str).str.replace(",", "", regex=False).str.rstrip("%")
+    return pd.to_numeric(values, errors="coerce").to_numpy(dtype=np.float64)
+
+
+def _format_bound(epoch_seconds, time_type):
+    if time_type == "text":
+        return datetime.fromtimestamp(int(epoch_seconds), tz=timezone.utc).strftime(
+            TIME_FORMAT
+        )
+    return int(epoch_seconds)
+
+
+def load_source(db, spec, since=None):
+    """
+    Loads one source series, sorted by the time its values became known.
+
+    Parameters:
+        db (SQLiteDB): Open database.
+        spec (dict): A SOURCES entry.
+        since (int): Optional epoch seconds of the first bar that needs the source;
+            only the rows from the last one known at that time onwards are read.
+
+    Returns:
+        tuple: (known_at, values) int64 epoch seconds and float64 arrays.
+    """
+    where = [f'"{column}" = ?' for column in spec["filters"]]
+    params = list(spec["filters"].values())
+    time_column = f'"{spec["time"]}"'
+    select = (
+        f'SELECT {time_column} AS time, "{spec["value"]}" AS value FROM {spec["table"]}'
+    )
+
+    queries = []
+    if since is None:
+        queries.append((where, params, "ORDER BY time"))
+    else:
+        bound = _format_bound(since - spec["lag"], spec["time_type"])
+        queries.append(
+            (
+                where + [f"{time_column} <= ?"],
+                params + [bound],
+                "ORDER BY time DESC LIMIT 1",
+            )
+        )
+        queries.append(
+            (where + [f"{time_column} > ?"], params + [bound], "ORDER BY time")
+        )
+
+    frames = []
+    for conditions, query_params, suffix in queries:
+        clause = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+        try:
+            frames.append(
+                pd.read_sql_query(
+                    f"{select}{clause} {suffix}", db.conn, params=query_params
+                )
+            )
+        except pd.errors.DatabaseError as e:
+            logging.warning(f"Source table {spec['table']} is not available: {e}")
+            return np.zeros(0, dtype=np.int64), np.zeros(0)
+    df = pd.concat(frames).dropna(subset=["time"])
+    if spec["time_type"] == "text":
+        times = to_epoch_seconds(pd.to_datetime(df["time"]))
+    else:
+        times = df["time"].to_numpy(dtype=np.int64)
+    known_at = times + spec["lag"]
+    order = np.argsort(known_at, kind="stable")
+    return known_at[order], _to_number(df["value"])[order]
+
+
+def asof_join(bar_times, source_times, source_values, tolerance=None):
+    """
+    Takes, for every bar, the last source value known at or before the bar's time.
+
+    Parameters:
+        bar_times (np.ndarray): int64 epoch seconds of the bars.
+        source_times (np.ndarray): Sorted int64 epoch seconds the values became known.
+        source_values (np.ndarray): float64 values.
+        tolerance (int): Maximum age in seconds of the joined value.
+
+    Returns:
+        np.ndarray: float64 values aligned with bar_times, NaN where none is known.
+    """
+    joined = np.full(len(bar_times), np.nan)
+    if not len(source_times):
+        return joined
+    index = np.searchsorted(source_times, bar_times, side="right") - 1
+    valid = index >= 0
+    if tolerance is not None:
+        valid &= bar_times - source_times[np.clip(index, 0, None)] <= tolerance
+    joined[valid] = source_values[index[valid]]
+    return joined
+
+
+def update_feature_store(
+    db_path, bars_table="KNN_data", sources=None, table_name=FEATURE_STORE_TABLE
+):
+    """
+    Appends point-in-time joined features for the bars not yet in the store.
+
+    Values are joined as of each bar's time, so rows already stored never change and
+    only new bars need work. The store is rebuilt if the sources or bar columns change.
+
+    Parameters:
+        db_path (str): SQLite database holding the bars and the source tables.
+        bars_table (str): Bars table, indexed by 'time'. Default is 'KNN_data'.
+        sources (dict): Sources to join. Default is SOURCES.
+        table_name (str): Feature store table. Default is 'feature_store'.
+
+    Returns:
+        int: Number of rows appended.
+    """
+    sources = SOURCES if sources is None else sources
+    with SQLiteDB(db_path) as db:
+        columns, bar_columns = [
+            [row[1] for row in db.conn.execute(f"PRAGMA table_info({name})")]
+            for name in (table_name, bars_table)
+        ]
+        last_time = None
+        if columns:
+            if set(sources).union(bar_columns).issubset(columns):
+                last_time = db.conn.execute(
+                    f"SELECT MAX(time) FROM {table_name}"
+                ).fetchone()[0]
+            else:
+                logging.info(f"Sources changed, rebuilding {table_name}.")
+                db.conn.execute(f"DROP TABLE {table_name}")
+
+        if last_time is None:
+            bars = db.select(bars_table, order_by="time")
+        else:
+            bars = db.select(
+                bars_table, where="time > ?", params=(last_time,), order_by="time"
+            )
+        if bars is None or bars.empty:
+            return 0
+
+        bar_times = to_epoch_seconds(pd.to_datetime(bars["time"]))
+        for name, spec in sources.items():
+            known_at, values = load_source(db, spec, since=int(bar_times[0]))
+            bars[name] = asof_join(bar_times, known_at, values, spec.get("tolerance"))
+
+        with publish_appends(db.conn, table_name):
+            bars.to_sql(table_name, db.conn, if_exists="append", index=False)
+        db.conn.execute(
+            f"CREATE UNIQUE INDEX IF NOT EXISTS idx_{table_name}_time "
+            f"ON {table_name} (time)"
+        )
+        db.bump_write_version(table_name)
+    logging.info(f"Appended {len(bars)} rows to {table_name}.")
+    return len(bars)
+
+
+def load_feature_matrix(db_path, table_name=FEATURE_STORE_TABLE, start=None):
+    """
+    Reads the joined feature matrix for training or inference.
+
+    Parameters:
+        db_path (str): SQLite database holding the store.
+        table_name (str): Feature store table.
+        start (str): Optional inclusive lower bound on time.
+
+    Returns:
+        pd.DataFrame or None: The features indexed by time.
+    """
+    with SQLiteDB(db_path) as db:
+        df = db.select(table_name, start=start, order_by="time")
+    if df is None:
+        return None
+    return df.set_index("time")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    update_feature_store("BTC_data.db")
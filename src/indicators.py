@@ -0,0 +1,448 @@
+import math
+from collections import deque
+
+import numpy as np
+import pandas as pd
+
+from src.time_features import to_epoch_seconds
+
+SECONDS_PER_DAY = 86400
+
+# Indicator settings, matching the TradingView defaults used for the raw export
+VWAP_BAND_MULTIPLIERS = (1, 2, 3)
+BB_LENGTH = 20
+BB_MULT = 2.0
+VOLUME_MA_LENGTH = 20
+SAR_START = 0.02
+SAR_INCREMENT = 0.02
+SAR_MAX = 0.2
+ADX_LENGTH = 14
+EFI_LENGTH = 13
+ATR_LENGTH = 14
+ROC_LENGTH = 9
+CCI_LENGTH = 20
+
+INDICATOR_COLUMNS = [
+    "vwap",
+    "upper_b1",
+    "lower_b1",
+    "upper_b2",
+    "lower_b2",
+    "upper_b3",
+    "lower_b3",
+    "basis",
+    "upper",
+    "lower",
+    "parabolicsar",
+    "twap",
+    "volume_ma",
+    "adx",
+    "efi",
+    "atr",
+    "obv",
+    "roc",
+    "cci",
+]
+
+
+def _seeded_ewm(values, alpha, length):
+    """
+    Exponential moving average seeded with the simple average of the first
+    `length` valid values, as TradingView computes ta.ema and ta.rma. NaN values
+    are skipped, keeping the previous average.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    result = np.full(len(values), np.nan)
+    valid = np.flatnonzero(~np.isnan(values))
+    if len(valid) < length:
+        return result
+    seed_index = valid[0] + length - 1
+    seeded = values.copy()
+    seeded[:seed_index] = np.nan
+    seeded[seed_index] = values[valid[0] : seed_index + 1].mean()
+    result[seed_index:] = (
+        pd.Series(seeded[seed_index:])
+        .ewm(alpha=alpha, adjust=False, ignore_na=True)
+        .mean()
+        .values
+    )
+    return result
+
+
+def _rma(values, length):
+    return _seeded_ewm(values, 1.0 / length, length)
+
+
+def _ema(values, length):
+    return _seeded_ewm(values, 2.0 / (length + 1), length)
+
+
+def _true_range(high, low, close):
+    prev_close = np.roll(close, 1)
+    tr = np.maximum(high - low, np.abs(high - prev_close))
+    tr = np.maximum(tr, np.abs(low - prev_close))
+    tr[:1] = high[:1] - low[:1]
+    return tr
+
+
+def _parabolic_sar(high, low, close):
+    state = _SarState()
+    return np.array(
+        [state.update(h, l, c) for h, l, c in zip(high, low, close)], dtype=np.float64
+    )
+
+
+def compute_indicators(df, columns=None):
+    """
+    Computes the technical indicators of the raw export from OHLCV bars.
+
+    Parameters:
+        df (pd.DataFrame): Bars with 'time', 'open', 'high', 'low', 'close' and
+            'volume' columns, sorted by time.
+        columns (list): Indicator columns to return. Default is INDICATOR_COLUMNS.
+
+    Returns:
+        pd.DataFrame: The indicator columns, aligned with df's index. Values are
+            NaN while an indicator is still warming up.
+    """
+    if columns is None:
+        columns = INDICATOR_COLUMNS
+    epoch_seconds = to_epoch_seconds(df["time"])
+    open_ = df["open"].to_numpy(dtype=np.float64)
+    high = df["high"].to_numpy(dtype=np.float64)
+    low = df["low"].to_numpy(dtype=np.float64)
+    close = df["close"].to_numpy(dtype=np.float64)
+    volume = df["volume"].to_numpy(dtype=np.float64)
+    out = {}
+
+    # Session VWAP with standard deviation bands and TWAP, anchored to the UTC day
+    day = epoch_seconds // SECONDS_PER_DAY
+    hlc3 = (high + low + close) / 3
+    by_day = (
+        pd.DataFrame(
+            {
+                "pv": hlc3 * volume,
+                "pv2": hlc3 * hlc3 * volume,
+                "v": volume,
+                "ohlc4": (open_ + high + low + close) / 4,
+                "n": 1.0,
+            }
+        )
+        .groupby(day)
+        .cumsum()
+    )
+    # Empty until the session has volume, e.g. on filled bars
+    with np.errstate(divide="ignore", invalid="ignore"):
+        vwap = by_day["pv"].values / by_day["v"].values
+        dev = np.sqrt(
+            np.maximum(by_day["pv2"].values / by_day["v"].values - vwap**2, 0)
+        )
+    out["vwap"] = vwap
+    for mult in VWAP_BAND_MULTIPLIERS:
+        out[f"upper_b{mult}"] = vwap + mult * dev
+        out[f"lower_b{mult}"] = vwap - mult * dev
+    out["twap"] = by_day["ohlc4"].values / by_day["n"].values
+
+    # Bollinger Bands and volume average
+    close_s = pd.Series(close)
+    basis = close_s.rolling(BB_LENGTH).mean().values
+    std = close_s.rolling(BB_LENGTH).std(ddof=0).values
+    out["basis"] = basis
+    out["upper"] = basis + BB_MULT * std
+    out["lower"] = basis - BB_MULT * std
+    out["volume_ma"] = pd.Series(volume).rolling(VOLUME_MA_LENGTH).mean().values
+
+    # Trend and volatility
+    if "parabolicsar" in columns:
+        out["parabolicsar"] = _parabolic_sar(high, low, close)
+    tr = _true_range(high, low, close)
+    out["atr"] = _rma(tr, ATR_LENGTH)
+
+    up = np.diff(high, prepend=np.nan)
+    down = -np.diff(low, prepend=np.nan)
+    plus_dm = np.where((up > down) & (up > 0), up, 0.0)
+    minus_dm = np.where((down > up) & (down > 0), down, 0.0)
+    tr_rma = _rma(tr, ADX_LENGTH)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        plus = 100 * _rma(plus_dm, ADX_LENGTH) / tr_rma
+        minus = 100 * _rma(minus_dm, ADX_LENGTH) / tr_rma
+        di_sum = plus + minus
+        dx = np.abs(plus - minus) / np.where(di_sum == 0, 1, di_sum)
+    out["adx"] = 100 * _rma(dx, ADX_LENGTH)
+
+    # Volume and momentum
+    change = np.diff(close, prepend=np.nan)
+    out["efi"] = _ema(change * volume, EFI_LENGTH)
+    out["obv"] = np.cumsum(np.sign(np.nan_to_num(change)) * volume)
+    prev_close = close_s.shift(ROC_LENGTH).values
+    out["roc"] = 100 * (close - prev_close) / prev_close
+
+    cci = np.full(len(hlc3), np.nan)
+    # Fewer bars than one window leave the whole column in its warm-up
+    if len(hlc3) >= CCI_LENGTH:
+        windows = np.lib.stride_tricks.sliding_window_view(hlc3, CCI_LENGTH)
+        mean_dev = np.abs(windows - windows.mean(axis=1, keepdims=True)).mean(axis=1)
+        tp_sma = pd.Series(hlc3).rolling(CCI_LENGTH).mean().values
+        with np.errstate(divide="ignore", invalid="ignore"):
+            cci[CCI_LENGTH - 1 :] = (
+                hlc3[CCI_LENGTH - 1 :] - tp_sma[CCI_LENGTH - 1 :]
+            ) / (0.015 * mean_dev)
+        # A window of equal prices has no deviation, whatever the rounding of its mean
+        cci[CCI_LENGTH - 1 :][windows.max(axis=1) == windows.min(axis=1)] = np.nan
+    out["cci"] = cci
+
+    return pd.DataFrame({col: out[col] for col in columns}, index=df.index)
+
+
+def add_missing_indicators(df):
+    """
+    Computes any indicator column the DataFrame lacks and appends it.
+
+    Parameters:
+        df (pd.DataFrame): Bars with at least time and OHLCV columns.
+
+    Returns:
+        pd.DataFrame: The DataFrame with every INDICATOR_COLUMNS column present.
+    """
+    missing = [col for col in INDICATOR_COLUMNS if col not in df.columns]
+    if not missing:
+        return df
+    return pd.concat([df, compute_indicators(df, columns=missing)], axis=1)
+
+
+def _divide(a, b):
+    """a / b with numpy's rules for a zero b: NaN for 0 / 0, else a signed inf."""
+    if b:
+        return a / b
+    if a == 0 or math.isnan(a):
+        return math.nan
+    return math.copysign(math.inf, a)
+
+
+class _SeededAverage:
+    """Incremental counterpart of _seeded_ewm."""
+
+    def __init__(self, alpha, length):
+        self.alpha = alpha
+        self.length = length
+        self.warmup = []
+        self.value = math.nan
+
+    def update(self, x):
+        if math.isnan(x):
+            return self.value
+        if len(self.warmup) < self.length:
+            self.warmup.append(x)
+            if len(self.warmup) == self.length:
+                self.value = sum(self.warmup) / self.length
+            return self.value
+        self.value = self.alpha * x + (1 - self.alpha) * self.value
+        return self.value
+
+
+class _SarState:
+    """Parabolic SAR state machine, following TradingView's ta.sar."""
+
+    def __init__(self, start=SAR_START, increment=SAR_INCREMENT, maximum=SAR_MAX):
+        self.start = start
+        self.increment = increment
+        self.maximum = maximum
+        self.bar_index = -1
+        self.result = math.nan
+        self.max_min = math.nan
+        self.acceleration = math.nan
+        self.is_below = False
+        self.highs = deque(maxlen=2)
+        self.lows = deque(maxlen=2)
+        self.prev_close = math.nan
+
+    def update(self, high, low, close):
+        self.bar_index += 1
+        if self.bar_index == 0:
+            self._remember(high, low, close)
+            return math.nan
+
+        first_trend_bar = False
+        if self.bar_index == 1:
+            if close > self.prev_close:
+                self.is_below = True
+                self.max_min = high
+                self.result = self.lows[-1]
+            else:
+                self.is_below = False
+                self.max_min = low
+                self.result = self.highs[-1]
+            first_trend_bar = True
+            self.acceleration = self.start
+
+        self.result += self.acceleration * (self.max_min - self.result)
+
+        if self.is_below:
+            if self.result > low:
+                first_trend_bar = True
+                self.is_below = False
+                self.result = max(high, self.max_min)
+                self.max_min = low
+                self.acceleration = self.start
+        elif self.result < high:
+            first_trend_bar = True
+            self.is_below = True
+            self.result = min(low, self.max_min)
+            self.max_min = high
+            self.acceleration = self.start
+
+        if not first_trend_bar:
+            if self.is_below and high > self.max_min:
+                self.max_min = high
+                self.acceleration = min(
+                    self.acceleration + self.increment, self.maximum
+                )
+            elif not self.is_below and low < self.max_min:
+                self.max_min = low
+                self.acceleration = min(
+                    self.acceleration + self.increment, self.maximum
+                )
+
+        if self.is_below:
+            self.result = min(self.result, *self.lows)
+        else:
+            self.result = max(self.result, *self.highs)
+
+        self._remember(high, low, close)
+        return self.result
+
+    def _remember(self, high, low, close):
+        self.highs.append(high)
+        self.lows.append(low)
+        self.prev_close = close
+
+
+class StreamingIndicators:
+    """
+    Incremental indicator engine that produces one feature row per new bar.
+
+    Every update costs O(1): the engine keeps only the running sums, averages and
+    fixed-size windows each indicator needs. Feeding the same bars through
+    update() gives the same values as compute_indicators().
+    """
+
+    def __init__(self):
+        self.day = None
+        self.cum_pv = self.cum_pv2 = self.cum_v = 0.0
+        self.cum_ohlc4 = 0.0
+        self.session_bars = 0
+        self.closes = deque(maxlen=max(BB_LENGTH, ROC_LENGTH + 1))
+        self.volumes = deque(maxlen=VOLUME_MA_LENGTH)
+        self.typical_prices = deque(maxlen=CCI_LENGTH)
+        self.prev_high = self.prev_low = self.prev_close = math.nan
+        self.obv = 0.0
+        self.atr = _SeededAverage(1.0 / ATR_LENGTH, ATR_LENGTH)
+        self.tr_rma = _SeededAverage(1.0 / ADX_LENGTH, ADX_LENGTH)
+        self.plus_rma = _SeededAverage(1.0 / ADX_LENGTH, ADX_LENGTH)
+        self.minus_rma = _SeededAverage(1.0 / ADX_LENGTH, ADX_LENGTH)
+        self.adx = _SeededAverage(1.0 / ADX_LENGTH, ADX_LENGTH)
+        self.efi = _SeededAverage(2.0 / (EFI_LENGTH + 1), EFI_LENGTH)
+        self.sar = _SarState()
+
+    def update(self, time, open, high, low, close, volume):
+        """
+        Consumes one closed bar and returns its indicator values.
+
+        Parameters:
+            time (int): Bar open time in epoch seconds (UTC).
+            open, high, low, close, volume (float): The bar's OHLCV values.
+
+        Returns:
+            dict: Indicator column -> value, keyed like INDICATOR_COLUMNS.
+        """
+        row = {}
+
+        day = int(time) // SECONDS_PER_DAY
+        if day != self.day:
+            self.day = day
+            self.cum_pv = self.cum_pv2 = self.cum_v = self.cum_ohlc4 = 0.0
+            self.session_bars = 0
+        hlc3 = (high + low + close) / 3
+        self.cum_pv += hlc3 * volume
+        self.cum_pv2 += hlc3 * hlc3 * volume
+        self.cum_v += volume
+        self.cum_ohlc4 += (open + high + low + close) / 4
+        self.session_bars += 1
+        vwap = self.cum_pv / self.cum_v if self.cum_v else math.nan
+        dev = (
+            math.sqrt(max(self.cum_pv2 / self.cum_v - vwap * vwap, 0))
+            if self.cum_v
+            else math.nan
+        )
+        row["vwap"] = vwap
+        for mult in VWAP_BAND_MULTIPLIERS:
+            row[f"upper_b{mult}"] = vwap + mult * dev
+            row[f"lower_b{mult}"] = vwap - mult * dev
+
+        self.closes.append(close)
+        if len(self.closes) >= BB_LENGTH:
+            window = list(self.closes)[-BB_LENGTH:]
+            basis = sum(window) / BB_LENGTH
+            std = math.sqrt(sum((x - basis) ** 2 for x in window) / BB_LENGTH)
+            row["basis"] = basis
+            row["upper"] = basis + BB_MULT * std
+            row["lower"] = basis - BB_MULT * std
+        else:
+            row["basis"] = row["upper"] = row["lower"] = math.nan
+
+        row["parabolicsar"] = self.sar.update(high, low, close)
+        row["twap"] = self.cum_ohlc4 / self.session_bars
+
+        self.volumes.append(volume)
+        row["volume_ma"] = (
+            sum(self.volumes) / VOLUME_MA_LENGTH
+            if len(self.volumes) == VOLUME_MA_LENGTH
+            else math.nan
+        )
+
+        if math.isnan(self.prev_close):
+            tr = high - low
+            plus_dm = minus_dm = 0.0
+            change = math.nan
+        else:
+            tr = max(
+                high - low, abs(high - self.prev_close), abs(low - self.prev_close)
+            )
+            up = high - self.prev_high
+            down = self.prev_low - low
+            plus_dm = up if up > down and up > 0 else 0.0
+            minus_dm = down if down > up and down > 0 else 0.0
+            change = close - self.prev_close
+
+        # The averages are updated on every bar, even when a flat run leaves the true
+        # range average at zero, to stay in step with compute_indicators
+        tr_rma = self.tr_rma.update(tr)
+        plus = _divide(100 * self.plus_rma.update(plus_dm), tr_rma)
+        minus = _divide(100 * self.minus_rma.update(minus_dm), tr_rma)
+        di_sum = plus + minus
+        dx = abs(plus - minus) / (di_sum if di_sum else 1)
+        row["adx"] = 100 * self.adx.update(dx)
+        row["atr"] = self.atr.update(tr)
+
+        row["efi"] = self.efi.update(change * volume)
+        if not math.isnan(change):
+            self.obv += math.copysign(volume, change) if change else 0.0
+        row["obv"] = self.obv
+
+        if len(self.closes) > ROC_LENGTH:
+            past = self.closes[-ROC_LENGTH - 1]
+            row["roc"] = 100 * (close - past) / past
+        else:
+            row["roc"] = math.nan
+
+        self.typical_prices.append(hlc3)
+        if len(self.typical_prices) == CCI_LENGTH:
+            mean = sum(self.typical_prices) / CCI_LENGTH
+            mean_dev = sum(abs(x - mean) for x in self.typical_prices) / CCI_LENGTH
+            flat = max(self.typical_prices) == min(self.typical_prices)
+            row["cci"] = math.nan if flat else (hlc3 - mean) / (0.015 * mean_dev)
+        else:
+            row["cci"] = math.nan
+
+        self.prev_high, self.prev_low, self.prev_close = high, low, close
+        return {col: row[col] for col in INDICATOR_COLUMNS}
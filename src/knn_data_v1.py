@@ -1,20 +1,19 @@
 # Import libraries
-import os
-import sqlite3
 import pandas as pd
-import matplotlib.pyplot as plt
-import seaborn as sns
 import numpy as np
-from contextlib import closing
-import sys
 
 
 from utils.utils import SQLiteDB
+from src.time_features import to_epoch_seconds
+from src.sharding import run_sharded
+from src.pubsub import publish_change
+from src.feature_store import update_feature_store
+from utils.instrumentation import stage, table_bytes
 
 
-def load_data_from_db(db_path):
+def load_data_from_db(db_path, table_name="BTC_data"):
     with SQLiteDB(db_path) as db:
-        df = db.query("SELECT * FROM BTC_data")
+        df = db.select(table_name)
     return df
 
 
@@ -173,27 +172,139 @@ def target(df):
     return df
 
 
-def main_logic():
+# One-hot columns made by dropper; a shard only has the values it contains
+DUMMY_PREFIXES = ("hour_", "day_of_week_")
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+def build_features(df):
+    """
+    Turns stored bars into the KNN features: categorize_and_append_all, dropper and
+    target.
+
+    Parameters:
+        df (pd.DataFrame): Bars as stored in BTC_data, with a RangeIndex.
+
+    Returns:
+        pd.DataFrame: The features indexed by time.
+    """
+    return target(dropper(categorize_and_append_all(df)))
+
+
+def _build_features_shard(df):
+    # Times travel through shared memory as epoch seconds
+    df["time"] = pd.to_datetime(df["time"], unit="s").dt.strftime(TIME_FORMAT)
+    return build_features(df)
+
+
+def stitch_features(parts):
+    """
+    Joins feature shards in time order as if they had been built in one piece.
+
+    Streaks that run across a shard boundary are continued, one-hot columns missing
+    from a shard are filled with False and Target is made one categorical again.
+
+    Parameters:
+        parts (list): Outputs of build_features for consecutive shards.
+
+    Returns:
+        pd.DataFrame: The features indexed by time.
+    """
+    previous_target, previous_streak = np.nan, 0
+    for part in parts:
+        if part.empty:
+            continue
+        targets = np.asarray(part["Target"], dtype=float)
+        if targets[0] == previous_target:
+            # The leading run of the shard continues the last run of the previous one
+            leading = np.flatnonzero(targets != targets[0])
+            run_length = leading[0] if len(leading) else len(targets)
+            streak = part["Streak"].to_numpy().copy()
+            streak[:run_length] += previous_streak
+            part["Streak"] = streak
+        previous_target, previous_streak = targets[-1], part["Streak"].iloc[-1]
+
+    df = pd.concat(parts)
+    # Put the one-hot columns back in the order dropper gives them
+    columns = []
+    for col in parts[0].columns:
+        prefix = next((p for p in DUMMY_PREFIXES if col.startswith(p)), None)
+        if prefix is None:
+            columns.append(col)
+        elif not any(c.startswith(prefix) for c in columns):
+            dummies = [c for c in df.columns if c.startswith(prefix)]
+            columns += sorted(dummies, key=lambda c: int(c[len(prefix) :]))
+    df = df[columns]
+    for col in columns:
+        if col.startswith(DUMMY_PREFIXES) and df[col].dtype != bool:
+            df[col] = df[col].fillna(False).astype(bool)
+    df["Target"] = pd.Categorical(np.asarray(df["Target"], dtype=float))
+    return df
+
+
+def build_features_sharded(df, workers=None, shards=None):
+    """
+    build_features over time shards in a process pool.
+
+    Every KNN feature only depends on its own bar except the streak, which is
+    continued across shards when stitching, so the shards need no overlap.
+
+    Parameters:
+        df (pd.DataFrame): Bars as stored in BTC_data.
+        workers (int): Worker processes. Default is the number of cores.
+        shards (int): Number of shards. Default is one per worker.
+
+    Returns:
+        pd.DataFrame: The same features as build_features(df).
+    """
+    encoded = df.assign(time=to_epoch_seconds(pd.to_datetime(df["time"])))
+    parts = run_sharded(encoded, _build_features_shard, workers, shards=shards)
+    return stitch_features(parts)
+
+
+def main_logic(
+    db_file_path="BTC_data.db",
+    source_table="BTC_data",
+    table_name="KNN_data",
+    workers=None,
+):
     # Load the data
-    df = load_data_from_db("BTC_data.db")
+    with stage("knn.load") as record:
+        df = load_data_from_db(db_file_path, source_table)
+        record.rows_out = None if df is None else len(df)
 
     if df is not None:
         # Apply all transformations
-        df = categorize_and_append_all(df)
-        df = dropper(df)
-        df = target(df)
+        if workers and workers > 1:
+            with stage("knn.build_sharded", rows_in=len(df)) as record:
+                df = build_features_sharded(df, workers)
+                record.rows_out = len(df)
+        else:
+            for name, transform in (
+                ("knn.categorize", categorize_and_append_all),
+                ("knn.dropper", dropper),
+                ("knn.target", target),
+            ):
+                with stage(name, rows_in=len(df)) as record:
+                    df = transform(df)
+                    record.rows_out = len(df)
 
         # Save to database
-        db_file_path = "BTC_data.db"
-        table_name = "KNN_data"
-        with SQLiteDB(db_file_path) as db:
+        with stage("knn.save", rows_in=len(df)) as record, SQLiteDB(db_file_path) as db:
             db.create_table(df, table_name)
-            query = f"SELECT * FROM {table_name} LIMIT 1;"
-            queried_data = db.query(query)
+            publish_change(db.conn, table_name, "replace")
+            record.rows_out = len(df)
+            record.bytes_written = table_bytes(db.conn, table_name)
+            queried_data = db.select(table_name, limit=1)
             if queried_data is not None:
                 print(queried_data)
+
+        # Join the liquidation and open-interest series onto the new bars
+        with stage("knn.feature_store") as record:
+            record.rows_out = update_feature_store(db_file_path, table_name)
     else:
         print("DataFrame could not be read from the CSV file.")
+    return df
 
 
 if __name__ == "__main__":
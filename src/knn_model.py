@@ -0,0 +1,155 @@
+import logging
+import pickle
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from utils.utils import SQLiteDB
+
+MODEL_PATH = "knn_model/model.pkl"
+N_NEIGHBORS = 15
+
+# Columns that are not features: the label, the future price it is built from, and
+# the streak, which counts runs of the label itself
+NON_FEATURE_COLUMNS = ["time", "close", "target_close", "Target", "Streak"]
+
+# Position taken for each Target class: 0 and 2 are up moves, 1 and 3 down moves
+CLASS_POSITIONS = {0: 1.0, 1: -1.0, 2: 1.0, 3: -1.0}
+
+
+def load_training_data(db_path, table_name="KNN_data", matrix_dir=None):
+    """
+    Loads the KNN features and labels, dropping bars without a label.
+
+    Parameters:
+        db_path (str): SQLite database holding the features.
+        table_name (str): Features table written by main_logic.
+        matrix_dir (str): Export of the table by src.matrix_export. When given the
+            memory-mapped matrices are read instead of the database.
+
+    Returns:
+        tuple: (features DataFrame, int labels Series, next-bar returns Series), all
+            indexed and ordered by time.
+    """
+    if matrix_dir:
+        from src.matrix_export import matrices_as_frames
+
+        features, labels = matrices_as_frames(matrix_dir)
+        labelled = labels["Target"].notna() & labels["target_close"].notna()
+        labels = labels[labelled]
+        returns = labels["target_close"].astype(np.float64) / labels["close"] - 1
+        return features[labelled], labels["Target"].astype(int), returns
+
+    # Cached, so repeated training runs in one process skip decoding the table
+    with SQLiteDB(db_path, cache=True) as db:
+        df = db.select(table_name, order_by="time")
+    if df is None:
+        raise ValueError(f"Table {table_name} could not be read from {db_path}")
+    # Target is stored from a categorical, so it comes back as text like '3.0'
+    df["Target"] = pd.to_numeric(df["Target"], errors="coerce")
+    df = df.dropna(subset=["Target", "target_close"]).set_index("time", drop=False)
+    features = df.drop(columns=[c for c in NON_FEATURE_COLUMNS if c in df.columns])
+    returns = df["target_close"] / df["close"] - 1
+    return features.astype(np.float32), df["Target"].astype(int), returns
+
+
+def _classifier(n_neighbors):
+    # scikit-learn is only needed to train and backtest
+    from sklearn.neighbors import KNeighborsClassifier
+
+    return KNeighborsClassifier(n_neighbors=n_neighbors)
+
+
+def train_model(
+    db_path="BTC_data.db",
+    table_name="KNN_data",
+    model_path=MODEL_PATH,
+    n_neighbors=N_NEIGHBORS,
+    matrix_dir=None,
+):
+    """
+    Fits a KNN classifier of the Target class on every labelled bar and saves it.
+
+    Parameters:
+        db_path (str): SQLite database holding the features.
+        table_name (str): Features table.
+        model_path (str): Where the pickled model and its feature list are written.
+        n_neighbors (int): Number of neighbours.
+        matrix_dir (str): Read the features from this matrix export instead.
+
+    Returns:
+        float: Accuracy on the training data.
+    """
+    features, labels, _ = load_training_data(db_path, table_name, matrix_dir)
+    model = _classifier(n_neighbors).fit(features.to_numpy(), labels.to_numpy())
+    accuracy = model.score(features.to_numpy(), labels.to_numpy())
+
+    Path(model_path).parent.mkdir(parents=True, exist_ok=True)
+    with open(model_path, "wb") as model_file:
+        pickle.dump({"model": model, "features": list(features.columns)}, model_file)
+    logging.info(
+        f"Trained on {len(features)} bars, training accuracy {accuracy:.3f}, "
+        f"saved to {model_path}."
+    )
+    return accuracy
+
+
+def backtest(
+    db_path="BTC_data.db",
+    table_name="KNN_data",
+    n_splits=5,
+    n_neighbors=N_NEIGHBORS,
+    fee=0.0,
+    matrix_dir=None,
+):
+    """
+    Walk-forward backtest: each fold is predicted by a model fitted on the bars before
+    it, and the predicted class sets a long or short position for the next bar.
+
+    Parameters:
+        db_path (str): SQLite database holding the features.
+        table_name (str): Features table.
+        n_splits (int): Number of walk-forward folds.
+        n_neighbors (int): Number of neighbours.
+        fee (float): Cost per bar traded, as a fraction of the price.
+        matrix_dir (str): Read the features from this matrix export instead.
+
+    Returns:
+        dict: Accuracy, hit rate, cumulative return and annualized Sharpe ratio of the
+            out-of-sample predictions.
+    """
+    from sklearn.model_selection import TimeSeriesSplit
+
+    features, labels, returns = load_training_data(db_path, table_name, matrix_dir)
+    X, y, r = features.to_numpy(), labels.to_numpy(), returns.to_numpy()
+
+    predicted = np.full(len(y), -1)
+    for train_index, test_index in TimeSeriesSplit(n_splits=n_splits).split(X):
+        model = _classifier(n_neighbors).fit(X[train_index], y[train_index])
+        predicted[test_index] = model.predict(X[test_index])
+    tested = predicted >= 0
+
+    positions = pd.Series(predicted[tested]).map(CLASS_POSITIONS).to_numpy()
+    strategy = positions * r[tested] - fee * np.abs(np.diff(positions, prepend=0))
+    times = pd.to_datetime(features.index.to_series())
+    bars_per_year = 365 * 86400 / times.diff().median().total_seconds()
+    results = {
+        "bars": int(tested.sum()),
+        "accuracy": float((predicted[tested] == y[tested]).mean()),
+        "hit_rate": float((np.sign(strategy) > 0).mean()),
+        "cumulative_return": float(np.prod(1 + strategy) - 1),
+        "sharpe": float(
+            strategy.mean() / strategy.std() * np.sqrt(bars_per_year)
+            if strategy.std() > 0
+            else 0.0
+        ),
+    }
+    logging.info(f"Backtest of {table_name}: {results}")
+    return results
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    train_model()
+    print(backtest())
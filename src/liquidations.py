@@ -0,0 +1,143 @@
+import json
+import logging
+import sqlite3
+from contextlib import closing
+
+from utils.utils import bump_write_version
+from src.pubsub import publish_change
+
+SNAPSHOTS_TABLE = "Liquidations24h"
+LATEST_TABLE = "Liquidations24h_latest"
+EXCHANGES_TABLE = "Liquidations24h_exchanges"
+AGGREGATE_GROUP = "TODO"
+
+
+def create_aggregate_tables(conn):
+    """
+    Creates the materialized liquidation tables and the snapshot time index.
+
+    Parameters:
+        conn (sqlite3.Connection): Open connection to the database.
+    """
+    conn.execute(f"""CREATE TABLE IF NOT EXISTS {LATEST_TABLE} (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            Timestamp TEXT,
+            total REAL,
+            long_short_ratio REAL,
+            short_long_ratio REAL,
+            long REAL,
+            short REAL,
+            exchanges TEXT
+        )""")
+    conn.execute(f"""CREATE TABLE IF NOT EXISTS {EXCHANGES_TABLE} (
+            Grupo TEXT PRIMARY KEY,
+            Timestamp TEXT,
+            total REAL,
+            long REAL,
+            short REAL,
+            long_short_ratio REAL,
+            share REAL,
+            snapshots INTEGER,
+            total_sum REAL
+        )""")
+    table_exists = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?",
+        (SNAPSHOTS_TABLE,),
+    ).fetchone()
+    if table_exists:
+        conn.execute(
+            f"CREATE INDEX IF NOT EXISTS idx_{SNAPSHOTS_TABLE}_timestamp "
+            f"ON {SNAPSHOTS_TABLE} (Timestamp)"
+        )
+
+
+def update_liquidation_aggregates(metrics, conn):
+    """
+    Refreshes the latest snapshot row and the per-exchange aggregates.
+
+    Called by the scraper right after a snapshot is appended, so the dashboard never
+    has to scan or parse the snapshot history.
+
+    Parameters:
+        metrics (pd.DataFrame): Numeric metrics of one snapshot, one row per group,
+            as returned by compute_liquidation_metrics.
+        conn (sqlite3.Connection): Open connection to the database.
+    """
+    create_aggregate_tables(conn)
+    todo = metrics[metrics["Grupo"] == AGGREGATE_GROUP].iloc[0]
+    exchanges = metrics[metrics["Grupo"] != AGGREGATE_GROUP]
+    timestamp = str(todo["Timestamp"])
+
+    exchange_shares = [
+        {"Grupo": row["Grupo"], "share": float(row["%_Exchanges"])}
+        for _, row in exchanges.iterrows()
+    ]
+    conn.execute(
+        f"INSERT OR REPLACE INTO {LATEST_TABLE} VALUES (1, ?, ?, ?, ?, ?, ?, ?)",
+        (
+            timestamp,
+            float(todo["Total_liquidations/1000"]),
+            float(todo["Long/Short Ratio"]),
+            float(todo["Short/Long Ratio"]),
+            float(todo["Long Liquidations"]),
+            float(todo["Short Liquidations"]),
+            json.dumps(exchange_shares),
+        ),
+    )
+    conn.executemany(
+        f"""INSERT INTO {EXCHANGES_TABLE} VALUES (?, ?, ?, ?, ?, ?, ?, 1, ?)
+        ON CONFLICT (Grupo) DO UPDATE SET
+            Timestamp = excluded.Timestamp,
+            total = excluded.total,
+            long = excluded.long,
+            short = excluded.short,
+            long_short_ratio = excluded.long_short_ratio,
+            share = excluded.share,
+            snapshots = snapshots + 1,
+            total_sum = total_sum + excluded.total_sum""",
+        [
+            (
+                row["Grupo"],
+                timestamp,
+                float(row["Total_liquidations/1000"]),
+                float(row["Long Liquidations"]),
+                float(row["Short Liquidations"]),
+                float(row["Long/Short Ratio"]),
+                float(row["%_Exchanges"]),
+                float(row["Total_liquidations/1000"]),
+            )
+            for _, row in metrics.iterrows()
+        ],
+    )
+    conn.commit()
+    for table_name in (SNAPSHOTS_TABLE, LATEST_TABLE, EXCHANGES_TABLE):
+        bump_write_version(conn, table_name)
+    # The latest snapshot always lives in rowid 1, the exchange rows are upserted
+    publish_change(conn, LATEST_TABLE, "append", 1, 1)
+    publish_change(conn, EXCHANGES_TABLE, "replace")
+    logging.info(f"Liquidation aggregates updated for snapshot {timestamp}.")
+
+
+def load_latest_snapshot(db_path):
+    """
+    Reads the latest liquidation snapshot with a single primary-key lookup.
+
+    Parameters:
+        db_path (str): Path to the SQLite database.
+
+    Returns:
+        dict or None: The snapshot metrics, with 'exchanges' as a list of
+            {"Grupo", "share"} dicts, or None if no snapshot has been stored.
+    """
+    with closing(sqlite3.connect(db_path)) as conn:
+        conn.row_factory = sqlite3.Row
+        try:
+            row = conn.execute(f"SELECT * FROM {LATEST_TABLE} WHERE id = 1").fetchone()
+        except sqlite3.OperationalError as e:
+            logging.error(f"Could not read {LATEST_TABLE}: {e}")
+            return None
+    if row is None:
+        return None
+    snapshot = dict(row)
+    snapshot["exchanges"] = json.loads(snapshot["exchanges"])
+    return snapshot
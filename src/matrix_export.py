@@ -0,0 +1,180 @@
+import json
+import logging
+import os
+import shutil
+from datetime import datetime, timezone
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from utils.utils import SQLiteDB, read_write_version
+from utils.instrumentation import timed
+from src.time_features import to_epoch_seconds
+from src.targets import LABELS_TABLE, load_labels
+from src.knn_model import NON_FEATURE_COLUMNS
+
+EXPORT_DIR = "matrices"
+SCHEMA_FILE = "schema.json"
+FEATURES_FILE = "features.npy"
+LABELS_FILE = "labels.npy"
+TIME_FILE = "time.npy"
+
+
+def _write_npy(path, frame, dtype):
+    """Writes a frame as a C-ordered .npy file, one column at a time."""
+    matrix = np.lib.format.open_memmap(
+        path, mode="w+", dtype=dtype, shape=(len(frame), len(frame.columns))
+    )
+    for i, col in enumerate(frame.columns):
+        matrix[:, i] = pd.to_numeric(frame[col], errors="coerce").to_numpy(
+            dtype=dtype, na_value=np.nan
+        )
+    matrix.flush()
+    del matrix
+
+
+@timed("export.matrices")
+def export_matrices(
+    db_path="BTC_data.db",
+    features_table="KNN_data",
+    out_dir=None,
+    horizons=None,
+    force=False,
+):
+    """
+    Writes the feature and label matrices as .npy files with a JSON schema sidecar.
+
+    features.npy holds every feature column as float32, labels.npy the label columns
+    of the features table plus the multi-horizon labels (NaN where a bar has none),
+    and time.npy the int64 epoch seconds of each row. Nothing is written when
+    neither the source tables nor the parameters changed since the last export.
+
+    Parameters:
+        db_path (str): SQLite database holding the features and labels.
+        features_table (str): Features table, one row per bar.
+        out_dir (str): Output directory. Default is matrices/<features_table>.
+        horizons (list): Label horizons to include. Default is every stored one.
+        force (bool): Export even if the sources are unchanged.
+
+    Returns:
+        str: The output directory.
+    """
+    out_dir = Path(out_dir or Path(EXPORT_DIR) / features_table)
+    source = {
+        "db_path": str(db_path),
+        "features_table": features_table,
+        "horizons": sorted(horizons) if horizons is not None else None,
+    }
+    with SQLiteDB(db_path) as db:
+        version = read_write_version(db.conn, [features_table, LABELS_TABLE])
+        schema_path = out_dir / SCHEMA_FILE
+        # Checked before the table is read, so an unchanged export costs no parsing
+        if not force and version and schema_path.exists():
+            with open(schema_path) as schema_file:
+                previous = json.load(schema_file)
+            if (
+                previous.get("source_version") == version
+                and previous.get("source") == source
+            ):
+                logging.info(f"{out_dir} is up to date.")
+                return str(out_dir)
+
+        has_labels = db.conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE name = ?", (LABELS_TABLE,)
+        ).fetchone()
+        df = db.select(features_table, order_by="time")
+    if df is None:
+        raise ValueError(f"Table {features_table} could not be read from {db_path}")
+
+    df = df.set_index("time")
+    label_columns = [c for c in NON_FEATURE_COLUMNS if c in df.columns]
+    features = df.drop(columns=label_columns + ["index"], errors="ignore")
+    labels = df[label_columns]
+    if has_labels:
+        labels = labels.join(load_labels(db_path, horizons))
+
+    # Write next to the destination and swap, so readers never see a partial export
+    tmp_dir = out_dir.with_name(out_dir.name + ".tmp")
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    tmp_dir.mkdir(parents=True)
+    _write_npy(tmp_dir / FEATURES_FILE, features, np.float32)
+    _write_npy(tmp_dir / LABELS_FILE, labels, np.float32)
+    np.save(tmp_dir / TIME_FILE, to_epoch_seconds(pd.to_datetime(df.index)))
+    schema = {
+        "rows": len(df),
+        "features": {"file": FEATURES_FILE, "dtype": "float32"},
+        "feature_columns": list(features.columns),
+        "labels": {"file": LABELS_FILE, "dtype": "float32"},
+        "label_columns": list(labels.columns),
+        "time": {"file": TIME_FILE, "dtype": "int64", "unit": "s"},
+        "source": source,
+        "source_version": version,
+        "exported_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+    }
+    with open(tmp_dir / SCHEMA_FILE, "w") as schema_file:
+        json.dump(schema, schema_file, indent=2)
+
+    old_dir = out_dir.with_name(out_dir.name + ".old")
+    shutil.rmtree(old_dir, ignore_errors=True)
+    if out_dir.exists():
+        os.replace(out_dir, old_dir)
+    os.replace(tmp_dir, out_dir)
+    shutil.rmtree(old_dir, ignore_errors=True)
+    logging.info(
+        f"Exported {len(df)} rows, {features.shape[1]} features and "
+        f"{labels.shape[1]} labels to {out_dir}."
+    )
+    return str(out_dir)
+
+
+def open_matrices(out_dir, mmap_mode="r"):
+    """
+    Opens an export without parsing: the arrays are memory-mapped views of the files,
+    so every process reading them shares the same page cache.
+
+    Parameters:
+        out_dir (str): Directory written by export_matrices.
+        mmap_mode (str): np.load mmap mode, 'r' for read-only.
+
+    Returns:
+        dict: 'features', 'labels' and 'time' arrays and the 'schema' dict.
+    """
+    out_dir = Path(out_dir)
+    with open(out_dir / SCHEMA_FILE) as schema_file:
+        schema = json.load(schema_file)
+    matrices = {
+        name: np.load(out_dir / schema[name]["file"], mmap_mode=mmap_mode)
+        for name in ("features", "labels", "time")
+    }
+    matrices["schema"] = schema
+    return matrices
+
+
+def matrices_as_frames(out_dir):
+    """
+    Wraps an export in DataFrames indexed by time, without copying the matrices.
+
+    Returns:
+        tuple: (features DataFrame, labels DataFrame).
+    """
+    matrices = open_matrices(out_dir)
+    index = pd.to_datetime(matrices["time"], unit="s").rename("time")
+    features = pd.DataFrame(
+        matrices["features"],
+        index=index,
+        columns=matrices["schema"]["feature_columns"],
+        copy=False,
+    )
+    labels = pd.DataFrame(
+        matrices["labels"],
+        index=index,
+        columns=matrices["schema"]["label_columns"],
+        copy=False,
+    )
+    return features, labels
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    export_matrices()
@@ -0,0 +1,171 @@
+import json
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+from typing import NamedTuple
+
+from src.raw_processed_db import run_raw_processing
+from src.knn_data_v1 import main_logic
+
+RAW_DATA_DIR = "raw_data"
+STORE_DIR = "data_store"
+UNIVERSE_FILE = "universe.json"
+
+# Partitions refreshed when no universe file is present
+DEFAULT_UNIVERSE = [
+    {"symbol": "BTC", "exchange": "BYBIT", "timeframe": "15m"},
+]
+
+
+class PartitionKey(NamedTuple):
+    """Identifies one series of bars: a symbol traded on an exchange at a timeframe."""
+
+    symbol: str
+    exchange: str
+    timeframe: str
+
+    @property
+    def name(self):
+        return f"{self.exchange}_{self.symbol}_{self.timeframe}"
+
+    @property
+    def raw_path(self):
+        """Raw export for the partition, e.g. raw_data/BYBIT_BTC_15m_DATA.csv."""
+        path = Path(RAW_DATA_DIR) / f"{self.name}_DATA.csv"
+        legacy_path = Path(RAW_DATA_DIR) / f"{self.exchange}_{self.symbol}_DATA.csv"
+        if not path.exists() and legacy_path.exists():
+            return str(legacy_path)
+        return str(path)
+
+    @property
+    def db_path(self):
+        """One SQLite file per partition, grouped by exchange."""
+        return str(
+            Path(STORE_DIR) / self.exchange / f"{self.symbol}_{self.timeframe}.db"
+        )
+
+    @property
+    def bars_table(self):
+        return f"{self.symbol}_data"
+
+    @property
+    def features_table(self):
+        return "KNN_data"
+
+
+def load_universe(path=UNIVERSE_FILE):
+    """
+    Loads the list of partitions to refresh.
+
+    Parameters:
+        path (str): JSON file holding a list of {"symbol", "exchange", "timeframe"}
+            objects. DEFAULT_UNIVERSE is used if the file does not exist.
+
+    Returns:
+        list[PartitionKey]: The partitions of the universe.
+    """
+    entries = DEFAULT_UNIVERSE
+    if os.path.exists(path):
+        with open(path) as universe_file:
+            entries = json.load(universe_file)
+    return [
+        PartitionKey(
+            entry["symbol"].upper(), entry["exchange"].upper(), entry["timeframe"]
+        )
+        for entry in entries
+    ]
+
+
+def ingest_partition(key, gap_policy="drop"):
+    """
+    Runs raw processing for one partition.
+
+    Parameters:
+        key (PartitionKey): The partition to refresh.
+        gap_policy (str): How missing bars are handled, 'drop' or 'fill'.
+
+    Returns:
+        tuple: (key, number of bars written, or None on failure).
+    """
+    Path(key.db_path).parent.mkdir(parents=True, exist_ok=True)
+    bars = run_raw_processing(key.raw_path, key.db_path, key.bars_table, gap_policy)
+    return key, None if bars is None else len(bars)
+
+
+def features_partition(key):
+    """
+    Runs the KNN feature build for one partition from its stored bars.
+
+    Parameters:
+        key (PartitionKey): The partition to refresh.
+
+    Returns:
+        tuple: (key, number of feature rows written, or None on failure).
+    """
+    features = main_logic(key.db_path, key.bars_table, key.features_table)
+    return key, None if features is None else len(features)
+
+
+def process_partition(key):
+    """
+    Runs raw processing and the KNN feature build for one partition.
+
+    Parameters:
+        key (PartitionKey): The partition to refresh.
+
+    Returns:
+        tuple: (key, number of feature rows written, or None on failure).
+    """
+    if ingest_partition(key)[1] is None:
+        return key, None
+    return features_partition(key)
+
+
+def run_universe(keys=None, workers=None, task=process_partition):
+    """
+    Refreshes every partition of the universe in parallel, one process per partition.
+
+    Parameters:
+        keys (list[PartitionKey]): Partitions to refresh. Default is load_universe().
+        workers (int): Number of worker processes. Default is the number of cores.
+        task (callable): Module-level function run on each key, returning (key, rows).
+            Default runs every stage, see ingest_partition and features_partition.
+
+    Returns:
+        dict: PartitionKey -> number of feature rows written (None on failure).
+    """
+    if keys is None:
+        keys = load_universe()
+    workers = min(workers or os.cpu_count() or 1, len(keys)) or 1
+    logging.info(f"Refreshing {len(keys)} partitions with {workers} workers.")
+
+    results = {}
+    if workers == 1:
+        for key in keys:
+            try:
+                rows = task(key)[1]
+            except Exception as e:
+                logging.error(f"Partition {key.name} failed: {e}")
+                rows = None
+            results[key] = rows
+            logging.info(f"Partition {key.name} refreshed: {rows} rows.")
+        return results
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(task, key): key for key in keys}
+        for future in as_completed(futures):
+            key = futures[future]
+            try:
+                rows = future.result()[1]
+            except Exception as e:
+                logging.error(f"Partition {key.name} failed: {e}")
+                rows = None
+            results[key] = rows
+            logging.info(f"Partition {key.name} refreshed: {rows} rows.")
+    return results
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    run_universe()
@@ -0,0 +1,137 @@
+import logging
+import sqlite3
+import time
+from contextlib import closing, contextmanager
+
+import pandas as pd
+
+# Append-only log of committed changes, read by subscribers in sequence order
+CHANGE_LOG_TABLE = "_change_log"
+
+
+def _create_change_log(conn):
+    conn.execute(f"""CREATE TABLE IF NOT EXISTS {CHANGE_LOG_TABLE} (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            table_name TEXT NOT NULL,
+            kind TEXT NOT NULL,
+            first_rowid INTEGER,
+            last_rowid INTEGER,
+            created REAL NOT NULL
+        )""")
+
+
+def _max_rowid(conn, table_name):
+    try:
+        return conn.execute(f"SELECT MAX(rowid) FROM {table_name}").fetchone()[0] or 0
+    except sqlite3.OperationalError:
+        return 0
+
+
+def publish_change(conn, table_name, kind, first_rowid=None, last_rowid=None):
+    """
+    Publishes a change event for subscribers and commits it.
+
+    Parameters:
+        conn (sqlite3.Connection): Open connection to the database.
+        table_name (str): The table that changed.
+        kind (str): 'append' when rows first_rowid..last_rowid were added or
+            updated, 'replace' when the whole table was rewritten.
+        first_rowid (int): First changed rowid, for 'append' events.
+        last_rowid (int): Last changed rowid, for 'append' events.
+    """
+    _create_change_log(conn)
+    conn.execute(
+        f"INSERT INTO {CHANGE_LOG_TABLE} "
+        "(table_name, kind, first_rowid, last_rowid, created) VALUES (?, ?, ?, ?, ?)",
+        (table_name, kind, first_rowid, last_rowid, time.time()),
+    )
+    conn.commit()
+
+
+@contextmanager
+def publish_appends(conn, table_name):
+    """
+    Publishes the rows a block of code appends to a table.
+
+    Rows written with INSERT or INSERT OR REPLACE get rowids above the previous
+    maximum, so the event points subscribers at exactly the new or updated rows.
+
+    Parameters:
+        conn (sqlite3.Connection): Open connection to the database.
+        table_name (str): The table being written to.
+    """
+    before = _max_rowid(conn, table_name)
+    yield
+    after = _max_rowid(conn, table_name)
+    if after > before:
+        publish_change(conn, table_name, "append", before + 1, after)
+
+
+class ChangeSubscriber:
+    """
+    Follows the change log of a database and returns only the rows that changed.
+
+    A subscriber starts at the current end of the log, so it only sees changes
+    published after it was created.
+    """
+
+    def __init__(self, db_path, tables=None):
+        """
+        Parameters:
+            db_path (str): Path to the SQLite database.
+            tables (list): Tables to follow. Default is every table.
+        """
+        self.db_path = db_path
+        self.tables = set(tables) if tables else None
+        with closing(sqlite3.connect(db_path)) as conn:
+            _create_change_log(conn)
+            self.last_seq = (
+                conn.execute(f"SELECT MAX(seq) FROM {CHANGE_LOG_TABLE}").fetchone()[0]
+                or 0
+            )
+
+    def poll(self):
+        """
+        Fetches the changes published since the last poll.
+
+        Returns:
+            list: (table_name, kind, rows) tuples in publish order. rows is a DataFrame
+                of the appended rows, or None for 'replace' events.
+        """
+        changes = []
+        with closing(sqlite3.connect(self.db_path)) as conn:
+            events = conn.execute(
+                f"SELECT seq, table_name, kind, first_rowid, last_rowid "
+                f"FROM {CHANGE_LOG_TABLE} WHERE seq > ? ORDER BY seq",
+                (self.last_seq,),
+            ).fetchall()
+            for seq, table_name, kind, first_rowid, last_rowid in events:
+                self.last_seq = seq
+                if self.tables is not None and table_name not in self.tables:
+                    continue
+                rows = None
+                if kind == "append":
+                    rows = pd.read_sql_query(
+                        f"SELECT * FROM {table_name} WHERE rowid BETWEEN ? AND ?",
+                        conn,
+                        params=(first_rowid, last_rowid),
+                    )
+                changes.append((table_name, kind, rows))
+        return changes
+
+    def listen(self, callback, interval=1.0, stop=None):
+        """
+        Calls callback(table_name, kind, rows) for every change as it is published.
+
+        Parameters:
+            callback (Callable): Receives each change.
+            interval (float): Seconds between checks of the change log.
+            stop (threading.Event): Optional event that ends the loop when set.
+        """
+        while stop is None or not stop.is_set():
+            for change in self.poll():
+                try:
+                    callback(*change)
+                except Exception as e:
+                    logging.error(f"Change subscriber callback failed: {e}")
+            time.sleep(interval)
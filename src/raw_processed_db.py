@@ -1,13 +1,28 @@
 import sys
 from utils.utils import (
     save_to_csv,
-    read_csv_to_dataframe,
+    read_csv_with_schema,
     SQLiteDB,
-    round_decimals,
+    bump_write_version,
+    get_writer,
 )
 import pandas as pd
 import os
+import re
 import logging
+from functools import lru_cache
+from src.time_features import add_time_features
+from src.indicators import add_missing_indicators
+from src.resample import update_rollups
+from src.targets import update_labels
+from src.pubsub import publish_change
+from src.data_quality import (
+    clean_bars,
+    move_checkpoint,
+    next_bar_close,
+    validate_new_bars,
+)
+from utils.instrumentation import stage, table_bytes
 
 logging.basicConfig(level=logging.INFO)
 
@@ -26,6 +41,12 @@ COLUMN_SHORTEN_MAPPING = {
     "leading_span_a": "leadingspan1",
     "leading_span_b": "leadingspan2",
 }
+_SHORTEN_PATTERN = re.compile(
+    "^(" + "|".join(re.escape(prefix) for prefix in COLUMN_SHORTEN_MAPPING) + ")"
+)
+# Columns needed to compute the indicators natively when the export lacks them
+OHLCV_COLUMNS = ["time", "open", "high", "low", "close", "volume"]
+
 # Columns to keep
 columns_we_trust = [
     "time",
@@ -56,6 +77,16 @@ columns_we_trust = [
     "target_close",
 ]
 
+# Dtypes the raw export is parsed with; target_close is derived, not read
+RAW_SCHEMA = {
+    "time": "int64",
+    **{
+        col: "float32"
+        for col in columns_we_trust
+        if col not in ("time", "target_close")
+    },
+}
+
 
 def drop_columns_if_present(df, columns_to_drop=None):
     """
@@ -93,10 +124,38 @@ def shorten_column_name(col_name):
     Returns:
         str: The shortened column name.
     """
-    for key, value in COLUMN_SHORTEN_MAPPING.items():
-        if col_name.startswith(key):
-            return value + col_name[len(key) :]
-    return col_name
+    match = _SHORTEN_PATTERN.match(col_name)
+    if match is None:
+        return col_name
+    return COLUMN_SHORTEN_MAPPING[match.group(1)] + col_name[match.end() :]
+
+
+@lru_cache(maxsize=None)
+def canonical_column_name(raw_name):
+    """
+    Resolves a raw export header, e.g. 'Upper Band #1', to its canonical name.
+
+    Parameters:
+        raw_name (str): The header as exported by TradingView.
+
+    Returns:
+        str: The canonical column name, e.g. 'upper_b1'.
+    """
+    name = raw_name.lower().replace(" ", "_").replace("#", "").replace(".", "_")
+    return shorten_column_name(name)
+
+
+def read_raw_export(file_path):
+    """
+    Reads the RAW_SCHEMA columns of a raw export with canonical names.
+
+    Parameters:
+        file_path (str): Path to the raw CSV export.
+
+    Returns:
+        pd.DataFrame or None: The raw bars, or None if the file could not be read.
+    """
+    return read_csv_with_schema(file_path, RAW_SCHEMA, canonical_column_name)
 
 
 def filter_and_dropna(df, columns_to_keep=None):
@@ -117,81 +176,140 @@ def filter_and_dropna(df, columns_to_keep=None):
     return df.dropna()
 
 
-def preprocess_data(raw_data, columns_to_keep=None):
+def preprocess_data(raw_data, columns_to_keep=None, gap_policy="drop"):
     """
     Preprocesses raw trading data for further analysis.
 
     Parameters:
         raw_data (pd.DataFrame): The raw trading data.
         columns_to_keep (list): A list of column names to keep during preprocessing.
+        gap_policy (str): 'drop' drops the bars whose next bar is missing, 'fill'
+            inserts flat candles for the missing bars. See src.data_quality.
 
     Returns:
-        pd.DataFrame: A DataFrame containing the processed data.
+        pd.DataFrame: A DataFrame containing the processed data. Indicator columns
+            missing from the raw export are computed from OHLCV.
     """
-    data = raw_data.copy()
+    data = clean_bars(raw_data.copy(), gap_policy)
+    data["target_close"] = next_bar_close(data["time"], data["close"])
     data["time"] = pd.to_datetime(data["time"], unit="s")
-    data["target_close"] = data["close"].shift(-1)
-    data.columns = [
-        col.lower().replace(" ", "_").replace("#", "").replace(".", "_")
-        for col in data.columns
-    ]
-    data.columns = [shorten_column_name(col) for col in data.columns]
+    data.columns = [canonical_column_name(col) for col in data.columns]
     data = drop_columns_if_present(data)
+    if set(OHLCV_COLUMNS).issubset(data.columns):
+        data = add_missing_indicators(data)
     data = filter_and_dropna(data, columns_to_keep)
     return data
 
 
-def feature_engineering(df):
-    df["time"] = pd.to_datetime(df["time"])
-    df["hour"] = df["time"].dt.hour
-    df["day_of_week"] = df["time"].dt.dayofweek
-    df["USA_open"] = (df["hour"] >= 9) & (df["hour"] < 17)
-    df["EU_open"] = (df["hour"] >= 8) & (df["hour"] < 16)
-    df["ASIA_open"] = (df["hour"] >= 1) & (df["hour"] < 9)
-    return df
+def feature_engineering(df, sessions=None):
+    """
+    Adds the hour, day of week and trading session features.
+
+    Parameters:
+        df (pd.DataFrame): Preprocessed data with a datetime64 'time' column.
+        sessions (dict): Session calendars, see src.time_features.DEFAULT_SESSIONS.
 
+    Returns:
+        pd.DataFrame: The DataFrame with the time features appended.
+    """
+    return add_time_features(df, time_column="time", sessions=sessions)
 
-def run_raw_processing():
-    logging.info("Starting the preprocessing.")
+
+def save_bars(conn, df, table_name, checked_until=None):
+    """
+    Replaces the bars table and publishes the change, as one SQLiteWriter job.
+
+    With checked_until the quality checkpoint is moved in the same transaction, so
+    bars only count as validated once they are stored.
+    """
+    df.to_sql(table_name, conn, if_exists="replace")
+    if checked_until is not None:
+        move_checkpoint(conn, table_name, checked_until)
+    bump_write_version(conn, table_name)
+    publish_change(conn, table_name, "replace")
+
+
+def run_raw_processing(
+    input_file_path=INPUT_FILE_PATH,
+    db_file_path="BTC_data.db",
+    table_name="BTC_data",
+    gap_policy="drop",
+):
+    """
+    Reads a raw export, preprocesses it and stores the bars in SQLite.
+
+    Parameters:
+        input_file_path (str): Path to the raw CSV export.
+        db_file_path (str): SQLite database the bars are written to.
+        table_name (str): Name of the bars table.
+        gap_policy (str): How missing bars are handled, 'drop' or 'fill'.
+
+    Returns:
+        pd.DataFrame or None: The stored bars, or None if the raw data could not be read.
+    """
+    logging.info(f"Starting the preprocessing of {input_file_path}.")
 
     logging.info("Reading the raw data from a CSV file.")
-    df = read_csv_to_dataframe(INPUT_FILE_PATH)
+    with stage("raw.read_csv") as record:
+        df = read_raw_export(input_file_path)
+        record.rows_out = None if df is None else len(df)
     if df is not None:
         logging.info("Successfully read the raw data.")
     else:
         logging.error("Failed to read the raw data.")
+        return None
+
+    logging.info("Checking the new bars for gaps, duplicates and outliers.")
+    with stage("raw.validate", rows_in=len(df)) as record:
+        # The checkpoint only moves with the save below
+        issues = validate_new_bars(db_file_path, table_name, df, checkpoint=False)
+        record.extra["issues"] = len(issues)
+    checked_until = int(df["time"].max()) if len(df) else None
 
     logging.info("Starting data preprocessing.")
-    df = preprocess_data(df, columns_to_keep=columns_we_trust)
+    with stage("raw.preprocess", rows_in=len(df)) as record:
+        df = preprocess_data(
+            df, columns_to_keep=columns_we_trust, gap_policy=gap_policy
+        )
+        record.rows_out = len(df)
     logging.info("Data preprocessing completed.")
 
     logging.info("Starting feature engineering.")
-    df = feature_engineering(df)
+    with stage("raw.feature_engineering", rows_in=len(df)) as record:
+        df = feature_engineering(df)
+        record.rows_out = len(df)
     logging.info("Feature engineering completed.")
 
-    logging.info("Rounding numerical variables to 2 decimals.")
-    df = round_decimals(df)
-    logging.info("Rounding completed.")
-
-    logging.info("Saving to SQLite database.")
-    db_file_path = "BTC_data.db"
-    table_name = "BTC_data"
+    # Stored at full precision; dashboards round when showing values, through
+    # utils.formatting
+    logging.info(f"Saving to SQLite database {db_file_path}.")
 
-    # Create a SQLite database saved to disk using context management from SQLiteDB class
-    with SQLiteDB(db_file_path) as db:
+    # Writes go through the database's writer queue, so a scraper running at the same
+    # time is not locked out
+    with stage("raw.save", rows_in=len(df)) as record, SQLiteDB(db_file_path) as db:
         logging.info("Creating table and inserting data.")
-        db.create_table(df, table_name)
+        get_writer(db_file_path).write(save_bars, df, table_name, checked_until)
+        record.rows_out = len(df)
 
         logging.info("Querying to make sure the data has been inserted properly.")
-        query = f"SELECT * FROM {table_name} LIMIT 1;"
-        queried_data = db.query(query)
+        queried_data = db.select(table_name, limit=1)
         if queried_data is not None:
             logging.info("Data successfully inserted into the database.")
             print(queried_data)
         else:
             logging.error("Failed to query the database.")
+        record.bytes_written = table_bytes(db.conn, table_name)
+
+    logging.info("Updating the higher timeframe rollups.")
+    with stage("raw.update_rollups"):
+        update_rollups(db_file_path, table_name)
+
+    logging.info("Updating the multi-horizon labels.")
+    with stage("raw.labels") as record:
+        record.rows_out = update_labels(db_file_path, table_name)
 
     logging.info("Preprocessing and database update completed successfully.")
+    return df
 
 
 if __name__ == "__main__":
@@ -0,0 +1,166 @@
+import logging
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+
+from utils.utils import SQLiteDB
+from src.time_features import to_epoch_seconds
+from src.pubsub import publish_appends
+
+# Rollup timeframes and their bucket length in seconds
+TIMEFRAMES = {
+    "5m": 300,
+    "15m": 900,
+    "1h": 3600,
+    "4h": 14400,
+    "1d": 86400,
+}
+OHLCV_COLUMNS = ["open", "high", "low", "close", "volume"]
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+def rollup_table_name(base_table, timeframe):
+    return f"{base_table}_{timeframe}"
+
+
+def resample_ohlcv(df, seconds):
+    """
+    Aggregates sorted OHLCV bars into buckets of a higher timeframe.
+
+    Parameters:
+        df (pd.DataFrame): Bars sorted by time with 'time' and OHLCV columns.
+        seconds (int): Bucket length in seconds.
+
+    Returns:
+        pd.DataFrame: One row per bucket with 'time' (bucket start, epoch seconds),
+            OHLCV columns and 'bars', the number of base bars in the bucket.
+    """
+    epoch_seconds = to_epoch_seconds(df["time"])
+    if len(epoch_seconds) == 0:
+        return pd.DataFrame(columns=["time"] + OHLCV_COLUMNS + ["bars"])
+    buckets = epoch_seconds - epoch_seconds % seconds
+    starts = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]])
+    ends = np.r_[starts[1:], len(buckets)] - 1
+    return pd.DataFrame(
+        {
+            "time": buckets[starts],
+            "open": df["open"].to_numpy()[starts],
+            "high": np.maximum.reduceat(df["high"].to_numpy(), starts),
+            "low": np.minimum.reduceat(df["low"].to_numpy(), starts),
+            "close": df["close"].to_numpy()[ends],
+            "volume": np.add.reduceat(df["volume"].to_numpy(), starts),
+            "bars": np.diff(np.r_[starts, len(buckets)]),
+        }
+    )
+
+
+def base_timeframe_seconds(epoch_seconds):
+    """Returns the most common spacing between consecutive bars, in seconds."""
+    if len(epoch_seconds) < 2:
+        return None
+    spacing, counts = np.unique(np.diff(epoch_seconds), return_counts=True)
+    return int(spacing[np.argmax(counts)])
+
+
+def _format_time(epoch_seconds):
+    return datetime.fromtimestamp(int(epoch_seconds), tz=timezone.utc).strftime(
+        TIME_FORMAT
+    )
+
+
+def _create_rollup_table(db, table_name):
+    db.conn.execute(f"""CREATE TABLE IF NOT EXISTS {table_name} (
+            time TEXT PRIMARY KEY,
+            open REAL,
+            high REAL,
+            low REAL,
+            close REAL,
+            volume REAL,
+            bars INTEGER
+        )""")
+
+
+def update_rollups(db_path, base_table="BTC_data", timeframes=None):
+    """
+    Brings the materialized rollup tables up to date with the base bars.
+
+    Only the last, possibly incomplete, bucket of each rollup and the buckets after
+    it are recomputed, so the cost is proportional to the number of new base bars.
+
+    Parameters:
+        db_path (str): SQLite database holding the base table.
+        base_table (str): Name of the base bars table. Default is 'BTC_data'.
+        timeframes (list): Timeframes to maintain. Default is every key of TIMEFRAMES
+            coarser than the base bars.
+
+    Returns:
+        dict: Timeframe -> number of rollup rows written.
+    """
+    written = {}
+    with SQLiteDB(db_path) as db:
+        sample = db.select(base_table, ["time"], order_by="time", limit=1000)
+        if sample is None or sample.empty:
+            logging.error(f"No base bars found in {base_table}.")
+            return written
+        base_seconds = base_timeframe_seconds(to_epoch_seconds(sample["time"]))
+        if timeframes is None:
+            timeframes = list(TIMEFRAMES)
+
+        for timeframe in timeframes:
+            seconds = TIMEFRAMES[timeframe]
+            if base_seconds is not None and seconds <= base_seconds:
+                continue
+            table_name = rollup_table_name(base_table, timeframe)
+            _create_rollup_table(db, table_name)
+
+            last = db.conn.execute(f"SELECT MAX(time) FROM {table_name}").fetchone()[0]
+            bars = db.select(
+                base_table, ["time"] + OHLCV_COLUMNS, start=last, order_by="time"
+            )
+            rollup = resample_ohlcv(bars, seconds)
+            rollup["time"] = [_format_time(ts) for ts in rollup["time"]]
+
+            with publish_appends(db.conn, table_name):
+                db.conn.executemany(
+                    f"INSERT OR REPLACE INTO {table_name} VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    rollup.itertuples(index=False, name=None),
+                )
+                db.conn.commit()
+            db.bump_write_version(table_name)
+            written[timeframe] = len(rollup)
+            logging.info(f"Rollup {table_name} updated with {len(rollup)} rows.")
+    return written
+
+
+def load_bars(db_path, timeframe=None, base_table="BTC_data", start=None, end=None):
+    """
+    Serves OHLCV bars at the requested timeframe from the materialized rollups.
+
+    Parameters:
+        db_path (str): SQLite database holding the bars.
+        timeframe (str): A key of TIMEFRAMES, or None for the base bars.
+        base_table (str): Name of the base bars table. Default is 'BTC_data'.
+        start (str): Optional inclusive lower bound on time ('YYYY-MM-DD HH:MM:SS').
+        end (str): Optional exclusive upper bound on time.
+
+    Returns:
+        pd.DataFrame or None: Bars with a datetime 'time' column and OHLCV columns.
+    """
+    table_name = (
+        base_table if timeframe is None else rollup_table_name(base_table, timeframe)
+    )
+    with SQLiteDB(db_path) as db:
+        df = db.select(
+            table_name, ["time"] + OHLCV_COLUMNS, start, end, order_by="time"
+        )
+    if df is None:
+        logging.error(f"Could not load bars from {table_name}.")
+        return None
+    df["time"] = pd.to_datetime(df["time"])
+    return df
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    update_rollups("BTC_data.db")
@@ -0,0 +1,307 @@
+import logging
+import os
+import sqlite3
+import time
+from contextlib import closing
+
+import numpy as np
+import pandas as pd
+
+from utils.utils import archive_dir, bump_write_version, connect, get_writer
+from utils.instrumentation import METRICS_TABLE, stage
+from src.backfill import ENDPOINTS, history_table_name
+from src.liquidations import SNAPSHOTS_TABLE
+from src.pubsub import CHANGE_LOG_TABLE
+from src.resample import TIMEFRAMES, TIME_FORMAT
+from src.time_features import to_epoch_seconds
+
+# Table -> retention policy:
+#   time_column: column the age of a row is read from
+#   time_unit:   'text' for UTC 'YYYY-MM-DD HH:MM:SS' strings, 's' for epoch seconds
+#   hot_days:    rows older than this leave the table
+#   rollup:      (timeframe, key columns) to keep the last row of each key in each
+#                bucket in <table>_<timeframe> before the rows leave, or None
+#   archive:     write the rows to the compressed archive, or just delete them
+# The bars tables are not listed: ingestion rebuilds them from the raw export and
+# update_rollups already keeps their higher timeframes.
+RETENTION_POLICIES = {
+    SNAPSHOTS_TABLE: {
+        "time_column": "Timestamp",
+        "time_unit": "text",
+        "hot_days": 30,
+        "rollup": ("1d", ["Grupo"]),
+        "archive": True,
+    },
+    **{
+        history_table_name(endpoint): {
+            "time_column": "t",
+            "time_unit": "s",
+            "hot_days": 365,
+            "rollup": None,
+            "archive": True,
+        }
+        for endpoint in ENDPOINTS
+    },
+    METRICS_TABLE: {
+        "time_column": "started",
+        "time_unit": "s",
+        "hot_days": 90,
+        "rollup": None,
+        "archive": True,
+    },
+    CHANGE_LOG_TABLE: {
+        "time_column": "created",
+        "time_unit": "s",
+        "hot_days": 7,
+        "rollup": None,
+        "archive": False,
+    },
+}
+
+MAINTENANCE_TABLE = "_maintenance"
+# Days between two runs of each maintenance task
+ANALYZE_EVERY_DAYS = 1
+VACUUM_EVERY_DAYS = 7
+# VACUUM only pays off once this share of the file is free pages
+VACUUM_MIN_FREE_FRACTION = 0.1
+
+
+# Text times are UTC, as every writer stamps them (the scraper included), so both
+# directions go through pandas' naive-as-UTC conversion and never the local clock
+def _to_epoch(values, time_unit):
+    if time_unit == "text":
+        return to_epoch_seconds(values)
+    return pd.to_numeric(values).to_numpy().astype(np.int64)
+
+
+def _from_epoch(epoch_seconds, time_unit):
+    if time_unit == "text":
+        return pd.to_datetime(epoch_seconds, unit="s").strftime(TIME_FORMAT)
+    return epoch_seconds
+
+
+def cutoff_time(policy, now=None):
+    """
+    Time before which rows of a table are cold, in the table's own time format.
+
+    With a rollup the cutoff is moved back to a bucket start, so only complete buckets
+    are rolled up.
+
+    Parameters:
+        policy (dict): A value of RETENTION_POLICIES.
+        now (float): Current epoch seconds. Default is the clock.
+
+    Returns:
+        str or int: The cutoff.
+    """
+    cutoff = int((now or time.time()) - policy["hot_days"] * 86400)
+    if policy["rollup"]:
+        seconds = TIMEFRAMES[policy["rollup"][0]]
+        cutoff -= cutoff % seconds
+    return _from_epoch(cutoff, policy["time_unit"])
+
+
+def rollup_last(rows, policy):
+    """
+    Keeps the last row of each key in each bucket of the policy's rollup timeframe.
+
+    Parameters:
+        rows (pd.DataFrame): Rows sorted by the policy's time column.
+        policy (dict): A value of RETENTION_POLICIES with a rollup.
+
+    Returns:
+        pd.DataFrame: The downsampled rows.
+    """
+    timeframe, keys = policy["rollup"]
+    epoch = _to_epoch(rows[policy["time_column"]], policy["time_unit"])
+    buckets = epoch - epoch % TIMEFRAMES[timeframe]
+    return rows.groupby([buckets, *keys]).tail(1)
+
+
+def write_archive(db_path, table_name, rows, policy):
+    """
+    Appends rows to the table's archive, one zstd-compressed Parquet file per month.
+
+    A month that is already archived is rewritten with the new rows added, dropping
+    rows archived twice by an interrupted run. Needs pyarrow.
+
+    Parameters:
+        db_path (str): Path to the SQLite database.
+        table_name (str): The table the rows come from.
+        rows (pd.DataFrame): The rows to archive.
+        policy (dict): The table's value of RETENTION_POLICIES.
+
+    Returns:
+        list: Paths of the files written.
+    """
+    directory = archive_dir(db_path, table_name)
+    directory.mkdir(parents=True, exist_ok=True)
+    epoch = _to_epoch(rows[policy["time_column"]], policy["time_unit"])
+    months = pd.to_datetime(epoch, unit="s").strftime("%Y-%m")
+    written = []
+    for month, part in rows.groupby(np.asarray(months)):
+        path = directory / f"{month}.parquet"
+        if path.exists():
+            part = pd.concat([pd.read_parquet(path), part], ignore_index=True)
+            part = part.drop_duplicates()
+        tmp_path = path.with_suffix(".tmp")
+        part.to_parquet(tmp_path, compression="zstd", index=False)
+        os.replace(tmp_path, path)
+        written.append(str(path))
+    return written
+
+
+def _move_rows(conn, table_name, policy, cutoff, last_rowid, rollup):
+    time_column = policy["time_column"]
+    if rollup is not None and len(rollup):
+        rollup_table = f"{table_name}_{policy['rollup'][0]}"
+        rollup.to_sql(rollup_table, conn, if_exists="append", index=False)
+        bump_write_version(conn, rollup_table)
+    deleted = conn.execute(
+        f'DELETE FROM {table_name} WHERE "{time_column}" < ? AND rowid <= ?',
+        (cutoff, last_rowid),
+    ).rowcount
+    bump_write_version(conn, table_name)
+    return deleted
+
+
+def apply_policy(db_path, table_name, policy, now=None):
+    """
+    Rolls up, archives and deletes the cold rows of one table.
+
+    The archive is written before the rows are deleted, and the rollup and the
+    deletion are one transaction of the database's writer, so a failure at any point
+    loses no rows.
+
+    Parameters:
+        db_path (str): Path to the SQLite database.
+        table_name (str): The table.
+        policy (dict): The table's value of RETENTION_POLICIES.
+        now (float): Current epoch seconds. Default is the clock.
+
+    Returns:
+        int: Number of rows removed from the table.
+    """
+    cutoff = cutoff_time(policy, now)
+    time_column = policy["time_column"]
+    with closing(connect(db_path)) as conn:
+        exists = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?",
+            (table_name,),
+        ).fetchone()
+        if not exists:
+            return 0
+        # Rows written after this read, e.g. older pages of a backfill, are left for
+        # the next run instead of being deleted unarchived
+        last_rowid = conn.execute(f"SELECT MAX(rowid) FROM {table_name}").fetchone()[0]
+        cold = pd.read_sql_query(
+            f'SELECT * FROM {table_name} WHERE "{time_column}" < ? AND rowid <= ? '
+            f'ORDER BY "{time_column}"',
+            conn,
+            params=(cutoff, last_rowid),
+        )
+    if cold.empty:
+        return 0
+
+    rollup = rollup_last(cold, policy) if policy["rollup"] else None
+    if policy["archive"]:
+        try:
+            write_archive(db_path, table_name, cold, policy)
+        except ImportError as e:
+            logging.error(f"Not archiving {table_name}, pyarrow is missing: {e}")
+            return 0
+    deleted = get_writer(db_path).write(
+        _move_rows, table_name, policy, cutoff, last_rowid, rollup
+    )
+    logging.info(f"Moved {deleted} rows of {table_name} older than {cutoff}.")
+    return deleted
+
+
+def _last_run(conn, task):
+    conn.execute(
+        f"CREATE TABLE IF NOT EXISTS {MAINTENANCE_TABLE} "
+        "(task TEXT PRIMARY KEY, last_run REAL)"
+    )
+    row = conn.execute(
+        f"SELECT last_run FROM {MAINTENANCE_TABLE} WHERE task = ?", (task,)
+    ).fetchone()
+    return row[0] if row else 0
+
+
+def _mark_run(conn, task, now):
+    conn.execute(
+        f"INSERT OR REPLACE INTO {MAINTENANCE_TABLE} VALUES (?, ?)", (task, now)
+    )
+
+
+def maintain_database(db_path, now=None, force=False):
+    """
+    Runs ANALYZE and VACUUM when they are due.
+
+    ANALYZE runs every ANALYZE_EVERY_DAYS so the planner knows the new table sizes.
+    VACUUM runs every VACUUM_EVERY_DAYS, and only if enough of the file is free pages
+    left by deleted rows.
+
+    Parameters:
+        db_path (str): Path to the SQLite database.
+        now (float): Current epoch seconds. Default is the clock.
+        force (bool): Run both tasks now.
+
+    Returns:
+        list: The tasks that ran.
+    """
+    now = now or time.time()
+    ran = []
+    # VACUUM cannot run inside a transaction, so this connection autocommits
+    with closing(connect(db_path, isolation_level=None)) as conn:
+        if force or now - _last_run(conn, "analyze") >= ANALYZE_EVERY_DAYS * 86400:
+            conn.execute("ANALYZE")
+            _mark_run(conn, "analyze", now)
+            ran.append("analyze")
+
+        pages = conn.execute("PRAGMA page_count").fetchone()[0]
+        free = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        due = now - _last_run(conn, "vacuum") >= VACUUM_EVERY_DAYS * 86400
+        if force or (due and pages and free / pages >= VACUUM_MIN_FREE_FRACTION):
+            try:
+                conn.execute("VACUUM")
+                conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+                _mark_run(conn, "vacuum", now)
+                ran.append("vacuum")
+            except sqlite3.OperationalError as e:
+                logging.warning(f"VACUUM of {db_path} postponed: {e}")
+    if ran:
+        logging.info(f"Maintenance of {db_path}: {', '.join(ran)}.")
+    return ran
+
+
+def run_retention(
+    db_path="BTC_data.db", tables=None, now=None, force_maintenance=False
+):
+    """
+    Applies the retention policies and then the scheduled maintenance of a database.
+
+    Parameters:
+        db_path (str): Path to the SQLite database.
+        tables (list): Tables to process. Default is every table of RETENTION_POLICIES.
+        now (float): Current epoch seconds. Default is the clock.
+        force_maintenance (bool): Run ANALYZE and VACUUM even if they are not due.
+
+    Returns:
+        dict: Table -> number of rows removed.
+    """
+    removed = {}
+    for table_name in tables or RETENTION_POLICIES:
+        with stage(f"retention.{table_name}") as record:
+            removed[table_name] = apply_policy(
+                db_path, table_name, RETENTION_POLICIES[table_name], now
+            )
+            record.rows_out = removed[table_name]
+    with stage("retention.maintenance") as record:
+        record.extra["tasks"] = maintain_database(db_path, now, force_maintenance)
+    return removed
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    print(run_retention())
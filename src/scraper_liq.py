@@ -1,21 +1,24 @@
-from selenium import webdriver
-from selenium.webdriver.common.by import By
 import pandas as pd
 import logging
-from selenium.webdriver.support import expected_conditions as EC
-from datetime import datetime
-import sqlite3
-from contextlib import closing
-from selenium.common.exceptions import NoSuchElementException
-from selenium.webdriver.common.action_chains import ActionChains
+from datetime import datetime, timezone
 import time
-from selenium.webdriver.common.keys import Keys
-
+from utils.utils import get_writer
+from utils.formatting import format_value
+from src.liquidations import update_liquidation_aggregates
+from src.pubsub import publish_appends
+from utils.instrumentation import stage, table_bytes
 
 logging.basicConfig(level=logging.INFO)
 
 
 def initialize_webdriver(url):
+    # Selenium takes a while to import, so only the scraper itself pays for it
+    from selenium import webdriver
+    from selenium.webdriver.common.by import By
+    from selenium.common.exceptions import NoSuchElementException
+    from selenium.webdriver.common.action_chains import ActionChains
+    from selenium.webdriver.common.keys import Keys
+
     try:
         driver = webdriver.Chrome()
         driver.maximize_window()
@@ -45,6 +48,8 @@ def initialize_webdriver(url):
 
 
 def scrape_data(driver, xpath_groups):
+    from selenium.webdriver.common.by import By
+
     data = []
     try:
         for group_name, indices in xpath_groups.items():
@@ -60,7 +65,7 @@ def scrape_data(driver, xpath_groups):
         return None
 
 
-def transform_data(df, current_timestamp):
+def compute_liquidation_metrics(df, current_timestamp):
     try:
         if "Valor" not in df.columns or df["Valor"].isnull().any():
             logging.error("Column 'Valor' is either missing or contains null values.")
@@ -139,24 +144,6 @@ def transform_data(df, current_timestamp):
             new_df["Total_liquidations/1000"] / total_liquidations_TODO * 100
         )
 
-        # Formatting to strings should be the last step
-        new_df["Total_liquidations/1000"] = new_df["Total_liquidations/1000"].apply(
-            lambda x: "{:,.0f}".format(x)
-        )
-        new_df["Long/Short Ratio"] = new_df["Long/Short Ratio"].apply(
-            lambda x: "{:.2f}".format(x)
-        )
-        new_df["Short/Long Ratio"] = new_df["Short/Long Ratio"].apply(
-            lambda x: "{:.2f}".format(x)
-        )
-        new_df["Long Liquidations"] = new_df["Long Liquidations"].apply(
-            lambda x: "{:,.0f}".format(x)
-        )
-        new_df["Short Liquidations"] = new_df["Short Liquidations"].apply(
-            lambda x: "{:,.0f}".format(x)
-        )
-        new_df["%_Exchanges"] = new_df["%_Exchanges"].apply(lambda x: f"{x:.2f}%")
-
         return new_df
 
     except Exception as e:
@@ -164,6 +151,28 @@ def transform_data(df, current_timestamp):
     return None
 
 
+def format_liquidation_metrics(metrics):
+    new_df = metrics.copy()
+    for column in (
+        "Total_liquidations/1000",
+        "Long/Short Ratio",
+        "Short/Long Ratio",
+        "Long Liquidations",
+        "Short Liquidations",
+        "%_Exchanges",
+    ):
+        new_df[column] = new_df[column].apply(format_value, column=column)
+    return new_df
+
+
+def transform_data(df, current_timestamp):
+    new_df = compute_liquidation_metrics(df, current_timestamp)
+    if new_df is None:
+        return None
+    # Formatting to strings should be the last step
+    return format_liquidation_metrics(new_df)
+
+
 def create_sqlite_db(dataframe, table_name, conn):
     try:
         dataframe.to_sql(table_name, conn, if_exists="append")
@@ -171,7 +180,24 @@ def create_sqlite_db(dataframe, table_name, conn):
         logging.error(f"An error occurred while creating the SQLite table: {e}")
 
 
-def run_scraper_liq():
+def save_liquidations(conn, new_df, metrics, table_name):
+    """
+    Appends the scraped rows and refreshes the aggregates in one transaction.
+
+    Runs as a job of the database's SQLiteWriter, so it can overlap with ingestion.
+
+    Returns:
+        int: Size of the table in bytes.
+    """
+    with publish_appends(conn, table_name):
+        create_sqlite_db(new_df, table_name, conn)
+    update_liquidation_aggregates(metrics, conn)
+    return table_bytes(conn, table_name)
+
+
+def run_scraper_liq(
+    db_file_path="BTC_data.db", csv_file_path="processed_data/liquidations24h.csv"
+):
     url = "https://www.coinglass.com/es/LiquidationData"
     xpath_groups = {
         "TODO": list(range(8, 11)),
@@ -180,22 +206,34 @@ def run_scraper_liq():
         "BYBIT": list(range(26, 29)),
         "HUOBI": list(range(32, 35)),
     }
-    current_timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    csv_file_path = "processed_data/liquidations24h.csv"
-    db_file_path = "BTC_data.db"
+    # Stamped in UTC like the bars, so the feature store joins snapshots onto the
+    # bars they were actually known at, whatever the host's timezone
+    current_timestamp = datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
     table_name = "Liquidations24h"
 
-    driver = initialize_webdriver(url)
+    with stage("scrape.webdriver"):
+        driver = initialize_webdriver(url)
     if driver:
-        df = scrape_data(driver, xpath_groups)
-        driver.quit()
+        with stage("scrape.scrape") as record:
+            df = scrape_data(driver, xpath_groups)
+            driver.quit()
+            record.rows_out = None if df is None else len(df)
         if df is not None:
             print(df)
-            new_df = transform_data(df, current_timestamp)
+            with stage("scrape.transform", rows_in=len(df)) as record:
+                metrics = compute_liquidation_metrics(df, current_timestamp)
+                if metrics is not None:
+                    new_df = format_liquidation_metrics(metrics)
+                    record.rows_out = len(new_df)
+            if metrics is None:
+                return
             print("new_df: \n", new_df)
             new_df.to_csv(csv_file_path)
-            with closing(sqlite3.connect(db_file_path)) as conn:
-                create_sqlite_db(new_df, table_name, conn)
+            with stage("scrape.save", rows_in=len(new_df)) as record:
+                record.bytes_written = get_writer(db_file_path).write(
+                    save_liquidations, new_df, metrics, table_name
+                )
+                record.rows_out = len(new_df)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,125 @@
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+
+# Below this many rows per worker the pool costs more than it saves
+MIN_ROWS_PER_SHARD = 20_000
+
+
+def shard_bounds(n_rows, shards):
+    """
+    Splits n_rows into contiguous, nearly equal [start, stop) ranges.
+
+    Parameters:
+        n_rows (int): Number of rows.
+        shards (int): Number of shards.
+
+    Returns:
+        list: (start, stop) tuples covering every row once.
+    """
+    edges = np.linspace(0, n_rows, max(min(shards, n_rows), 1) + 1).astype(int)
+    return [(int(a), int(b)) for a, b in zip(edges[:-1], edges[1:])]
+
+
+class SharedFrame:
+    """
+    The numeric columns of a DataFrame in one shared memory block.
+
+    Workers rebuild any row range as a DataFrame from the block instead of receiving
+    a pickled copy of their shard. Use as a context manager to free the block.
+    """
+
+    def __init__(self, df):
+        self.columns = list(df.columns)
+        self.dtypes = {col: str(dtype) for col, dtype in df.dtypes.items()}
+        # One contiguous float64 row per column, so a shard of a column is a view
+        self.shape = (len(self.columns), len(df))
+        self.shm = shared_memory.SharedMemory(
+            create=True, size=max(int(np.prod(self.shape)) * 8, 1)
+        )
+        matrix = np.ndarray(self.shape, dtype=np.float64, buffer=self.shm.buf)
+        for i, col in enumerate(self.columns):
+            matrix[i] = df[col].to_numpy(dtype=np.float64)
+
+    def spec(self):
+        """What a worker needs to find the block."""
+        return self.shm.name, self.shape, self.columns, self.dtypes
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.shm.close()
+        self.shm.unlink()
+
+
+def read_shard(spec, start, stop):
+    """
+    Rebuilds rows [start, stop) of a SharedFrame as a DataFrame with a RangeIndex.
+
+    Parameters:
+        spec (tuple): SharedFrame.spec() of the block.
+        start (int): First row.
+        stop (int): Row after the last one.
+
+    Returns:
+        pd.DataFrame: The rows with their original dtypes.
+    """
+    name, shape, columns, dtypes = spec
+    # Workers are children of the creating process and share its resource tracker
+    shm = shared_memory.SharedMemory(name=name)
+    try:
+        matrix = np.ndarray(shape, dtype=np.float64, buffer=shm.buf)[:, start:stop]
+        # The frame gets its own copy, so the block can be closed right away
+        return pd.DataFrame(
+            {
+                col: matrix[i].astype(dtypes[col], copy=True)
+                for i, col in enumerate(columns)
+            }
+        )
+    finally:
+        shm.close()
+
+
+def _run_shard(func, spec, start, stop, overlap):
+    context = max(start - overlap, 0)
+    result = func(read_shard(spec, context, stop))
+    # Drop the rows that were only there as context for the shard's first rows
+    return result.iloc[start - context :]
+
+
+def run_sharded(df, func, workers=None, overlap=0, shards=None):
+    """
+    Applies a row-preserving DataFrame function to time shards in a process pool.
+
+    Parameters:
+        df (pd.DataFrame): Rows sorted by time. Only numeric and bool columns are
+            shared; encode anything else numerically before.
+        func (callable): Module-level function taking and returning a DataFrame with
+            one output row per input row, in order.
+        workers (int): Worker processes. Default is the number of cores.
+        overlap (int): Rows before each shard passed as context for columns that
+            depend on earlier rows (shifts, rolling windows).
+        shards (int): Number of shards. Default is one per worker, with at least
+            MIN_ROWS_PER_SHARD rows each.
+
+    Returns:
+        list: The results of every shard, in time order.
+    """
+    workers = workers or os.cpu_count() or 1
+    if shards is None:
+        shards = min(workers, max(len(df) // MIN_ROWS_PER_SHARD, 1))
+    bounds = shard_bounds(len(df), shards)
+    if len(bounds) == 1:
+        return [func(df.reset_index(drop=True))]
+    logging.info(f"Computing {len(bounds)} shards with {workers} workers.")
+    with SharedFrame(df) as shared, ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [
+            pool.submit(_run_shard, func, shared.spec(), start, stop, overlap)
+            for start, stop in bounds
+        ]
+        return [future.result() for future in futures]
@@ -1,65 +1,119 @@
 import streamlit as st
 import pandas as pd
 import matplotlib.pyplot as plt
-import sqlite3
-
-
-# Function to fetch data from SQLite database
-def fetch_data(query):
-    conn = sqlite3.connect("../BTC_data.db")
-    df = pd.read_sql_query(query, conn)
-    conn.close()
-    return df
-
-
-def process_data(df):
-    if "Unnamed: 0" in df.columns:
-        # Drop unnecessary columns
-        df = df.drop(columns=["index", "Unnamed: 0"])
-
-    # Convert string representations of numbers to actual numbers
-    df["%_Exchanges"] = df["%_Exchanges"].str.rstrip("%").astype(float) / 100
-
-    # Convert Timestamp to datetime
-    df["Timestamp"] = pd.to_datetime(df["Timestamp"])
-
-    return df
-
-
-df = fetch_data("SELECT * FROM Liquidations24h ORDER BY Timestamp DESC LIMIT 30")
-df = process_data(df)
-
-# Displaying the data
-st.dataframe(df.head())
-
-# Display KPI metrics for 'TODO' row
-todo_df = df[df["Grupo"] == "TODO"]
-st.header("KPI Metrics for TODO (Aggregated)")
-for col in todo_df.columns[2:]:
-    st.metric(label=col, value=f"{todo_df[col].values[0]}")
-
-# Filter out the 'TODO' row and select the 5 most recent rows
-filtered_df = df[df["Grupo"] != "TODO"].head(4)
-
-# Create two columns
-col1, col2 = st.beta_columns(2)
-
-# Pie Plot in column 1
-col1.subheader("Percentage Liquidations Distribution per Exchange")
-fig1, ax1 = plt.subplots(figsize=(5, 3))
-ax1.pie(filtered_df["%_Exchanges"], labels=filtered_df["Grupo"], autopct="%1.1f%%")
-ax1.axis("equal")
-col1.pyplot(fig1)
-
-# Bar Plot for 'TODO' row in column 2
-col2.subheader("Long and Short Liquidations for TODO (Aggregated)")
-fig2, ax2 = plt.subplots(figsize=(5, 3))
-x = ["Long Liquidations", "Short Liquidations"]
-y = [todo_df["Long Liquidations"].values[0], todo_df["Short Liquidations"].values[0]]
-ax2.bar(x, y, color=["b", "r"])
-ax2.set_xlabel("Type of Liquidations")
-ax2.set_ylabel("Liquidations")
-col2.pyplot(fig2)
+import json
+import sys
+
+sys.path.append("..")
+from src.dashboard_data import versioned
+from src.liquidations import LATEST_TABLE, SNAPSHOTS_TABLE, load_latest_snapshot
+from src.pubsub import ChangeSubscriber
+from utils.formatting import display_frame, format_value
+
+DB_PATH = "../BTC_data.db"
+
+# Seconds between checks for changes published by the scraper
+LIVE_REFRESH_SECONDS = 5
+RECENT_ROWS = 30
+
+
+# Figures only depend on the snapshot they are drawn from, so they are rebuilt
+# only when the scraper stores a new one
+@st.cache_resource(max_entries=8)
+def build_figures(timestamp, exchanges, long_liquidations, short_liquidations):
+    # Pie Plot of the exchange shares
+    fig1, ax1 = plt.subplots(figsize=(5, 3))
+    ax1.pie(
+        [share for _, share in exchanges],
+        labels=[grupo for grupo, _ in exchanges],
+        autopct="%1.1f%%",
+    )
+    ax1.axis("equal")
+
+    # Bar Plot for 'TODO' row
+    fig2, ax2 = plt.subplots(figsize=(5, 3))
+    x = ["Long Liquidations", "Short Liquidations"]
+    y = [long_liquidations, short_liquidations]
+    ax2.bar(x, y, color=["b", "r"])
+    ax2.set_xlabel("Type of Liquidations")
+    ax2.set_ylabel("Liquidations")
+    return fig1, fig2
+
+
+def apply_changes():
+    # Only the rows the scraper just wrote are read, the rest stays in session state
+    for table_name, kind, rows in st.session_state.subscriber.poll():
+        if rows is None or rows.empty:
+            continue
+        if table_name == LATEST_TABLE:
+            snapshot = rows.iloc[-1].to_dict()
+            snapshot["exchanges"] = json.loads(snapshot["exchanges"])
+            st.session_state.snapshot = snapshot
+        elif table_name == SNAPSHOTS_TABLE:
+            recent = pd.concat([rows.iloc[::-1], st.session_state.recent])
+            st.session_state.recent = recent.head(RECENT_ROWS)
+
+
+@st.fragment(run_every=LIVE_REFRESH_SECONDS)
+def render_snapshot():
+    apply_changes()
+    snapshot = st.session_state.snapshot
+    exchanges = tuple((item["Grupo"], item["share"]) for item in snapshot["exchanges"])
+
+    # Displaying the data
+    st.dataframe(
+        display_frame(
+            pd.DataFrame(snapshot["exchanges"]).rename(columns={"share": "%_Exchanges"})
+        )
+    )
+
+    # Display KPI metrics for 'TODO' row
+    st.header("KPI Metrics for TODO (Aggregated)")
+    st.metric(label="Timestamp", value=snapshot["Timestamp"])
+    for label, column in (
+        ("Total_liquidations/1000", "total"),
+        ("Long/Short Ratio", "long_short_ratio"),
+        ("Short/Long Ratio", "short_long_ratio"),
+        ("Long Liquidations", "long"),
+        ("Short Liquidations", "short"),
+    ):
+        st.metric(label=label, value=format_value(snapshot[column], column))
+
+    fig1, fig2 = build_figures(
+        snapshot["Timestamp"], exchanges, snapshot["long"], snapshot["short"]
+    )
+
+    # Create two columns
+    col1, col2 = st.columns(2)
+
+    # Pie Plot in column 1
+    col1.subheader("Percentage Liquidations Distribution per Exchange")
+    col1.pyplot(fig1)
+
+    # Bar Plot for 'TODO' row in column 2
+    col2.subheader("Long and Short Liquidations for TODO (Aggregated)")
+    col2.pyplot(fig2)
+
+    if not st.session_state.recent.empty:
+        st.subheader("Snapshots received since the page was opened")
+        st.dataframe(display_frame(st.session_state.recent))
+
+
+# Served from memory until the scraper stores a new snapshot
+load_snapshot = versioned(tables=[LATEST_TABLE])(load_latest_snapshot)
+
+if "snapshot" not in st.session_state:
+    snapshot = load_snapshot(DB_PATH)
+    if snapshot is None:
+        st.warning("No liquidation snapshot stored yet, run the scraper first.")
+        st.stop()
+    st.session_state.snapshot = snapshot
+    st.session_state.recent = pd.DataFrame()
+    st.session_state.subscriber = ChangeSubscriber(
+        DB_PATH, [LATEST_TABLE, SNAPSHOTS_TABLE]
+    )
+
+render_snapshot()
 
 
 # bat code to run:
@@ -6,6 +6,23 @@ import streamlit as st
 import numpy as np
 import plotly.graph_objects as go
 import json
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.append("..")
+from src.resample import load_bars
+from src.dashboard_data import versioned
+from src.pubsub import ChangeSubscriber
+from utils.formatting import format_value
+from src.resample import rollup_table_name
+from src.downsample import (
+    CHART_COLUMNS,
+    MAX_CHART_POINTS,
+    choose_timeframe,
+    downsample_line,
+    downsample_ohlc,
+    load_chart_bars,
+)
 
 # Load the configuration file
 with open("config.json") as config_file:
@@ -14,8 +31,18 @@ with open("config.json") as config_file:
 # Use the API key from the configuration file
 coinglass_api_key = config["coinglassSecret"]
 
+# Coinglass responses are cached for this many seconds across reruns
+API_CACHE_TTL = 300
+
+# Seconds between checks for bars published by the ingestion
+LIVE_REFRESH_SECONDS = 5
+
+# Maximum number of Coinglass requests in flight at once
+MAX_CONCURRENT_REQUESTS = 16
+
 
 # Function to find available pairs for a given coin
+@st.cache_data(ttl=3600, show_spinner=False)
 def get_available_pairs(coin):
     url = "https://open-api.coinglass.com/public/v2/instrument"
     headers = {
@@ -38,6 +65,7 @@ def get_available_pairs(coin):
 
 
 # Function to fetch OHLC and open interest data
+@st.cache_data(ttl=API_CACHE_TTL, show_spinner=False)
 def fetch_ohlc_oi_data(exchange, pair):
     url = "https://open-api.coinglass.com/public/v2/indicator/open_interest_ohlc"
     limit = 100
@@ -70,6 +98,7 @@ def fetch_ohlc_oi_data(exchange, pair):
 
 
 # Function to fetch Price OHLC data
+@st.cache_data(ttl=API_CACHE_TTL, show_spinner=False)
 def fetch_price_ohlc_data(exchange, pair):
     url = f"https://open-api.coinglass.com/public/v2/indicator/price_ohlc"
     headers = {
@@ -90,8 +119,19 @@ def fetch_price_ohlc_data(exchange, pair):
         response.raise_for_status()
 
 
+# Function to load locally stored bars at a rollup timeframe, shaped like the API data
+@versioned()
+def load_local_price_ohlc(db_path, timeframe, base_table="BTC_data"):
+    df = load_bars(db_path, timeframe, base_table)
+    if df is None:
+        return None
+    return df.rename(columns=CHART_COLUMNS)
+
+
 # Function to plot closing prices
-def plot_closing_prices(df, title):
+@st.cache_data(show_spinner=False)
+def plot_closing_prices(df, title, max_points=MAX_CHART_POINTS):
+    df = downsample_line(df.sort_values("t"), "t", "c", max_points)
     fig = px.line(
         df,
         x="t",
@@ -103,7 +143,9 @@ def plot_closing_prices(df, title):
 
 
 # Function to plot candlestick chart
-def plot_candlestick_chart(df):
+@st.cache_data(show_spinner=False)
+def plot_candlestick_chart(df, max_points=MAX_CHART_POINTS):
+    df = downsample_ohlc(df.sort_values("t"), max_points)
     fig = go.Figure(
         data=[
             go.Candlestick(
@@ -121,6 +163,7 @@ def plot_candlestick_chart(df):
 
 
 # Function to fetch Top Long/Short Account Ratio data
+@st.cache_data(ttl=API_CACHE_TTL, show_spinner=False)
 def fetch_top_long_short_ratio(exchange, pair):
     url = "https://open-api.coinglass.com/public/v2/indicator/top_long_short_account_ratio"
     headers = {
@@ -139,7 +182,14 @@ def fetch_top_long_short_ratio(exchange, pair):
         response.raise_for_status()
 
 
-def plot_long_short_ratios(df):
+@st.cache_data(show_spinner=False)
+def plot_long_short_ratios(df, max_points=MAX_CHART_POINTS):
+    df = downsample_line(
+        df.sort_values("createTime"),
+        "createTime",
+        ["longRatio", "shortRatio"],
+        max_points,
+    )
     fig = px.line(
         df,
         x="createTime",
@@ -159,6 +209,7 @@ def plot_long_short_ratios(df):
 
 
 # Function to fetch Top Long/Short Position Ratio data
+@st.cache_data(ttl=API_CACHE_TTL, show_spinner=False)
 def fetch_top_long_short_position_ratio(exchange, pair):
     url = "https://open-api.coinglass.com/public/v2/indicator/top_long_short_position_ratio"
     headers = {
@@ -178,7 +229,14 @@ def fetch_top_long_short_position_ratio(exchange, pair):
 
 
 # Function to plot Top Traders Long and Short Ratios
-def plot_top_traders_long_short_ratios(df):
+@st.cache_data(show_spinner=False)
+def plot_top_traders_long_short_ratios(df, max_points=MAX_CHART_POINTS):
+    df = downsample_line(
+        df.sort_values("createTime"),
+        "createTime",
+        ["longRatio", "shortRatio"],
+        max_points,
+    )
     fig = px.line(
         df,
         x="createTime",
@@ -197,12 +255,187 @@ def plot_top_traders_long_short_ratios(df):
     return fig
 
 
+# Merges bars published by the ingestion into the bars already on screen
+def merge_new_bars(bars, rows, start, end):
+    rows = rows.rename(columns=CHART_COLUMNS)[list(CHART_COLUMNS.values())]
+    rows["t"] = pd.to_datetime(rows["t"])
+    rows = rows[(rows["t"] >= start) & (rows["t"] < end)]
+    merged = pd.concat([bars, rows]).drop_duplicates("t", keep="last")
+    return downsample_ohlc(merged.sort_values("t").reset_index(drop=True))
+
+
+# Indicator fetchers run for every selected pair, with the column holding their time
+INDICATOR_FETCHERS = {
+    "oi": (fetch_ohlc_oi_data, "t"),
+    "price": (fetch_price_ohlc_data, "t"),
+    "accounts": (fetch_top_long_short_ratio, "createTime"),
+    "positions": (fetch_top_long_short_position_ratio, "createTime"),
+}
+
+# Comparison charts: title, indicator, value column and whether to rebase to 100
+COMPARISON_METRICS = [
+    ("Price (rebased to 100)", "price", "c", True),
+    ("Open Interest (rebased to 100)", "oi", "c", True),
+    ("Top Accounts Long Ratio (%)", "accounts", "longRatio", False),
+    ("Top Traders Position Long Ratio (%)", "positions", "longRatio", False),
+]
+
+
+# Function to fetch every indicator of several pairs concurrently, one request each
+def fetch_indicator_bundles(selections):
+    tasks = [
+        (selection, name, fetcher)
+        for selection in selections
+        for name, (fetcher, _) in INDICATOR_FETCHERS.items()
+    ]
+    bundles = {selection: {} for selection in selections}
+    workers = min(len(tasks), MAX_CONCURRENT_REQUESTS) or 1
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            executor.submit(fetcher, *selection): (selection, name)
+            for selection, name, fetcher in tasks
+        }
+        for future, (selection, name) in futures.items():
+            try:
+                bundles[selection][name] = future.result()
+            except Exception as e:
+                st.warning(f"Could not fetch {name} for {selection[1]}: {e}")
+                bundles[selection][name] = None
+    return bundles
+
+
+# Function to pick a coin's default pair on an exchange, preferring USDT quotes
+def default_pair(available_pairs, exchange, coin):
+    pairs = available_pairs.query("exchange == @exchange")["instrumentId"]
+    if pairs.empty:
+        return None
+    preferred = pairs[pairs.str.upper().str.startswith(f"{coin}USDT")]
+    return (preferred if not preferred.empty else pairs).iloc[0]
+
+
+# Function to align one indicator of every coin on a common time index
+def align_metric(bundles, labels, name, value_column, rebase=False):
+    time_column = INDICATOR_FETCHERS[name][1]
+    series = []
+    for selection, label in zip(bundles, labels):
+        df = bundles[selection].get(name)
+        if df is None or df.empty or value_column not in df.columns:
+            continue
+        values = (
+            df.drop_duplicates(time_column, keep="last")
+            .set_index(time_column)[value_column]
+            .astype(float)
+            .rename(label)
+        )
+        series.append(values)
+    if not series:
+        return pd.DataFrame()
+    aligned = pd.concat(series, axis=1, join="outer").sort_index()
+    if rebase:
+        aligned = aligned / aligned.bfill().iloc[0] * 100
+    return aligned
+
+
+# Function to plot one aligned indicator with a line per coin
+def plot_comparison(aligned, title):
+    fig = px.line(
+        aligned,
+        x=aligned.index,
+        y=list(aligned.columns),
+        title=title,
+        labels={"x": "Date", "value": title, "variable": "Coin"},
+    )
+    return fig
+
+
+# Watchlist mode: every coin is fetched in one concurrent round trip
+def render_comparison():
+    coins = st.text_input("Enter coin symbols separated by commas (e.g., BTC,ETH,SOL):")
+    coins = [coin.strip().upper() for coin in coins.split(",") if coin.strip()]
+    if not coins:
+        return
+
+    with ThreadPoolExecutor(max_workers=min(len(coins), MAX_CONCURRENT_REQUESTS)) as ex:
+        pairs_by_coin = dict(zip(coins, ex.map(get_available_pairs, coins)))
+    exchanges = sorted(
+        set.intersection(
+            *[
+                set(pairs["exchange"]) if not pairs.empty else set()
+                for pairs in pairs_by_coin.values()
+            ]
+        )
+    )
+    if not exchanges:
+        st.warning("No exchange lists every selected coin.")
+        return
+    selected_exchange = st.selectbox("Select Exchange", exchanges)
+
+    selections, labels = [], []
+    for coin in coins:
+        pair = default_pair(pairs_by_coin[coin], selected_exchange, coin)
+        if pair is not None:
+            selections.append((selected_exchange, pair))
+            labels.append(coin)
+
+    if st.button("Compare"):
+        bundles = fetch_indicator_bundles(selections)
+        grid = st.columns(2) + st.columns(2)
+        for col, (title, name, value_column, rebase) in zip(grid, COMPARISON_METRICS):
+            aligned = align_metric(bundles, labels, name, value_column, rebase)
+            if not aligned.empty:
+                col.plotly_chart(plot_comparison(aligned, title))
+
+
+# Local bar history, fetched at a resolution that fits the selected range and
+# kept live by applying only the bars published since the last refresh
+@st.fragment(run_every=LIVE_REFRESH_SECONDS)
+def render_local_history(db_path="../BTC_data.db", base_table="BTC_data"):
+    bounds = load_local_price_ohlc(db_path, "1d", base_table)
+    if bounds is None or bounds.empty:
+        return
+    first, last = bounds["t"].min().date(), bounds["t"].max().date()
+    st.header("Local BTC history")
+    visible = st.slider(
+        "Visible range", min_value=first, max_value=last, value=(first, last)
+    )
+    start = pd.Timestamp(visible[0])
+    end = pd.Timestamp(visible[1]) + pd.Timedelta(days=1)
+    timeframe = choose_timeframe(start, end)
+    table_name = (
+        base_table if timeframe is None else rollup_table_name(base_table, timeframe)
+    )
+
+    state = st.session_state
+    if state.get("history_key") != (start, end, table_name):
+        state.history_key = (start, end, table_name)
+        state.history_subscriber = ChangeSubscriber(db_path, [table_name])
+        state.history_bars = versioned()(load_chart_bars)(db_path, start, end)
+    else:
+        for _, kind, rows in state.history_subscriber.poll():
+            if kind == "replace" or state.history_bars is None:
+                state.history_bars = versioned()(load_chart_bars)(db_path, start, end)
+            elif not rows.empty:
+                state.history_bars = merge_new_bars(
+                    state.history_bars, rows, start, end
+                )
+
+    bars = state.history_bars
+    if bars is not None and not bars.empty:
+        st.plotly_chart(plot_candlestick_chart(bars))
+
+
 # Streamlit App
 def main():
     st.set_page_config(layout="wide", page_icon="🧊")
 
     st.title("Coin Advanced Metrics")
 
+    if st.radio("Mode", ["Single coin", "Compare coins"], horizontal=True) == (
+        "Compare coins"
+    ):
+        render_comparison()
+        return
+
     # User input for coin
     coin = st.text_input("Enter the coin symbol (e.g., BTC):").upper()
 
@@ -221,38 +454,49 @@ def main():
 
         # Fetch and display data on button click
         if st.button("Fetch Data"):
+            # Fetch the four indicators concurrently
+            selection = (selected_exchange, selected_pair)
+            bundle = fetch_indicator_bundles([selection])[selection]
+            # Every column below needs its indicator, the fetch errors were shown above
+            missing = [name for name, df in bundle.items() if df is None or df.empty]
+            if missing:
+                st.error(
+                    f"No {', '.join(missing)} data for {selected_pair} on "
+                    f"{selected_exchange}, nothing to show."
+                )
+                st.stop()
+
             # Fetch Open Interest data
             col1, col2, col3, col4 = st.columns([1, 1, 1, 1])
             with col1:
-                ohlc_data = fetch_ohlc_oi_data(selected_exchange, selected_pair)
+                ohlc_data = bundle["oi"]
                 ohlc_data = ohlc_data.sort_values("t", ascending=False).reset_index(
                     drop=True
                 )
                 latest_oi = ohlc_data.iloc[0]["c"]
-                st.metric("Open Interest", f"{latest_oi:,} {coin}")
+                st.metric(
+                    "Open Interest",
+                    f"{format_value(latest_oi, 'open_interest')} {coin}",
+                )
 
                 # Plot Open Interest data
                 fig_oi = plot_closing_prices(ohlc_data, "Open Interest")
 
             # Fetch Price OHLC data
             with col2:
-                price_ohlc_data = fetch_price_ohlc_data(
-                    selected_exchange, selected_pair
-                )
+                price_ohlc_data = bundle["price"]
                 price_ohlc_data = price_ohlc_data.sort_values(
                     "t", ascending=False
                 ).reset_index(drop=True)
                 latest_close = price_ohlc_data.iloc[0]["c"]
-                st.metric("Closing Price", f"${latest_close}")
+                st.metric("Closing Price", f"${format_value(latest_close, 'price')}")
 
                 # Plot Price data
                 fig_price = plot_closing_prices(price_ohlc_data, "Price")
 
             # Fetch Top Long/Short Account Ratio data
             with col3:
-                long_short_data = fetch_top_long_short_ratio(
-                    selected_exchange, selected_pair
-                )
+                long_short_data = bundle["accounts"]
                 long_short_data = long_short_data.sort_values(
                     "createTime", ascending=False
                 ).reset_index(drop=True)
@@ -260,7 +504,8 @@ def main():
                 latest_short_ratio = long_short_data.iloc[0]["shortRatio"]
                 st.metric(
                     "Top Accounts Ratio",
-                    f"{latest_long_ratio}/{latest_short_ratio}",
+                    f"{format_value(latest_long_ratio, 'longRatio')}/"
+                    f"{format_value(latest_short_ratio, 'shortRatio')}",
                 )
 
                 # Plot Long/Short Ratios
@@ -268,9 +513,7 @@ def main():
 
             # Fetch Top Long/Short Position Ratio data
             with col4:
-                top_traders_data = fetch_top_long_short_position_ratio(
-                    selected_exchange, selected_pair
-                )
+                top_traders_data = bundle["positions"]
                 top_traders_data = top_traders_data.sort_values(
                     "createTime", ascending=False
                 ).reset_index(drop=True)
@@ -278,7 +521,8 @@ def main():
                 latest_short_ratio = top_traders_data.iloc[0]["shortRatio"]
                 st.metric(
                     "Top Traders Position Size Ratios",
-                    f"{latest_long_ratio}/{latest_short_ratio}",
+                    f"{format_value(latest_long_ratio, 'longRatio')}/"
+                    f"{format_value(latest_short_ratio, 'shortRatio')}",
                 )
 
             # Plot Top Traders Long and Short Ratios
@@ -302,6 +546,8 @@ def main():
             with bottom_col2:
                 st.plotly_chart(fig_top_traders_ratio)
 
+    render_local_history()
+
 
 # Run the Streamlit app
 if __name__ == "__main__":
@@ -0,0 +1,181 @@
+import logging
+
+import numpy as np
+import pandas as pd
+
+from utils.utils import SQLiteDB
+from utils.instrumentation import timed
+from src.time_features import to_epoch_seconds
+from src.data_quality import infer_bar_seconds
+from src.resample import load_bars
+
+LABELS_TABLE = "labels"
+HORIZONS = (1, 5, 15, 60)
+# Same ±2% bands as target() in knn_data_v1
+THRESHOLD_PCT = 2.0
+# Classes as in target(): 0 up beyond the threshold, 1 down beyond it, 2 up within
+# it and 3 down within it
+LABEL_COLUMNS = ["horizon", "time", "ret", "cls", "mfe", "mae"]
+
+
+def classify_returns(returns_pct, threshold_pct=THRESHOLD_PCT):
+    """
+    Maps percentage returns to the four target classes.
+
+    Parameters:
+        returns_pct (np.ndarray): Forward returns in percent.
+        threshold_pct (float): Size of a large move in percent.
+
+    Returns:
+        np.ndarray: int8 classes, -1 where the return is 0 or missing.
+    """
+    conditions = [
+        returns_pct > threshold_pct,
+        returns_pct < -threshold_pct,
+        (returns_pct > 0) & (returns_pct <= threshold_pct),
+        (returns_pct < 0) & (returns_pct >= -threshold_pct),
+    ]
+    return np.select(conditions, [0, 1, 2, 3], default=-1).astype(np.int8)
+
+
+@timed("labels.compute")
+def compute_labels(
+    bars, horizons=HORIZONS, threshold_pct=THRESHOLD_PCT, bar_seconds=None
+):
+    """
+    Builds forward-return, class and excursion labels for several horizons at once.
+
+    For a bar at t and horizon h, 'ret' is close[t+h] / close[t] - 1, 'mfe' the highest
+    high and 'mae' the lowest low of bars t+1..t+h relative to close[t]. All horizons
+    are shifted views of the same arrays plus one O(n) rolling max/min each. Windows
+    that cross a gap in the bars are left out.
+
+    Parameters:
+        bars (pd.DataFrame): Bars sorted by time with 'time', 'high', 'low', 'close'.
+        horizons (tuple): Horizons in bars.
+        threshold_pct (float): Class threshold in percent.
+        bar_seconds (int): Bar spacing. Default is inferred from the times.
+
+    Returns:
+        pd.DataFrame: Long table with LABEL_COLUMNS, one row per horizon and bar that
+            has a complete forward window. Values are float32, classes int8.
+    """
+    times = to_epoch_seconds(bars["time"])
+    bar_seconds = bar_seconds or infer_bar_seconds(times)
+    close = bars["close"].to_numpy(dtype=np.float64)
+    high = bars["high"]
+    low = bars["low"]
+    n = len(close)
+
+    frames = []
+    for h in sorted(set(horizons)):
+        if h < 1 or h >= n:
+            continue
+        # Values of the window t+1..t+h, aligned with t
+        future_close = close[h:]
+        window_high = high.rolling(h).max().to_numpy()[h:]
+        window_low = low.rolling(h).min().to_numpy()[h:]
+        base = close[:-h]
+        valid = times[h:] - times[:-h] == h * bar_seconds
+        ret = future_close / base - 1
+        frames.append(
+            pd.DataFrame(
+                {
+                    "horizon": np.full(int(valid.sum()), h, dtype=np.int16),
+                    "time": np.asarray(bars["time"])[:-h][valid],
+                    "ret": ret[valid].astype(np.float32),
+                    "cls": classify_returns(ret[valid] * 100, threshold_pct),
+                    "mfe": (window_high[valid] / base[valid] - 1).astype(np.float32),
+                    "mae": (window_low[valid] / base[valid] - 1).astype(np.float32),
+                }
+            )
+        )
+    if not frames:
+        # Typed like a non-empty result, so callers can still use e.g. .dt on time
+        return pd.DataFrame(
+            {
+                "horizon": np.zeros(0, dtype=np.int16),
+                "time": np.asarray(bars["time"])[:0],
+                "ret": np.zeros(0, dtype=np.float32),
+                "cls": np.zeros(0, dtype=np.int8),
+                "mfe": np.zeros(0, dtype=np.float32),
+                "mae": np.zeros(0, dtype=np.float32),
+            }
+        )
+    return pd.concat(frames, ignore_index=True)
+
+
+def update_labels(
+    db_path="BTC_data.db",
+    bars_table="BTC_data",
+    horizons=HORIZONS,
+    threshold_pct=THRESHOLD_PCT,
+    table_name=LABELS_TABLE,
+):
+    """
+    Recomputes the labels of some horizons from the stored bars.
+
+    Only the bars' time and prices are read and only the given horizons are replaced,
+    so trying new horizons does not re-run the rest of the pipeline.
+
+    Parameters:
+        db_path (str): SQLite database holding the bars.
+        bars_table (str): Bars table.
+        horizons (tuple): Horizons in bars.
+        threshold_pct (float): Class threshold in percent.
+        table_name (str): Label table, keyed by (horizon, time).
+
+    Returns:
+        int: Number of label rows written.
+    """
+    bars = load_bars(db_path, None, bars_table)
+    if bars is None or bars.empty:
+        return 0
+    labels = compute_labels(bars, horizons, threshold_pct)
+    labels["time"] = labels["time"].dt.strftime("%Y-%m-%d %H:%M:%S")
+
+    with SQLiteDB(db_path) as db:
+        db.conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {table_name} ("
+            "horizon INTEGER, time TEXT, ret REAL, cls INTEGER, mfe REAL, mae REAL, "
+            "PRIMARY KEY (horizon, time)) WITHOUT ROWID"
+        )
+        horizons = sorted(set(horizons))
+        db.conn.execute(
+            f"DELETE FROM {table_name} "
+            f"WHERE horizon IN ({', '.join('?' * len(horizons))})",
+            horizons,
+        )
+        db.conn.executemany(
+            f"INSERT INTO {table_name} VALUES (?, ?, ?, ?, ?, ?)",
+            labels[LABEL_COLUMNS].astype(object).itertuples(index=False),
+        )
+        db.conn.commit()
+        db.bump_write_version(table_name)
+    logging.info(f"Wrote {len(labels)} labels for horizons {horizons}.")
+    return len(labels)
+
+
+def load_labels(db_path="BTC_data.db", horizons=None, table_name=LABELS_TABLE):
+    """
+    Reads labels as a wide frame, e.g. columns 'ret_5', 'cls_5', 'mfe_5', 'mae_5'.
+
+    Parameters:
+        db_path (str): SQLite database holding the labels.
+        horizons (list): Horizons to read. Default is all stored ones.
+        table_name (str): Label table.
+
+    Returns:
+        pd.DataFrame: Labels indexed by time.
+    """
+    where = f"horizon IN ({', '.join('?' * len(horizons))})" if horizons else None
+    with SQLiteDB(db_path) as db:
+        df = db.select(table_name, where=where, params=tuple(horizons or ()))
+    wide = df.pivot(index="time", columns="horizon")
+    wide.columns = [f"{name}_{horizon}" for name, horizon in wide.columns]
+    return wide.sort_index()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    update_labels()
@@ -0,0 +1,213 @@
+import logging
+from datetime import datetime, timezone
+from functools import lru_cache
+from zoneinfo import ZoneInfo
+
+import numpy as np
+import pandas as pd
+
+SECONDS_PER_HOUR = 3600
+HOURS_PER_WEEK = 168
+# 1970-01-01 was a Thursday, pandas counts Monday as day 0
+EPOCH_DAY_OF_WEEK = 3
+
+# Hour-of-week lookup tables, index 0 is Monday 00:00
+HOW_HOUR = np.tile(np.arange(24, dtype=np.int32), 7)
+HOW_DAY_OF_WEEK = np.repeat(np.arange(7, dtype=np.int32), 24)
+
+WEEKDAYS = (0, 1, 2, 3, 4)
+ALL_DAYS = (0, 1, 2, 3, 4, 5, 6)
+
+# Session calendars: column name -> timezone (None means UTC), open hour,
+# close hour (exclusive, local time) and the local weekdays the session trades.
+DEFAULT_SESSIONS = {
+    "USA_open": {"tz": None, "open": 9, "close": 17, "days": ALL_DAYS},
+    "EU_open": {"tz": None, "open": 8, "close": 16, "days": ALL_DAYS},
+    "ASIA_open": {"tz": None, "open": 1, "close": 9, "days": ALL_DAYS},
+}
+
+# Local exchange hours that follow daylight saving time
+EXCHANGE_SESSIONS = {
+    "USA_open": {"tz": "America/New_York", "open": 9, "close": 16, "days": WEEKDAYS},
+    "EU_open": {"tz": "Europe/London", "open": 8, "close": 16, "days": WEEKDAYS},
+    "ASIA_open": {"tz": "Asia/Tokyo", "open": 9, "close": 15, "days": WEEKDAYS},
+}
+
+
+def session_table(open_hour, close_hour, days=ALL_DAYS):
+    """
+    Builds the hour-of-week lookup table for a trading session.
+
+    Parameters:
+        open_hour (int): Local hour the session opens.
+        close_hour (int): Local hour the session closes (exclusive). May be lower
+            than open_hour for sessions that run over midnight.
+        days (tuple): Local weekdays (Monday=0) on which the session opens.
+
+    Returns:
+        np.ndarray: Boolean array of length 168, True where the session is open.
+    """
+    if open_hour <= close_hour:
+        in_hours = (HOW_HOUR >= open_hour) & (HOW_HOUR < close_hour)
+    else:
+        in_hours = (HOW_HOUR >= open_hour) | (HOW_HOUR < close_hour)
+    return in_hours & np.isin(HOW_DAY_OF_WEEK, days)
+
+
+@lru_cache(maxsize=None)
+def _cached_session_table(open_hour, close_hour, days):
+    return session_table(open_hour, close_hour, days)
+
+
+@lru_cache(maxsize=None)
+def _year_transitions(tz_name, year):
+    """Returns the (epoch, utc offset) pairs where tz_name changes offset in year."""
+    tz = ZoneInfo(tz_name)
+    start = int(datetime(year, 1, 1, tzinfo=timezone.utc).timestamp())
+    end = int(datetime(year + 1, 1, 1, tzinfo=timezone.utc).timestamp())
+    transitions = []
+    previous = None
+    for ts in range(start, end, SECONDS_PER_HOUR):
+        offset = int(
+            datetime.fromtimestamp(ts, tz=timezone.utc)
+            .astimezone(tz)
+            .utcoffset()
+            .total_seconds()
+        )
+        if offset != previous:
+            transitions.append((ts, offset))
+            previous = offset
+    return tuple(transitions)
+
+
+def utc_offsets(epoch_seconds, tz_name):
+    """
+    Looks up the UTC offset of a timezone for every timestamp.
+
+    The offset changes are computed once per timezone and year and cached, so the
+    per-row work is a single binary search.
+
+    Parameters:
+        epoch_seconds (np.ndarray): int64 epoch seconds.
+        tz_name (str): IANA timezone name, e.g. "America/New_York".
+
+    Returns:
+        np.ndarray: int64 offsets in seconds, same shape as epoch_seconds.
+    """
+    if len(epoch_seconds) == 0:
+        return np.zeros(0, dtype=np.int64)
+    first_year = datetime.fromtimestamp(int(epoch_seconds.min()), tz=timezone.utc).year
+    last_year = datetime.fromtimestamp(int(epoch_seconds.max()), tz=timezone.utc).year
+    transitions = [
+        item
+        for year in range(first_year, last_year + 1)
+        for item in _year_transitions(tz_name, year)
+    ]
+    starts = np.array([ts for ts, _ in transitions], dtype=np.int64)
+    offsets = np.array([offset for _, offset in transitions], dtype=np.int64)
+    index = np.searchsorted(starts, epoch_seconds, side="right") - 1
+    return offsets[np.clip(index, 0, None)]
+
+
+def hour_of_week(epoch_seconds, offsets=0):
+    """
+    Maps epoch seconds to the hour of the week (Monday 00:00 = 0).
+
+    Parameters:
+        epoch_seconds (np.ndarray): int64 epoch seconds.
+        offsets (np.ndarray or int): UTC offsets in seconds to apply first.
+
+    Returns:
+        np.ndarray: int64 hour-of-week indices in [0, 168).
+    """
+    hours = (epoch_seconds + offsets) // SECONDS_PER_HOUR
+    return (hours + EPOCH_DAY_OF_WEEK * 24) % HOURS_PER_WEEK
+
+
+def to_epoch_seconds(values):
+    """
+    Converts a time column to int64 epoch seconds without reparsing it.
+
+    Parameters:
+        values (pd.Series or array-like): datetime64 values, or integer epoch seconds.
+
+    Returns:
+        np.ndarray: int64 epoch seconds.
+    """
+    values = np.asarray(values)
+    if np.issubdtype(values.dtype, np.datetime64):
+        return values.astype("datetime64[s]").astype(np.int64)
+    if np.issubdtype(values.dtype, np.integer):
+        return values.astype(np.int64)
+    return to_epoch_seconds(pd.to_datetime(values).values)
+
+
+def compute_time_features(epoch_seconds, sessions=None):
+    """
+    Computes calendar and session features in one vectorized pass.
+
+    Parameters:
+        epoch_seconds (np.ndarray): int64 epoch seconds (UTC).
+        sessions (dict): Session calendars as in DEFAULT_SESSIONS. Default is
+            DEFAULT_SESSIONS.
+
+    Returns:
+        dict: Column name -> np.ndarray with "hour", "day_of_week" and one boolean
+            array per session.
+    """
+    if sessions is None:
+        sessions = DEFAULT_SESSIONS
+    epoch_seconds = np.asarray(epoch_seconds, dtype=np.int64)
+
+    utc_how = hour_of_week(epoch_seconds)
+    features = {
+        "hour": HOW_HOUR[utc_how],
+        "day_of_week": HOW_DAY_OF_WEEK[utc_how],
+    }
+
+    local_how = {None: utc_how}
+    for name, spec in sessions.items():
+        tz_name = spec.get("tz")
+        if tz_name not in local_how:
+            offsets = utc_offsets(epoch_seconds, tz_name)
+            local_how[tz_name] = hour_of_week(epoch_seconds, offsets)
+        table = _cached_session_table(
+            spec["open"], spec["close"], tuple(spec.get("days", ALL_DAYS))
+        )
+        features[name] = table[local_how[tz_name]]
+    return features
+
+
+def time_features_for_bar(epoch_second, sessions=None):
+    """
+    Computes the time features of a single streaming bar.
+
+    Parameters:
+        epoch_second (int): Bar open time in epoch seconds (UTC).
+        sessions (dict): Session calendars as in DEFAULT_SESSIONS.
+
+    Returns:
+        dict: Column name -> scalar value.
+    """
+    features = compute_time_features(np.array([epoch_second]), sessions)
+    return {name: values[0].item() for name, values in features.items()}
+
+
+def add_time_features(df, time_column="time", sessions=None):
+    """
+    Appends the calendar and session features to a DataFrame.
+
+    Parameters:
+        df (pd.DataFrame): DataFrame with a datetime64 or epoch-seconds time column.
+        time_column (str): Name of the time column. Default is 'time'.
+        sessions (dict): Session calendars as in DEFAULT_SESSIONS.
+
+    Returns:
+        pd.DataFrame: The same DataFrame with the feature columns added.
+    """
+    epoch_seconds = to_epoch_seconds(df[time_column])
+    features = compute_time_features(epoch_seconds, sessions)
+    for name, values in features.items():
+        df[name] = values
+    logging.debug(f"Added time features {list(features)} to {len(df)} rows")
+    return df
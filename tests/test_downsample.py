@@ -0,0 +1,26 @@
+import numpy as np
+
+from src.downsample import minmax_indices
+
+
+def test_minmax_uneven_length():
+    y = np.random.default_rng(0).random(101)
+    indices = minmax_indices(y, 100)
+    assert np.all(np.diff(indices) > 0)
+    assert indices[0] >= 0 and indices[-1] < len(y)
+    assert y.argmin() in indices and y.argmax() in indices
+
+
+def test_minmax_keeps_bucket_extremes():
+    y = np.arange(1000, dtype=np.float64) % 7
+    y[503] = 50
+    y[10] = -50
+    indices = minmax_indices(y, 40)
+    assert 503 in indices and 10 in indices
+    assert len(indices) <= 40
+
+
+def test_minmax_all_nan_bucket():
+    y = np.r_[np.full(20, np.nan), np.arange(81, dtype=np.float64)]
+    indices = minmax_indices(y, 10)
+    assert 100 in indices
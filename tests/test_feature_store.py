@@ -0,0 +1,19 @@
+import sqlite3
+
+import numpy as np
+import pandas as pd
+
+from src.feature_store import _to_number
+
+
+def test_stored_display_strings_parse():
+    conn = sqlite3.connect(":memory:")
+    conn.execute("CREATE TABLE t (value TEXT)")
+    conn.executemany("INSERT INTO t VALUES (?)", [("1,234",), ("12.5%",), ("7",)])
+    values = pd.read_sql_query("SELECT value FROM t", conn)["value"]
+    np.testing.assert_array_equal(_to_number(values), [1234.0, 12.5, 7.0])
+
+
+def test_numeric_values_pass_through():
+    values = pd.Series([1.5, np.nan, 3])
+    np.testing.assert_array_equal(_to_number(values), [1.5, np.nan, 3.0])
@@ -0,0 +1,54 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.indicators import INDICATOR_COLUMNS, StreamingIndicators, compute_indicators
+
+
+def _bars_with_flat_runs(n=300, seed=0):
+    rng = np.random.default_rng(seed)
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.01, n)))
+    open_ = np.r_[close[0], close[:-1]]
+    spread = np.abs(rng.normal(0, 0.005, n)) * close
+    high = np.maximum(open_, close) + spread
+    low = np.minimum(open_, close) - spread
+    volume = rng.gamma(2.0, 100.0, n)
+    # Flat filled bars: one at the start, long enough to leave the true range average
+    # at zero, and one in the middle, longer than the CCI window
+    for flat in (slice(0, 40), slice(150, 180)):
+        price = close[flat.start - 1] if flat.start else 100.0
+        open_[flat] = high[flat] = low[flat] = close[flat] = price
+        volume[flat] = 0.0
+    return pd.DataFrame(
+        {
+            "time": 1_700_000_000 + 900 * np.arange(n),
+            "open": open_,
+            "high": high,
+            "low": low,
+            "close": close,
+            "volume": volume,
+        }
+    )
+
+
+# Flat windows whose mean is not exact in floating point are among these seeds
+@pytest.mark.parametrize("seed", range(5))
+def test_streaming_matches_batch_with_flat_bars(seed):
+    df = _bars_with_flat_runs(seed=seed)
+    batch = compute_indicators(df)
+    engine = StreamingIndicators()
+    streamed = pd.DataFrame(
+        [
+            engine.update(*row)
+            for row in df[["time", "open", "high", "low", "close", "volume"]]
+            .astype(float)
+            .itertuples(index=False)
+        ],
+        columns=INDICATOR_COLUMNS,
+    )
+    for col in INDICATOR_COLUMNS:
+        np.testing.assert_allclose(
+            streamed[col], batch[col], rtol=1e-7, atol=1e-7, equal_nan=True, err_msg=col
+        )
+    assert batch["adx"].notna().any()
+    assert batch["cci"].iloc[170:180].isna().all()
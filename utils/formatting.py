@@ -0,0 +1,91 @@
+import numpy as np
+import pandas as pd
+
+# Decimals shown for floats without a format of their own
+DISPLAY_DECIMALS = 2
+
+# Column -> format of its values on the dashboards. Stored values keep their full
+# precision; these only apply when a value is shown.
+COLUMN_FORMATS = {
+    "Total_liquidations/1000": "{:,.0f}",
+    "Long Liquidations": "{:,.0f}",
+    "Short Liquidations": "{:,.0f}",
+    "Long/Short Ratio": "{:.2f}",
+    "Short/Long Ratio": "{:.2f}",
+    "%_Exchanges": "{:.2f}%",
+    "total": "{:,.0f}",
+    "long": "{:,.0f}",
+    "short": "{:,.0f}",
+    "long_short_ratio": "{:.2f}",
+    "short_long_ratio": "{:.2f}",
+    "share": "{:.2f}%",
+    "total_sum": "{:,.0f}",
+    "volume": "{:,.0f}",
+    "open_interest": "{:,.0f}",
+    # Significant digits rather than decimals, so sub-cent prices don't show as 0.00
+    "price": "{:,.8g}",
+    "longRatio": "{:.4g}",
+    "shortRatio": "{:.4g}",
+}
+
+
+def column_format(column=None, decimals=DISPLAY_DECIMALS):
+    """
+    The format string of a column.
+
+    Parameters:
+        column (str): Column name. Columns not in COLUMN_FORMATS get the default.
+        decimals (int): Decimals of the default format.
+
+    Returns:
+        str: A str.format pattern, e.g. '{:.2f}'.
+    """
+    return COLUMN_FORMATS.get(column, f"{{:,.{decimals}f}}")
+
+
+def format_value(value, column=None, decimals=DISPLAY_DECIMALS):
+    """
+    Formats one value for display, e.g. in st.metric.
+
+    Parameters:
+        value: The value. Non-numeric values are returned as text unchanged.
+        column (str): Column the value comes from, to pick its format.
+        decimals (int): Decimals for floats without a column format.
+
+    Returns:
+        str: The formatted value, '' for missing values.
+    """
+    if value is None or (isinstance(value, float) and np.isnan(value)):
+        return ""
+    if isinstance(value, (int, float, np.integer, np.floating)) and not isinstance(
+        value, bool
+    ):
+        if column not in COLUMN_FORMATS and isinstance(value, (int, np.integer)):
+            return f"{value:,}"
+        return column_format(column, decimals).format(value)
+    return str(value)
+
+
+def display_frame(df, formats=None, decimals=DISPLAY_DECIMALS):
+    """
+    Wraps a DataFrame for display with every numeric column formatted.
+
+    The frame itself is not changed: the Styler formats cells only when they are
+    rendered, so sorting and charts still see the full-precision values.
+
+    Parameters:
+        df (pd.DataFrame): The data to show.
+        formats (dict): Column -> format string, on top of COLUMN_FORMATS.
+        decimals (int): Decimals for floats without a column format.
+
+    Returns:
+        pandas.io.formats.style.Styler: Pass it to st.dataframe.
+    """
+    formats = {**COLUMN_FORMATS, **(formats or {})}
+    formatter = {}
+    for column in df.columns:
+        if column in formats and pd.api.types.is_numeric_dtype(df[column]):
+            formatter[column] = formats[column]
+        elif pd.api.types.is_float_dtype(df[column]):
+            formatter[column] = column_format(decimals=decimals)
+    return df.style.format(formatter, na_rep="")
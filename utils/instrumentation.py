@@ -0,0 +1,358 @@
+import cProfile
+import functools
+import json
+import logging
+import os
+import sqlite3
+import sys
+import threading
+import time
+import uuid
+from contextlib import closing, contextmanager
+from pathlib import Path
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+from utils.utils import bump_write_version
+
+METRICS_TABLE = "pipeline_metrics"
+# Columns of METRICS_TABLE, in order; any other field of a record goes to 'extra'
+METRICS_COLUMNS = {
+    "run_id": "TEXT",
+    "stage": "TEXT",
+    "started": "REAL",
+    "wall_s": "REAL",
+    "cpu_s": "REAL",
+    "rss_mb": "REAL",
+    "rss_delta_mb": "REAL",
+    "peak_rss_mb": "REAL",
+    "rows_in": "INTEGER",
+    "rows_out": "INTEGER",
+    "bytes_written": "INTEGER",
+}
+# Seconds between two RSS samples while a stage runs
+RSS_SAMPLE_SECONDS = 0.01
+
+# Where stage metrics go; configure_metrics() or the PIPELINE_* environment
+# variables change these
+_config = {
+    "jsonl_path": os.environ.get("PIPELINE_METRICS_PATH", "metrics.jsonl"),
+    "db_path": os.environ.get("PIPELINE_METRICS_DB"),
+    "profile_dir": os.environ.get("PIPELINE_PROFILE_DIR"),
+}
+_ENVIRONMENT = {
+    "jsonl_path": "PIPELINE_METRICS_PATH",
+    "db_path": "PIPELINE_METRICS_DB",
+    "profile_dir": "PIPELINE_PROFILE_DIR",
+}
+# Shared by worker processes, which inherit the environment of the parent
+RUN_ID = os.environ.setdefault("PIPELINE_RUN_ID", uuid.uuid4().hex[:12])
+
+
+def configure_metrics(jsonl_path=None, db_path=None, profile_dir=None):
+    """
+    Sets where stage metrics are written.
+
+    Parameters:
+        jsonl_path (str): JSON lines file to append one record per stage to.
+        db_path (str): SQLite database to also insert records into.
+        profile_dir (str): If set, every stage is run under cProfile and its stats are
+            dumped to <profile_dir>/<stage>.<pid>.prof.
+
+    The settings are also exported to the environment so that worker processes
+    started afterwards record to the same places.
+    """
+    for key, value in (
+        ("jsonl_path", jsonl_path),
+        ("db_path", db_path),
+        ("profile_dir", profile_dir),
+    ):
+        if value is not None:
+            _config[key] = value
+            os.environ[_ENVIRONMENT[key]] = value
+
+
+def _rss_mb():
+    """Current resident set size in MB, or None if it cannot be measured."""
+    if psutil is not None:
+        return psutil.Process().memory_info().rss / 2**20
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+class _PeakSampler:
+    """
+    Samples the RSS in a background thread to find the peak of one stage.
+
+    The process's own high-water mark (ru_maxrss) cannot be used: it never goes
+    down, so every stage after a heavy one would report that stage's peak.
+    """
+
+    def __init__(self, interval=RSS_SAMPLE_SECONDS):
+        self.interval = interval
+        self.peak = _rss_mb()
+        self._stop = threading.Event()
+        self._thread = None
+        if self.peak is not None:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    def _sample(self):
+        rss = _rss_mb()
+        if rss is not None and rss > self.peak:
+            self.peak = rss
+
+    def stop(self):
+        """Stops sampling and returns the peak RSS in MB, or None."""
+        if self._thread is None:
+            return None
+        self._stop.set()
+        self._thread.join()
+        self._sample()
+        return self.peak
+
+
+class StageRecord:
+    """Measurements of one pipeline stage; set rows_out and bytes_written inside."""
+
+    def __init__(self, name, rows_in=None):
+        self.name = name
+        self.rows_in = rows_in
+        self.rows_out = None
+        self.bytes_written = None
+        self.extra = {}
+
+    def as_dict(self):
+        return {
+            "run_id": RUN_ID,
+            "stage": self.name,
+            "started": self.started,
+            "wall_s": round(self.wall_s, 6),
+            "cpu_s": round(self.cpu_s, 6),
+            "rss_mb": self.rss_mb,
+            "rss_delta_mb": self.rss_delta_mb,
+            "peak_rss_mb": self.peak_rss_mb,
+            "rows_in": self.rows_in,
+            "rows_out": self.rows_out,
+            "bytes_written": self.bytes_written,
+            **self.extra,
+        }
+
+
+def _write_record(record):
+    if _config["jsonl_path"]:
+        with open(_config["jsonl_path"], "a") as metrics_file:
+            metrics_file.write(json.dumps(record) + "\n")
+    if _config["db_path"]:
+        with closing(sqlite3.connect(_config["db_path"], timeout=30)) as conn:
+            columns = ", ".join(
+                f"{column} {sql_type}" for column, sql_type in METRICS_COLUMNS.items()
+            )
+            conn.execute(
+                f"CREATE TABLE IF NOT EXISTS {METRICS_TABLE} ({columns}, extra TEXT)"
+            )
+            extra = {
+                key: value
+                for key, value in record.items()
+                if key not in METRICS_COLUMNS
+            }
+            conn.execute(
+                f"INSERT INTO {METRICS_TABLE} ({', '.join(METRICS_COLUMNS)}, extra) "
+                f"VALUES ({', '.join('?' * (len(METRICS_COLUMNS) + 1))})",
+                (
+                    *(record.get(column) for column in METRICS_COLUMNS),
+                    json.dumps(extra) if extra else None,
+                ),
+            )
+            conn.commit()
+            bump_write_version(conn, METRICS_TABLE)
+
+
+@contextmanager
+def stage(name, rows_in=None):
+    """
+    Measures a pipeline stage and records its metrics.
+
+    Records wall time, CPU time, memory, rows in/out and bytes written, and optionally
+    dumps a cProfile of the stage. peak_rss_mb is the highest RSS sampled while the
+    stage ran, every RSS_SAMPLE_SECONDS.
+
+    Parameters:
+        name (str): Stage name, e.g. 'raw.preprocess'.
+        rows_in (int): Number of input rows, if known.
+
+    Yields:
+        StageRecord: Set its rows_out, bytes_written or extra fields inside the block.
+    """
+    record = StageRecord(name, rows_in)
+    profiler = cProfile.Profile() if _config["profile_dir"] else None
+    rss_before = _rss_mb()
+    sampler = _PeakSampler()
+    record.started = time.time()
+    wall_start, cpu_start = time.perf_counter(), time.process_time()
+    if profiler is not None:
+        profiler.enable()
+    try:
+        yield record
+    finally:
+        if profiler is not None:
+            profiler.disable()
+            Path(_config["profile_dir"]).mkdir(parents=True, exist_ok=True)
+            profiler.dump_stats(
+                str(Path(_config["profile_dir"]) / f"{name}.{os.getpid()}.prof")
+            )
+        record.wall_s = time.perf_counter() - wall_start
+        record.cpu_s = time.process_time() - cpu_start
+        record.peak_rss_mb = sampler.stop()
+        record.rss_mb = _rss_mb()
+        record.rss_delta_mb = (
+            None
+            if record.rss_mb is None or rss_before is None
+            else record.rss_mb - rss_before
+        )
+        metrics = record.as_dict()
+        logging.info(
+            f"Stage {name}: {record.wall_s:.3f}s wall, {record.cpu_s:.3f}s cpu, "
+            f"rows {record.rows_in} -> {record.rows_out}"
+        )
+        try:
+            _write_record(metrics)
+        except (OSError, sqlite3.Error) as e:
+            logging.error(f"Could not record metrics of stage {name}: {e}")
+
+
+def summarize_metrics(path=None, run_id=RUN_ID):
+    """
+    Totals the recorded stages of a run from the JSON lines file.
+
+    Parameters:
+        path (str): Metrics file. Default is the configured one.
+        run_id (str): Run to summarize. Default is the current run.
+
+    Returns:
+        pd.DataFrame: One row per stage with its count, wall and CPU seconds, rows out
+            and peak RSS, slowest first. Empty if no stage was recorded.
+    """
+    import pandas as pd
+
+    path = path or _config["jsonl_path"]
+    if not path or not os.path.exists(path):
+        # Commands that run no stage never create the file
+        return pd.DataFrame()
+    with open(path) as metrics_file:
+        records = [json.loads(line) for line in metrics_file if run_id in line]
+    df = pd.DataFrame([record for record in records if record["run_id"] == run_id])
+    if df.empty:
+        return df
+    return (
+        df.groupby("stage")
+        .agg(
+            count=("stage", "size"),
+            wall_s=("wall_s", "sum"),
+            cpu_s=("cpu_s", "sum"),
+            rows_out=("rows_out", "sum"),
+            peak_rss_mb=("peak_rss_mb", "max"),
+        )
+        .sort_values("wall_s", ascending=False)
+    )
+
+
+def _row_count(value):
+    if isinstance(value, (str, bytes)):
+        # A path or a name, not rows
+        return None
+    try:
+        return len(value)
+    except TypeError:
+        return None
+
+
+def timed(name=None):
+    """
+    Decorator recording a function call as a stage.
+
+    Rows in are taken from the length of the first argument and rows out from the
+    length of the return value, when they have one.
+
+    Parameters:
+        name (str): Stage name. Default is the function's qualified name.
+    """
+
+    def decorator(func):
+        stage_name = name or f"{func.__module__}.{func.__qualname__}"
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            rows_in = _row_count(args[0]) if args else None
+            with stage(stage_name, rows_in) as record:
+                result = func(*args, **kwargs)
+                record.rows_out = _row_count(result)
+            return result
+
+        return wrapper
+
+    return decorator
+
+
+def table_bytes(conn, table_name):
+    """
+    Bytes a table occupies in the database file, counted from its pages.
+
+    Returns:
+        int or None: The size, or None if SQLite was built without the dbstat table.
+    """
+    try:
+        size = conn.execute(
+            "SELECT SUM(pgsize) FROM dbstat WHERE name = ?", (table_name,)
+        ).fetchone()[0]
+    except sqlite3.Error:
+        return None
+    return int(size or 0)
+
+
+def import_report(module, top=15):
+    """
+    Measures what importing a module costs on a cold interpreter.
+
+    Runs `python -X importtime -c "import <module>"` in a subprocess so that nothing
+    already imported by the caller hides the cost.
+
+    Parameters:
+        module (str): Dotted module name, e.g. 'src.raw_processed_db'.
+        top (int): Number of packages to return.
+
+    Returns:
+        list: (package, cumulative seconds) of the slowest packages. Nested imports
+            are counted in every package that pulled them in.
+    """
+    import subprocess
+
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+    )
+    if completed.returncode != 0:
+        raise ImportError(completed.stderr.strip().splitlines()[-1])
+    packages = {}
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        if not cumulative.strip().isdigit():
+            continue
+        # The first import of a package includes all of its submodules
+        package = name.strip().split(".")[0]
+        packages[package] = max(packages.get(package, 0), int(cumulative) / 1e6)
+    ranked = sorted(packages.items(), key=lambda item: item[1], reverse=True)
+    return ranked[:top]
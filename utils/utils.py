@@ -5,6 +5,528 @@ import os
 from pathlib import Path
 from typing import Union
 import logging
+import re
+import atexit
+import queue
+from collections import OrderedDict
+import threading
+import time
+from concurrent.futures import Future
+
+try:
+    import pyarrow  # noqa: F401
+
+    CSV_ENGINE = "pyarrow"
+except ImportError:
+    CSV_ENGINE = "c"
+
+# Table holding one write counter per table, bumped on every committed write
+WRITE_VERSION_TABLE = "_write_versions"
+
+# How long a connection waits for another writer's lock before failing
+BUSY_TIMEOUT_SECONDS = 30
+# Group commit limits of SQLiteWriter: jobs per transaction and how long the first
+# job of a batch may wait for others to join it
+WRITER_MAX_BATCH = 256
+WRITER_MAX_LATENCY_SECONDS = 0.05
+# Attempts to start a batch while another process holds the write lock
+WRITER_LOCK_RETRIES = 5
+
+# Bounds of the shared SQLiteDB query cache
+QUERY_CACHE_MAX_ENTRIES = 256
+QUERY_CACHE_MAX_BYTES = 256 * 2**20
+
+# Result types of SQLiteDB.select
+QUERY_OUTPUTS = ("frame", "records", "rows")
+# Rows fetched per round trip when streaming with output="rows"
+FETCH_SIZE = 10_000
+
+# Cold rows moved out of a database live in <db dir>/ARCHIVE_DIR/<db name>/<table>/
+ARCHIVE_DIR = "archive"
+_TABLE_REFERENCE = re.compile(r"\b(?:FROM|JOIN)\s+[\"`\[]?(\w+)", re.IGNORECASE)
+_SQL_TOKEN = re.compile(r"'(?:[^']|'')*'|\"(?:[^\"]|\"\")*\"|\s+|[^'\"\s]+")
+# With copy-on-write (pandas >= 3) a shallow copy cannot change the cached frame
+_COPY_ON_WRITE = int(pd.__version__.split(".")[0]) >= 3
+
+
+def bump_write_version(conn, table_name):
+    """
+    Increments the write version of a table and commits.
+
+    Readers compare versions to know whether cached results are still valid, so every
+    writer should call this after committing new rows.
+
+    Parameters:
+        conn (sqlite3.Connection): Open connection to the database.
+        table_name (str): The table that was written to.
+
+    Returns:
+        int: The new version of the table.
+    """
+    conn.execute(
+        f"CREATE TABLE IF NOT EXISTS {WRITE_VERSION_TABLE} "
+        "(table_name TEXT PRIMARY KEY, version INTEGER NOT NULL)"
+    )
+    conn.execute(
+        f"INSERT INTO {WRITE_VERSION_TABLE} VALUES (?, 1) "
+        "ON CONFLICT (table_name) DO UPDATE SET version = version + 1",
+        (table_name,),
+    )
+    conn.commit()
+    QUERY_CACHE.invalidate(_database_file(conn), table_name)
+    return conn.execute(
+        f"SELECT version FROM {WRITE_VERSION_TABLE} WHERE table_name = ?",
+        (table_name,),
+    ).fetchone()[0]
+
+
+def read_write_version(conn, tables=None):
+    """
+    Reads the combined write version of some tables.
+
+    Parameters:
+        conn (sqlite3.Connection): Open connection to the database.
+        tables (list): Tables to include. Default is every table.
+
+    Returns:
+        int: Sum of the table versions, 0 if nothing has been written yet.
+    """
+    query = f"SELECT COALESCE(SUM(version), 0) FROM {WRITE_VERSION_TABLE}"
+    params = ()
+    if tables:
+        query += f" WHERE table_name IN ({', '.join('?' * len(tables))})"
+        params = tuple(tables)
+    try:
+        return conn.execute(query, params).fetchone()[0]
+    except sqlite3.OperationalError:
+        return 0
+
+
+def _database_file(conn):
+    # Path of the main database, as the query cache keys it
+    return conn.execute("PRAGMA database_list").fetchone()[2]
+
+
+def normalize_sql(query):
+    """Collapses the whitespace outside string literals and drops a trailing ';'."""
+    tokens = [" " if token.isspace() else token for token in _SQL_TOKEN.findall(query)]
+    return "".join(tokens).strip().rstrip(";").strip()
+
+
+def referenced_tables(query):
+    """Names following FROM or JOIN in a query, in order of appearance."""
+    return list(dict.fromkeys(_TABLE_REFERENCE.findall(query)))
+
+
+class QueryCache:
+    """
+    LRU cache of query results, shared by every SQLiteDB of the process.
+
+    Entries are keyed by database, normalized SQL, parameters and the write versions
+    of the tables the query reads, so a write bumping a version (by any process)
+    makes the old results unreachable. Writes through this module also drop the
+    entries of the written table right away to free their memory. Queries reading a
+    table without a version row are never cached: nothing would tell when it changed.
+    """
+
+    def __init__(
+        self, max_entries=QUERY_CACHE_MAX_ENTRIES, max_bytes=QUERY_CACHE_MAX_BYTES
+    ):
+        """
+        Parameters:
+            max_entries (int): Most results kept.
+            max_bytes (int): Most memory used by the kept DataFrames.
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.bytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Returns the cached result of a key, or None, and counts the hit or miss."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, df, tables):
+        """Stores a result and evicts the least recently used ones over the bounds."""
+        size = int(df.memory_usage(index=True, deep=True).sum())
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self.bytes -= self._entries.pop(key)[2]
+            self._entries[key] = (df, set(tables), size)
+            self.bytes += size
+            while len(self._entries) > self.max_entries or self.bytes > self.max_bytes:
+                _, (_, _, evicted_size) = self._entries.popitem(last=False)
+                self.bytes -= evicted_size
+                self.evictions += 1
+
+    def invalidate(self, db_file, table_name=None):
+        """Drops the results of a database that read a table (every table by default)."""
+        with self._lock:
+            for key in list(self._entries):
+                if key[0] == db_file and (
+                    table_name is None or table_name in self._entries[key][1]
+                ):
+                    self.bytes -= self._entries.pop(key)[2]
+
+    def clear(self):
+        """Drops every result and resets the counters."""
+        with self._lock:
+            self._entries.clear()
+            self.bytes = self.hits = self.misses = self.evictions = 0
+
+    def stats(self):
+        """
+        Returns:
+            dict: hits, misses, hit_rate, evictions, entries and bytes.
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "bytes": self.bytes,
+            }
+
+
+QUERY_CACHE = QueryCache()
+
+
+def archive_dir(db_path, table_name=None):
+    """
+    Directory of the archived partitions of a database, or of one of its tables.
+
+    Parameters:
+        db_path (str): Path to the SQLite database.
+        table_name (str): Optional table.
+
+    Returns:
+        Path: The directory, which may not exist yet.
+    """
+    db_path = Path(db_path)
+    path = db_path.parent / ARCHIVE_DIR / db_path.stem
+    return path / table_name if table_name else path
+
+
+def load_archive(db_path, table_name):
+    """
+    Reads every archived partition of a table.
+
+    Parameters:
+        db_path (str): Path to the SQLite database.
+        table_name (str): The table.
+
+    Returns:
+        pd.DataFrame or None: The archived rows, None if the table has no archive.
+    """
+    files = sorted(archive_dir(db_path, table_name).glob("*.parquet"))
+    if not files:
+        return None
+    return pd.concat([pd.read_parquet(path) for path in files], ignore_index=True)
+
+
+def connect(db_path, timeout=BUSY_TIMEOUT_SECONDS, **kwargs):
+    """
+    Opens a connection in WAL mode, so readers never block the writer and the other
+    way round, with a busy timeout instead of failing at once on a locked database.
+
+    Parameters:
+        db_path (str): Path to the SQLite database.
+        timeout (float): Seconds to wait for a lock.
+        **kwargs: Passed on to sqlite3.connect.
+
+    Returns:
+        sqlite3.Connection: The open connection.
+    """
+    conn = sqlite3.connect(db_path, timeout=timeout, **kwargs)
+    try:
+        # WAL is stored in the file, so this is a no-op after the first connection
+        conn.execute("PRAGMA journal_mode=WAL")
+    except sqlite3.OperationalError as e:
+        logging.warning(f"Could not switch {db_path} to WAL: {e}")
+    return conn
+
+
+def _is_locked(error):
+    message = str(error).lower()
+    return "locked" in message or "busy" in message
+
+
+class _BatchConnection(sqlite3.Connection):
+    """
+    Connection of a SQLiteWriter. Inside a batch, commit() and rollback() from the
+    jobs are ignored so that one COMMIT covers the whole batch.
+    """
+
+    in_batch = False
+
+    def commit(self):
+        if not self.in_batch:
+            super().commit()
+
+    def rollback(self):
+        if not self.in_batch:
+            super().rollback()
+
+
+class SQLiteWriter:
+    """
+    Single writer of a database, shared by every producer in the process.
+
+    Producers submit jobs, functions taking a sqlite3.Connection, from any thread. A
+    dedicated thread runs them in order and commits them in groups: a batch holds up
+    to max_batch jobs, and its first job waits at most max_latency seconds for others
+    to join. Each job runs in a savepoint, so a failing job is rolled back alone and
+    the others still commit. Jobs may call conn.commit() as usual; it is deferred to
+    the end of the batch.
+
+    Readers are not involved: with WAL they read the last committed state while the
+    writer works. Other processes writing the same file are waited for through the
+    busy timeout, and a batch that still finds the database locked is retried.
+
+    If the writer itself fails (the database cannot be opened, or a batch cannot be
+    committed or rolled back), every queued job fails with that error and later
+    submits raise, instead of waiting forever.
+
+    Use get_writer() to get the writer of a database rather than creating one.
+    """
+
+    def __init__(
+        self,
+        db_path,
+        max_batch=WRITER_MAX_BATCH,
+        max_latency=WRITER_MAX_LATENCY_SECONDS,
+    ):
+        """
+        Parameters:
+            db_path (str): Path to the SQLite database.
+            max_batch (int): Most jobs committed together.
+            max_latency (float): Most seconds a job waits for a batch to fill.
+        """
+        self.db_path = db_path
+        self.max_batch = max_batch
+        self.max_latency = max_latency
+        self.pid = os.getpid()
+        self.commits = 0
+        self.jobs = 0
+        self.error = None
+        self._queue = queue.Queue()
+        # Orders submits against the writer failing, so no job is queued after the
+        # queue was drained
+        self._state_lock = threading.Lock()
+        self._thread = threading.Thread(
+            target=self._run, name=f"sqlite-writer:{db_path}", daemon=True
+        )
+        self._thread.start()
+
+    def submit(self, func, *args, **kwargs):
+        """
+        Queues a write.
+
+        Parameters:
+            func (callable): Called as func(conn, *args, **kwargs) in the writer thread.
+
+        Returns:
+            concurrent.futures.Future: Resolves to the return value of func once its
+                batch is committed, or to its exception.
+        """
+        future = Future()
+        with self._state_lock:
+            if self.error is not None:
+                raise RuntimeError(
+                    f"The writer of {self.db_path} failed: {self.error}"
+                ) from self.error
+            self._queue.put((future, func, args, kwargs))
+        return future
+
+    @property
+    def alive(self):
+        """Whether the writer still accepts jobs."""
+        return self.error is None and self._thread.is_alive()
+
+    def write(self, func, *args, **kwargs):
+        """Queues a write and waits until it is committed. Returns func's result."""
+        return self.submit(func, *args, **kwargs).result()
+
+    def execute(self, sql, params=()):
+        """Runs one statement through the queue and waits for its commit."""
+        return self.write(lambda conn: conn.execute(sql, params).rowcount)
+
+    def executemany(self, sql, rows):
+        """Runs one statement for every row through the queue and waits for its commit."""
+        return self.write(lambda conn: conn.executemany(sql, rows).rowcount)
+
+    def close(self):
+        """Commits the queued jobs and stops the writer thread."""
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _next_batch(self):
+        first = self._queue.get()
+        if first is None:
+            return None
+        batch = [first]
+        deadline = time.monotonic() + self.max_latency
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                job = (
+                    self._queue.get(timeout=max(remaining, 0))
+                    if remaining > 0
+                    else self._queue.get_nowait()
+                )
+            except queue.Empty:
+                break
+            if job is None:
+                # Put the stop marker back so the loop ends after this batch
+                self._queue.put(None)
+                break
+            batch.append(job)
+        return batch
+
+    def _begin(self, conn):
+        for attempt in range(WRITER_LOCK_RETRIES):
+            try:
+                conn.execute("BEGIN IMMEDIATE")
+                return
+            except sqlite3.OperationalError as e:
+                if not _is_locked(e) or attempt == WRITER_LOCK_RETRIES - 1:
+                    raise
+                logging.warning(f"{self.db_path} is locked, retrying the batch.")
+                time.sleep(0.1 * 2**attempt)
+
+    def _run_batch(self, conn, batch):
+        try:
+            self._begin(conn)
+        except sqlite3.Error as e:
+            for future, *_ in batch:
+                future.set_exception(e)
+            return
+        conn.in_batch = True
+        results = []
+        for future, func, args, kwargs in batch:
+            conn.execute("SAVEPOINT job")
+            try:
+                results.append((future, func(conn, *args, **kwargs), None))
+                conn.execute("RELEASE job")
+            except Exception as e:
+                conn.execute("ROLLBACK TO job")
+                conn.execute("RELEASE job")
+                results.append((future, None, e))
+        conn.in_batch = False
+        try:
+            conn.commit()
+        except sqlite3.Error as e:
+            conn.rollback()
+            results = [(future, None, e) for future, _, _ in results]
+        self.commits += 1
+        self.jobs += len(batch)
+        for future, result, error in results:
+            if error is None:
+                future.set_result(result)
+            else:
+                future.set_exception(error)
+
+    def _fail(self, error, batch=()):
+        logging.error(f"The writer of {self.db_path} stopped: {error}")
+        with self._state_lock:
+            self.error = error
+        jobs = list(batch)
+        while True:
+            try:
+                jobs.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        for job in jobs:
+            if job is not None and not job[0].done():
+                job[0].set_exception(error)
+
+    def _run(self):
+        try:
+            conn = connect(
+                self.db_path,
+                factory=_BatchConnection,
+                isolation_level=None,
+                check_same_thread=False,
+            )
+        except Exception as e:
+            self._fail(e)
+            return
+        try:
+            while True:
+                batch = self._next_batch()
+                if batch is None:
+                    break
+                try:
+                    self._run_batch(conn, batch)
+                except Exception as e:
+                    # The connection is in an unknown state, so stop taking jobs
+                    try:
+                        conn.in_batch = False
+                        conn.rollback()
+                    except sqlite3.Error:
+                        pass
+                    self._fail(e, batch)
+                    break
+        finally:
+            conn.close()
+
+
+_writers = {}
+_writers_lock = threading.Lock()
+
+
+def get_writer(db_path):
+    """
+    The SQLiteWriter of a database, started on first use and shared by every thread
+    of the process. A writer that failed is replaced by a new one, and a forked
+    worker gets a writer of its own; start process pools
+    before writing, since forking while the writer is inside SQLite is unsafe.
+
+    Parameters:
+        db_path (str): Path to the SQLite database.
+
+    Returns:
+        SQLiteWriter: The writer.
+    """
+    key = os.path.abspath(db_path)
+    with _writers_lock:
+        writer = _writers.get(key)
+        if writer is None or writer.pid != os.getpid() or not writer.alive:
+            writer = _writers[key] = SQLiteWriter(db_path)
+        return writer
+
+
+@atexit.register
+def close_writers():
+    """Commits what is still queued in every writer of this process."""
+    with _writers_lock:
+        writers = [w for w in _writers.values() if w.pid == os.getpid()]
+        _writers.clear()
+    for writer in writers:
+        writer.close()
 
 
 class SQLiteDB:
@@ -13,20 +535,25 @@ class SQLiteDB:
 
     Attributes:
         db_path (str): The file path where the SQLite database is or will be stored.
+        cache (bool): Whether query() serves repeated queries from QUERY_CACHE.
     """
 
-    def __init__(self, db_path):
+    def __init__(self, db_path, cache=False):
         """
         Initializes the SQLiteDB class and sets the database path.
 
         Parameters:
             db_path (str): The file path where the SQLite database is or will be stored.
+            cache (bool): Serve repeated queries from the shared LRU result cache.
+                Results are invalidated when a table they read is written through
+                bump_write_version. Use for read-mostly callers like dashboards.
         """
         self.db_path = db_path
+        self.cache = cache
 
     def __enter__(self):
         """Opens a connection to the SQLite database upon entering the context."""
-        self.conn = sqlite3.connect(self.db_path)
+        self.conn = connect(self.db_path)
         return self
 
     def __exit__(self, exc_type, exc_value, traceback):
@@ -46,24 +573,239 @@ class SQLiteDB:
         """
         try:
             dataframe.to_sql(table_name, self.conn, if_exists="replace")
+            self.bump_write_version(table_name)
         except pd.io.sql.DatabaseError as e:
             print(f"Database error: {e}")
 
-    def query(self, query):
+    def bump_write_version(self, table_name):
+        """
+        Marks a table as changed so cached reads of it are invalidated.
+
+        Parameters:
+            table_name (str): The table that was written to.
+
+        Returns:
+            int: The new version of the table.
+        """
+        return bump_write_version(self.conn, table_name)
+
+    def write_version(self, tables=None):
+        """
+        Returns the combined write version of some tables (every table by default).
+
+        Parameters:
+            tables (list): Tables to include.
+
+        Returns:
+            int: Sum of the table versions.
+        """
+        return read_write_version(self.conn, tables)
+
+    def _shadow_with_archive(self, query):
+        """
+        For every table in the query that has archived rows, creates a temporary table
+        of the same name holding the live and archived rows. SQLite resolves
+        unqualified names to temporary tables first, so the query sees both.
+
+        Returns:
+            list: Names of the temporary tables created.
+        """
+        shadowed = []
+        for table_name in dict.fromkeys(_TABLE_REFERENCE.findall(query)):
+            archived = load_archive(self.db_path, table_name)
+            if archived is None:
+                continue
+            self.conn.execute(
+                f"CREATE TEMP TABLE {table_name} AS SELECT * FROM main.{table_name}"
+            )
+            shadowed.append(table_name)
+            columns = ", ".join(f'"{col}"' for col in archived.columns)
+            placeholders = ", ".join("?" * len(archived.columns))
+            self.conn.executemany(
+                f"INSERT INTO temp.{table_name} ({columns}) VALUES ({placeholders})",
+                archived.astype(object)
+                .where(archived.notna(), None)
+                .itertuples(index=False, name=None),
+            )
+        return shadowed
+
+    @staticmethod
+    def cache_stats():
+        """Hit and miss counters of the shared query cache."""
+        return QUERY_CACHE.stats()
+
+    def _cache_key(self, query, params, archive):
+        tables = referenced_tables(query)
+        if not tables:
+            return None, tables
+        try:
+            versions = dict(
+                self.conn.execute(
+                    f"SELECT table_name, version FROM {WRITE_VERSION_TABLE} "
+                    f"WHERE table_name IN ({', '.join('?' * len(tables))})",
+                    tables,
+                ).fetchall()
+            )
+        except sqlite3.OperationalError:
+            versions = {}
+        if len(versions) < len(tables):
+            # A table no writer has versioned could change without notice
+            return None, tables
+        key = (
+            _database_file(self.conn),
+            normalize_sql(query),
+            tuple(params),
+            archive,
+            tuple(versions[table] for table in tables),
+        )
+        return key, tables
+
+    def query(self, query, params=(), archive=False):
         """
         Queries the SQLite database and returns the result as a DataFrame.
 
         Parameters:
-            query (str): The SQL query string to execute.
+            query (str): The SQL query string to execute, with '?' placeholders for
+                values.
+            params (tuple): Values bound to the placeholders.
+            archive (bool): Also read the rows moved to the archive by src.retention.
+                Slower, as the archived partitions are loaded first.
 
         Returns:
             pd.DataFrame or None: The data resulting from the query as a DataFrame, or None if an error occurs.
         """
+        key = None
+        if self.cache:
+            key, tables = self._cache_key(query, params, archive)
+            cached = QUERY_CACHE.get(key) if key else None
+            if cached is not None:
+                return cached.copy(deep=not _COPY_ON_WRITE)
+        shadowed = []
         try:
-            return pd.read_sql_query(query, self.conn)
-        except sqlite3.DatabaseError as e:
+            if archive:
+                shadowed = self._shadow_with_archive(query)
+            df = pd.read_sql_query(query, self.conn, params=tuple(params) or None)
+            if key:
+                QUERY_CACHE.put(key, df, tables)
+                return df.copy(deep=not _COPY_ON_WRITE)
+            return df
+        except (sqlite3.DatabaseError, pd.errors.DatabaseError) as e:
             print(f"An error occurred while querying the SQLite database: {e}")
             return None
+        finally:
+            for table_name in shadowed:
+                self.conn.execute(f"DROP TABLE temp.{table_name}")
+
+    def _table_columns(self, table_name):
+        return [
+            row[1]
+            for row in self.conn.execute(
+                "SELECT * FROM pragma_table_info(?)", (table_name,)
+            ).fetchall()
+        ]
+
+    def select(
+        self,
+        table_name,
+        columns=None,
+        start=None,
+        end=None,
+        where=None,
+        params=(),
+        order_by=None,
+        limit=None,
+        time_column="time",
+        output="frame",
+        fetch_size=FETCH_SIZE,
+        archive=False,
+    ):
+        """
+        Reads some columns and rows of a table with every value bound as a parameter.
+
+        Table and column names are checked against the table's schema, so they can
+        come from callers without being pasted into SQL.
+
+        Parameters:
+            table_name (str): The table.
+            columns (list): Columns to read. Default is every column.
+            start: Inclusive lower bound on time_column. Datetimes are formatted as
+                'YYYY-MM-DD HH:MM:SS', other values are bound as they are.
+            end: Exclusive upper bound on time_column.
+            where (str): Extra condition with '?' placeholders, e.g. 'horizon IN (?, ?)'.
+            params (tuple): Values for the placeholders of where.
+            order_by (str): Column to sort by.
+            limit (int): Most rows returned, applied by SQLite.
+            time_column (str): Column start and end apply to. Default is 'time'.
+            output (str): One of QUERY_OUTPUTS: 'frame' for a DataFrame, 'records'
+                for a NumPy record array, 'rows' for an iterator of tuples fetched
+                fetch_size at a time. Consume 'rows' before the connection closes.
+            fetch_size (int): Rows per fetch for output='rows'.
+            archive (bool): Also read archived rows. Only for output='frame'.
+
+        Returns:
+            pd.DataFrame, np.recarray, iterator or None: The rows, or None if the
+                table does not exist.
+        """
+        if output not in QUERY_OUTPUTS:
+            raise ValueError(f"Unknown output {output!r}, use one of {QUERY_OUTPUTS}")
+        known = self._table_columns(table_name)
+        if not known:
+            print(
+                f"An error occurred while querying the SQLite database: no such table: {table_name}"
+            )
+            return None
+        columns = list(columns) if columns else known
+        unknown = set(columns + [c for c in (order_by,) if c]) - set(known)
+        if (start is not None or end is not None) and time_column not in known:
+            unknown.add(time_column)
+        if unknown:
+            raise ValueError(f"Unknown columns of {table_name}: {sorted(unknown)}")
+
+        conditions, values = [], []
+        for bound, operator in ((start, ">="), (end, "<")):
+            if bound is not None:
+                conditions.append(f"{_quote(time_column)} {operator} ?")
+                values.append(
+                    bound.strftime("%Y-%m-%d %H:%M:%S")
+                    if hasattr(bound, "strftime")
+                    else bound
+                )
+        if where:
+            conditions.append(f"({where})")
+            values.extend(params)
+        query = f"SELECT {', '.join(map(_quote, columns))} FROM {_quote(table_name)}"
+        if conditions:
+            query += f" WHERE {' AND '.join(conditions)}"
+        if order_by:
+            query += f" ORDER BY {_quote(order_by)}"
+        if limit is not None:
+            query += " LIMIT ?"
+            values.append(int(limit))
+
+        if output == "frame":
+            return self.query(query, values, archive)
+        cursor = self.conn.execute(query, values)
+        if output == "rows":
+            return _fetch_rows(cursor, fetch_size)
+        rows = cursor.fetchall()
+        if not rows:
+            return np.rec.array(np.empty(0, dtype=[(col, object) for col in columns]))
+        return np.rec.fromrecords(rows, names=columns)
+
+
+def _quote(identifier):
+    return '"' + identifier.replace('"', '""') + '"'
+
+
+def _fetch_rows(cursor, fetch_size):
+    try:
+        while True:
+            rows = cursor.fetchmany(fetch_size)
+            if not rows:
+                return
+            yield from rows
+    finally:
+        cursor.close()
 
 
 def read_csv_to_dataframe(file_path):
@@ -89,6 +831,49 @@ def read_csv_to_dataframe(file_path):
         return None
 
 
+def read_csv_with_schema(file_path, schema, resolve_name=None):
+    """
+    Reads only the declared columns of a CSV file, parsed straight to their dtypes.
+
+    The header is read first and every raw name resolved once to its canonical name,
+    so the other columns are never parsed. Uses the pyarrow parser when installed.
+
+    Parameters:
+        file_path (str): The file path to the CSV file to read.
+        schema (dict): Canonical column name -> dtype, e.g. {'close': 'float32'}.
+        resolve_name (callable): Maps a raw header name to its canonical name.
+            Default keeps the raw names.
+
+    Returns:
+        pd.DataFrame or None: The schema's columns present in the file, with canonical
+            names, or None if the file could not be read.
+    """
+    try:
+        header = pd.read_csv(file_path, nrows=0).columns
+    except (OSError, pd.errors.EmptyDataError, pd.errors.ParserError) as e:
+        print(f"Could not read the header of {file_path}: {e}")
+        return None
+
+    columns = {}
+    for raw_name in header:
+        name = resolve_name(raw_name) if resolve_name else raw_name
+        # The first raw column resolving to a name wins
+        if name in schema and name not in columns.values():
+            columns[raw_name] = name
+
+    try:
+        df = pd.read_csv(
+            file_path,
+            usecols=list(columns),
+            dtype={raw_name: schema[name] for raw_name, name in columns.items()},
+            engine=CSV_ENGINE,
+        )
+    except (pd.errors.ParserError, ValueError) as e:
+        print(f"Parsing error: {e}")
+        return None
+    return df.rename(columns=columns)
+
+
 def save_to_csv(df, output_path):
     """
     Saves a Pandas DataFrame to a CSV file.
@@ -168,6 +953,6 @@ def round_decimals(df, decimal_places=2):
         pd.DataFrame: A new DataFrame with the specified columns rounded.
     """
     # Identify columns to round (only numeric types)
-    cols_to_round = df.select_dtypes(include=["float64"]).columns
+    cols_to_round = df.select_dtypes(include=["floating"]).columns
     df[cols_to_round] = df[cols_to_round].round(decimal_places)
     return df